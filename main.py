@@ -1,34 +1,147 @@
-import multiprocessing
-from multiprocessing import Queue
+import os
+import time
 
 from backend.serial_device import SerialDevice
-from backend.util.butter_filter import start_signal_filter
-from backend.util.plot import start_signal_plotter
-from backend.util.rsp_analysis import start_rsp_analysis
+from backend.util.channel import BLOCK, DROP_OLDEST
+from backend.util.multi_device import MultiDeviceReader
+from backend.util.pipeline import Pipeline
+from backend.util.replay import ReplaySource
+from backend.util.tracing import Tracer
 
+# 各阶段的入口以 '模块:函数' 给出，只在运行该阶段的进程中导入（scipy、neurokit2、Qt 等都很慢）
+SIGNAL_FILTER = 'backend.util.butter_filter:signal_filter'
+RING_SIGNAL_FILTER = 'backend.util.butter_filter:ring_signal_filter'
+SIGNAL_ANALYSIS = 'backend.util.rsp_analysis:incremental_signal_analysis'
+POOLED_SIGNAL_ANALYSIS = 'backend.util.rsp_pool:pooled_signal_analysis'
+HARMONY_ANALYSIS = 'backend.util.harmony:harmony_analysis'
+SIGNAL_PLOTTER = 'backend.util.plot:start_signal_plotter'
+HEADLESS_REPORTER = 'backend.util.headless:report_results'
+SESSION_RECORDER = 'backend.util.recorder:record_session'
+WEBSOCKET_SERVER = 'backend.util.websocket:start_websocket_server'
+# 滤波和分析阶段都依赖 scipy.signal：在主进程中导入一次，fork 出的子进程直接继承
+PRELOAD_MODULES = ('backend.util.butter_filter', 'backend.util.rsp_incremental')
 
-def main():
-    raw_data_queue = Queue()  # 原始数据队列
-    processed_data_queue = Queue()  # 处理后数据的队列
-    plot_raw_data_queue = Queue()  # 绘图数据的队列
-    rsp_data_queue = Queue()
-    # 实例化 SerialDevice 类并启动数据采集进程
-    serial_device = SerialDevice(data_queue=raw_data_queue)
-    multiprocessing.Process(target=serial_device.collect_data, daemon=True).start()
+# 使用共享内存环形缓冲区在进程间传递采样数据；设为 False 时退回到逐样本的 Queue
+USE_SHARED_MEMORY = True
+
+# 各通道的容量和溢出策略：分析链路反压保留全部样本，可视化链路在界面卡顿时丢弃旧数据
+CHANNEL_CONFIG = {
+    'raw': {'maxsize': 10000, 'policy': BLOCK},
+    'processed': {'maxsize': 10000, 'policy': BLOCK},
+    'plot': {'maxsize': 500, 'policy': DROP_OLDEST},
+    'rsp': {'maxsize': 64, 'policy': DROP_OLDEST},
+    'harmony_rsp': {'maxsize': 64, 'policy': DROP_OLDEST},
+    'harmony_input': {'maxsize': 10000, 'policy': BLOCK},
+    'harmony': {'maxsize': 64, 'policy': DROP_OLDEST},
+}
+
+# 会话记录目录；设置后把原始和滤波后的数据写入 <目录>/<开始时间>/ 下（需要共享内存传输）
+RECORD_DIRECTORY = None
+
+# 多设备采集：设置为串口列表后由一个线程同时读取所有设备，呼吸数据进入原始数据通道（环或队列）
+SERIAL_PORTS = None
+
+# 回放文件；设置后用录制的数据代替串口设备驱动整条流水线，REPLAY_SPEED 为回放倍速（None 表示尽快回放）
+REPLAY_PATH = None
+REPLAY_SPEED = 1.0
+# 没有时间戳的回放文件（文本、串口字节）按此采样率计时，须与实时数据和 FILTER_CONFIG['fs'] 一致
+REPLAY_SAMPLING_RATE = 50
+
+# WebSocket 广播端口；设置后把滤波后的数据推送给所有连接的客户端（需要共享内存传输）
+WEBSOCKET_PORT = None
+
+# 窗口分析：设置为进程数后用进程池对重叠窗口运行 rsp_process，代替增量分析；0 表示使用全部 CPU，None 表示关闭
+# 窗口长度和步长以样本数给出，步长越小结果更新越快；跟不上时跳过最旧的窗口
+ANALYSIS_WORKERS = None
+ANALYSIS_WINDOW = 1500
+ANALYSIS_STEP = 300
+
+# 延迟追踪：每 TRACE_EVERY 个样本追踪一个，每 TRACE_REPORT_INTERVAL 秒打印一次各阶段延迟；None 表示关闭
+TRACE_EVERY = None
+TRACE_REPORT_INTERVAL = 10.0
+TRACED_STAGES = ('serial', 'filter', 'analysis', 'plot')
+TRACE_UPSTREAM = {'plot': 'filter'}  # 绘图和分析并行读取滤波结果
 
-    # 启动信号滤波进程
-    # start_signal_filter(raw_data_queue, processed_data_queue, plot_raw_data_queue)
 
-    # 关闭信号滤波进程
-    start_signal_filter(raw_data_queue, processed_data_queue, plot_raw_data_queue)
+def build_pipeline(shared_memory=USE_SHARED_MEMORY, record_directory=RECORD_DIRECTORY, replay_path=REPLAY_PATH,
+                   replay_speed=REPLAY_SPEED, replay_sampling_rate=REPLAY_SAMPLING_RATE, trace_every=TRACE_EVERY,
+                   websocket_port=WEBSOCKET_PORT, serial_ports=SERIAL_PORTS, analysis_workers=ANALYSIS_WORKERS,
+                   analysis_window=ANALYSIS_WINDOW, analysis_step=ANALYSIS_STEP, gui=True, started=None, report_startup=False):
+    # gui=False 时用 backend.util.headless 的状态输出代替 Qt 界面，started 为服务启动时刻
+    pipeline = Pipeline(preload=PRELOAD_MODULES, report_startup=report_startup)
+    if replay_path:
+        serial_device = ReplaySource(replay_path, speed=replay_speed, sampling_rate=replay_sampling_rate)
+    elif serial_ports:
+        serial_device = MultiDeviceReader(serial_ports)
+    else:
+        serial_device = SerialDevice()
+    pipeline.tracer = Tracer(TRACED_STAGES, every=trace_every, upstream=TRACE_UPSTREAM) if trace_every else None
 
-    # 启动呼吸率计算进程
-    start_rsp_analysis(processed_data_queue, rsp_data_queue)
+    def traced(name):
+        # 开启追踪时给阶段传入它自己的 StageTracer
+        return {'tracer': pipeline.tracer.stage(name)} if pipeline.tracer else {}
 
+    def add_analysis(inputs):
+        if analysis_workers is None:
+            pipeline.add_stage('analysis', SIGNAL_ANALYSIS, inputs=inputs, outputs=['rsp', 'harmony_rsp'],
+                               **traced('analysis'))
+        else:
+            # 进程池阶段需要创建子进程，不能是守护进程
+            pipeline.add_stage('analysis', POOLED_SIGNAL_ANALYSIS, inputs=inputs, outputs=['rsp', 'harmony_rsp'],
+                               daemon=False, workers=analysis_workers or None, window=analysis_window,
+                               step=analysis_step, **traced('analysis'))
 
-    # 启动信号绘图
-    start_signal_plotter(plot_raw_data_queue,rsp_data_queue)
+    def add_display(inputs):
+        if gui:
+            pipeline.add_stage('plot', SIGNAL_PLOTTER, inputs=inputs, main=True, **traced('plot'))
+        else:
+            pipeline.add_stage('plot', HEADLESS_REPORTER, inputs=inputs, main=True, started=started,
+                               **traced('plot'))
+
+    if shared_memory:
+        pipeline.ring('raw')  # 原始数据
+        pipeline.ring('filtered')  # 滤波后数据，绘图和分析各自持有读游标
+        pipeline.queue('rsp', **CHANNEL_CONFIG['rsp'])  # 呼吸分析结果
+        pipeline.queue('harmony_rsp', **CHANNEL_CONFIG['harmony_rsp'])  # 呼吸分析结果的副本，供和谐度分析
+        pipeline.queue('harmony', **CHANNEL_CONFIG['harmony'])  # 呼吸周期与和谐度结果
+
+        pipeline.add_stage('serial', serial_device.collect_data, outputs=['raw'], stop_event=pipeline.stop_event,
+                           **traced('serial'))
+        pipeline.add_stage('filter', RING_SIGNAL_FILTER, inputs=['raw'], outputs=['filtered'], **traced('filter'))
+        add_analysis(['filtered'])
+        pipeline.add_stage('harmony', HARMONY_ANALYSIS, inputs=['filtered', 'harmony_rsp'], outputs=['harmony'])
+        add_display(['filtered', 'rsp', 'harmony'])
+        if record_directory:
+            pipeline.add_stage('recorder', SESSION_RECORDER, inputs=['raw', 'filtered'],
+                               directory=os.path.join(record_directory, time.strftime('%Y%m%d-%H%M%S')))
+        if websocket_port:
+            pipeline.add_stage('websocket', WEBSOCKET_SERVER, inputs=['filtered'], port=websocket_port)
+        return pipeline
+
+    pipeline.queue('raw', **CHANNEL_CONFIG['raw'])  # 原始数据队列
+    pipeline.queue('processed', **CHANNEL_CONFIG['processed'])  # 处理后数据的队列
+    pipeline.queue('plot', **CHANNEL_CONFIG['plot'])  # 绘图数据的队列
+    pipeline.queue('rsp', **CHANNEL_CONFIG['rsp'])
+    pipeline.queue('harmony_rsp', **CHANNEL_CONFIG['harmony_rsp'])
+    pipeline.queue('harmony_input', **CHANNEL_CONFIG['harmony_input'])  # 滤波结果的第三份副本，供和谐度分析
+    pipeline.queue('harmony', **CHANNEL_CONFIG['harmony'])
+
+    pipeline.add_stage('serial', serial_device.collect_data, outputs=['raw'], stop_event=pipeline.stop_event,
+                       **traced('serial'))
+    pipeline.add_stage('filter', SIGNAL_FILTER, inputs=['raw'], outputs=['processed', 'plot', 'harmony_input'],
+                       **traced('filter'))
+    add_analysis(['processed'])
+    pipeline.add_stage('harmony', HARMONY_ANALYSIS, inputs=['harmony_input', 'harmony_rsp'], outputs=['harmony'])
+    add_display(['plot', 'rsp', 'harmony'])
+    return pipeline
+
+
+def main():
+    pipeline = build_pipeline()
+    if pipeline.tracer is not None:
+        pipeline.tracer.start_reporter(TRACE_REPORT_INTERVAL)
+    pipeline.run()
 
 
 if __name__ == '__main__':
-    main()
\ No newline at end of file
+    main()
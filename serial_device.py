@@ -1,12 +1,20 @@
 import multiprocessing
+import queue
+
+import numpy as np
 import serial
 import serial.tools.list_ports
 import time
 from multiprocessing import Queue
 
+from backend.util.frame_parser import FrameParser
+from backend.util.pipeline import is_stop
+from backend.util.sample_batch import SampleBatch
+from backend.util.shm_ring import SharedRingBuffer
+
 
 class SerialDevice:
-    def __init__(self, port='COM3', baudrate=115200, timeout=1, data_queue=None):
+    def __init__(self, port='COM3', baudrate=115200, timeout=1, data_queue=None, ring=None):
         self.port = port
         self.baudrate = baudrate
         self.timeout = timeout
@@ -27,7 +35,9 @@ class SerialDevice:
             0xB1: "心音（HKY-06C）"
         }
         self.ser = None
+        self.parser = FrameParser()
         self.data_queue = data_queue if data_queue else Queue()
+        self.ring = ring  # 可选的共享内存环形缓冲区，设置后代替 data_queue
 
     @staticmethod
     def list_available_ports():
@@ -94,42 +104,59 @@ class SerialDevice:
             'value': value
         }
 
-    def collect_data(self):
+    def collect_data(self, output=None, stop_event=None, tracer=None):
+        # output: 由流水线指定的输出通道（共享内存环或 Queue），stop_event: 停止采集的事件
+        # tracer: 可选的 StageTracer，记录从读到字节到写入输出通道的延迟
+        if isinstance(output, SharedRingBuffer):
+            self.ring = output
+        elif output is not None:
+            self.data_queue = output
+
         self.open_serial_port()  # 确保串口已经打开
         self.send_stop_measurement()
         self.adjust_breath_amplitude(5)
         self.send_start_measurement()
 
         start_time = time.time()
-        buffer = []
+        self.parser.reset()
 
         try:
-            while True:
-                while self.ser.in_waiting:
-                    byte = self.ser.read(1)
-                    if byte:
-                        buffer.append(ord(byte))
-                        if len(buffer) >= 7 and buffer[0] == 0xFF:
-                            data_length = buffer[2]
-                            if len(buffer) >= data_length + 2:
-                                packet = buffer[:data_length + 2]
-                                buffer = buffer[data_length + 2:]
-                                parsed_data = self.parse_serial_data(packet)
-                                if parsed_data:
-                                    # print(f"{parsed_data}")
-                                    time_interval = time.time() - start_time
-                                    self.data_queue.put({
-                                        'timestamp': time_interval,
-                                        'data': parsed_data['value']
-                                    })
-                time.sleep(0.01)
+            while stop_event is None or not stop_event.is_set():
+                # 一次读出缓冲区中的全部字节；缓冲区为空时阻塞等待至多 timeout 秒
+                chunk = self.ser.read(self.ser.in_waiting or 1)
+                if not chunk:
+                    continue
+                received = time.monotonic()
+                _, _, values = self.parser.feed_arrays(chunk)
+                if len(values):
+                    time_interval = time.time() - start_time
+                    timestamps = np.full(len(values), time_interval)
+                    if self.ring is not None:
+                        self.ring.write(timestamps, values)
+                    else:
+                        # 本次读到的全部样本作为一个 SampleBatch 放入队列
+                        self.data_queue.put(SampleBatch.from_arrays(timestamps, values))
+                    if tracer is not None:
+                        tracer.mark(len(values), received)
 
         except Exception as e:
             print(f"Error reading serial data: {e}")
         finally:
             self.send_stop_measurement()
+            if self.ring is not None:
+                self.ring.mark_closed()
+
+    def get_parser_stats(self):
+        return self.parser.stats()
 
-    def get_data_from_queue(self):
+    def get_data_from_queue(self, timeout=None):
+        # 指定 timeout 时阻塞等待数据，避免调用方轮询
+        if timeout is not None:
+            try:
+                data = self.data_queue.get(timeout=timeout)
+            except queue.Empty:
+                return None
+            return None if is_stop(data) else data
         if not self.data_queue.empty():
             return self.data_queue.get()
         return None
\ No newline at end of file
@@ -0,0 +1,46 @@
+import time
+
+STARTED = time.monotonic()  # 在其余导入之前记录，用于统计导入和启动耗时
+
+import argparse
+
+from backend.main import (ANALYSIS_STEP, ANALYSIS_WINDOW, ANALYSIS_WORKERS, REPLAY_SAMPLING_RATE, REPLAY_SPEED,
+                          TRACE_REPORT_INTERVAL, USE_SHARED_MEMORY, build_pipeline)
+
+IMPORTED = time.monotonic()
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Run the acquisition and analysis pipeline without the GUI.")
+    parser.add_argument('--replay', help="replay a recording instead of reading the serial device")
+    parser.add_argument('--speed', type=float, default=REPLAY_SPEED, help="replay speed factor, 0 for unthrottled")
+    parser.add_argument('--replay-rate', type=float, default=REPLAY_SAMPLING_RATE,
+                        help="sampling rate of replayed files without timestamps (text, raw HK bytes)")
+    parser.add_argument('--ports', nargs='+', help="read several serial ports with one reader")
+    parser.add_argument('--queues', action='store_true', help="use queues instead of shared memory rings")
+    parser.add_argument('--record', help="record the raw and filtered streams under this directory")
+    parser.add_argument('--websocket-port', type=int, help="broadcast the filtered stream on this port")
+    parser.add_argument('--workers', type=int, default=ANALYSIS_WORKERS,
+                        help="run windowed rsp_process analysis on this many processes (0: all CPUs)")
+    parser.add_argument('--window', type=int, default=ANALYSIS_WINDOW, help="analysis window in samples")
+    parser.add_argument('--step', type=int, default=ANALYSIS_STEP, help="analysis step in samples")
+    parser.add_argument('--trace-every', type=int, help="trace the latency of every Nth sample")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    print(f"Imports took {(IMPORTED - STARTED) * 1000:.0f} ms")
+    pipeline = build_pipeline(shared_memory=USE_SHARED_MEMORY and not args.queues, record_directory=args.record,
+                              replay_path=args.replay, replay_speed=args.speed or None,
+                              replay_sampling_rate=args.replay_rate, trace_every=args.trace_every,
+                              websocket_port=args.websocket_port, serial_ports=args.ports,
+                              analysis_workers=args.workers, analysis_window=args.window, analysis_step=args.step,
+                              gui=False, started=STARTED, report_startup=True)
+    if pipeline.tracer is not None:
+        pipeline.tracer.start_reporter(TRACE_REPORT_INTERVAL)
+    pipeline.run()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,350 @@
+import asyncio
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+from backend.util.sample_batch import SampleBatch
+from backend.util.shm_ring import SharedRingBuffer
+
+HEART_RATE_UUID = "00002a37-0000-1000-8000-00805f9b34fb"
+RESPIRATION_UUID = "FF01"
+
+# 样本类型
+HEART_RATE = 0  # 心率，bpm
+RR_INTERVAL = 1  # RR 间期，秒
+IMU_X = 2  # 呼吸带 IMU X 轴原始值
+KIND_NAMES = {HEART_RATE: 'heart_rate', RR_INTERVAL: 'rr_interval', IMU_X: 'imu_x'}
+
+SAMPLE_DTYPE = np.dtype([('timestamp', '<f8'), ('device', 'u1'), ('kind', 'u1'), ('value', '<f8')])
+
+RECONNECT_DELAY = 0.5  # 首次重连等待（秒），之后每次翻倍
+MAX_RECONNECT_DELAY = 30.0
+
+
+def decode_heart_rate(data):
+    """Decode a Heart Rate Measurement notification (GATT 0x2A37) into
+    ``[(kind, value), ...]``: the heart rate and any RR intervals."""
+    flags = data[0]
+    if flags & 0x01:
+        samples = [(HEART_RATE, int.from_bytes(data[1:3], 'little'))]
+        offset = 3
+    else:
+        samples = [(HEART_RATE, data[1])]
+        offset = 2
+    if flags & 0x08:
+        offset += 2  # 跳过能量消耗字段
+    if flags & 0x10:
+        # RR 间期单位为 1/1024 秒
+        count = (len(data) - offset) // 2
+        rr = np.frombuffer(bytes(data[offset:offset + 2 * count]), dtype='<u2') / 1024.0
+        samples.extend((RR_INTERVAL, value) for value in rr.tolist())
+    return samples
+
+
+def decode_imu(data):
+    """Decode a respiration band notification: one or more records of a
+    length byte followed by that many bytes of little-endian unsigned X-axis
+    data. A truncated trailing record is ignored."""
+    samples = []
+    offset = 0
+    while offset < len(data):
+        length = data[offset]
+        if not length or offset + 1 + length > len(data):
+            break
+        samples.append((IMU_X, int.from_bytes(data[offset + 1:offset + 1 + length], 'little', signed=False)))
+        offset += 1 + length
+    return samples
+
+
+def encode_heart_rate(bpm, rr_intervals=()):
+    # decode_heart_rate 的逆过程，供 FakeBleDevice 生成通知
+    flags = 0x10 if rr_intervals else 0x00
+    rr = [int(round(interval * 1024)) for interval in rr_intervals]
+    return bytes([flags, bpm]) + b''.join(value.to_bytes(2, 'little') for value in rr)
+
+
+def encode_imu(value, length=2):
+    return bytes([length]) + int(value).to_bytes(length, 'little')
+
+
+class BleDevice:
+    """Configuration of one BLE sensor: address, notify characteristic and
+    the decoder turning a notification into ``[(kind, value), ...]``."""
+
+    def __init__(self, name, address, uuid, decoder):
+        self.name = name
+        self.address = address
+        self.uuid = uuid
+        self.decoder = decoder
+
+
+def default_devices():
+    return [
+        BleDevice('heart_rate', "D0:A4:69:B6:8F:A2", HEART_RATE_UUID, decode_heart_rate),
+        BleDevice('respiration', "f0:f5:bd:b5:6a:f6", RESPIRATION_UUID, decode_imu),
+    ]
+
+
+class BleSampleBuffer:
+    """Bounded hand-over of decoded samples from the BLE thread.
+
+    The BLE thread appends one small ``SAMPLE_DTYPE`` array per notification
+    to a deque (``append``/``popleft`` are atomic, so no lock is taken);
+    consumers call ``drain`` once per cycle and get everything that arrived
+    as a single array. When more than ``capacity`` notifications are waiting
+    the oldest are discarded and counted in ``dropped``.
+    """
+
+    def __init__(self, capacity=4096):
+        self.batches = deque(maxlen=capacity)
+        self.appended = 0
+        self.drained = 0
+
+    def append(self, samples):
+        self.batches.append(samples)
+        self.appended += 1
+
+    def drain(self):
+        batches = []
+        while True:
+            try:
+                batches.append(self.batches.popleft())
+            except IndexError:
+                break
+        self.drained += len(batches)
+        if not batches:
+            return np.empty(0, dtype=SAMPLE_DTYPE)
+        return np.concatenate(batches)
+
+    @property
+    def dropped(self):
+        return self.appended - self.drained - len(self.batches)
+
+
+class BleManager:
+    """Connects to several BLE sensors from one background asyncio thread.
+
+    Every connected device's notifications are decoded into ``SAMPLE_DTYPE``
+    rows (``device`` is the index in ``devices``) and appended to ``buffer``.
+    A device that fails to connect or drops its connection is retried with
+    exponential backoff (``RECONNECT_DELAY`` doubling up to
+    ``MAX_RECONNECT_DELAY``) until ``disconnect`` or ``stop`` is called.
+    ``client_factory`` builds the client for an address and defaults to
+    ``bleak.BleakClient``; pass ``FakeBleDevice.client`` to run without a
+    radio.
+    """
+
+    def __init__(self, devices=None, buffer=None, client_factory=None):
+        self.devices = list(devices) if devices is not None else default_devices()
+        self.buffer = buffer if buffer is not None else BleSampleBuffer()
+        self.client_factory = client_factory
+        self.status = {device.name: 'disconnected' for device in self.devices}
+        self.reconnects = {device.name: 0 for device in self.devices}
+        self.loop = None
+        self.thread = None
+        self._tasks = {}
+
+    def start(self):
+        if self.client_factory is None:
+            from bleak import BleakClient  # 只有连接真实设备时才需要 bleak
+            self.client_factory = BleakClient
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='ble', daemon=True)
+        self.thread.start()
+
+    def stop(self):
+        if self.loop is None:
+            return
+        try:
+            asyncio.run_coroutine_threadsafe(self._shutdown(), self.loop).result(timeout=2)
+        except Exception as e:
+            print(f"Error stopping BLE devices: {e}")
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join(timeout=2)
+        self.loop = None
+
+    def connect(self, name):
+        # 可以在任何线程（包括 GUI 线程）调用
+        if self.loop is None:
+            self.start()
+        index = [device.name for device in self.devices].index(name)
+        self.loop.call_soon_threadsafe(self._start_task, index)
+
+    def disconnect(self, name):
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self._cancel_task, name)
+
+    def _start_task(self, index):
+        name = self.devices[index].name
+        if name not in self._tasks:
+            self._tasks[name] = self.loop.create_task(self._run_device(index))
+
+    def _cancel_task(self, name):
+        task = self._tasks.pop(name, None)
+        if task is not None:
+            task.cancel()
+
+    async def _shutdown(self):
+        # 取消所有设备任务并等待它们退出 async with，断开连接
+        tasks = list(self._tasks.values())
+        self._tasks.clear()
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _handler(self, index, decoder):
+        def handle(sender, data):
+            received = time.monotonic()
+            try:
+                decoded = decoder(data)
+            except Exception as e:
+                print(f"Error decoding BLE notification from {self.devices[index].name}: {e}")
+                return
+            if not decoded:
+                return
+            samples = np.empty(len(decoded), dtype=SAMPLE_DTYPE)
+            samples['timestamp'] = received
+            samples['device'] = index
+            samples['kind'], samples['value'] = zip(*decoded)
+            self.buffer.append(samples)
+        return handle
+
+    async def _run_device(self, index):
+        device = self.devices[index]
+        delay = RECONNECT_DELAY
+        try:
+            while True:
+                disconnected = asyncio.Event()
+                loop = asyncio.get_running_loop()
+                try:
+                    self.status[device.name] = 'connecting'
+                    client = self.client_factory(
+                        device.address, disconnected_callback=lambda _: loop.call_soon_threadsafe(disconnected.set))
+                    async with client:
+                        await client.start_notify(device.uuid, self._handler(index, device.decoder))
+                        self.status[device.name] = 'connected'
+                        delay = RECONNECT_DELAY  # 连接成功后重置退避时间
+                        try:
+                            await disconnected.wait()
+                        finally:
+                            if client.is_connected:
+                                await client.stop_notify(device.uuid)
+                except asyncio.CancelledError:
+                    raise
+                except Exception as e:
+                    print(f"Error connecting to {device.name}: {e}")
+                self.status[device.name] = 'reconnecting'
+                self.reconnects[device.name] += 1
+                await asyncio.sleep(delay)
+                delay = min(delay * 2, MAX_RECONNECT_DELAY)
+        finally:
+            self.status[device.name] = 'disconnected'
+
+    def collect_data(self, output=None, stop_event=None, names=None, interval=0.02, routes=None):
+        """Pipeline stage: connect ``names`` (default: all devices) and
+        forward the drained samples every ``interval`` seconds, like
+        ``SerialDevice.collect_data``. ``output`` (a ``SharedRingBuffer`` or
+        a queue) receives the respiration band samples (``IMU_X``);
+        ``routes`` maps further sample kinds to their own ring or queue.
+        Queues get one single-channel ``SampleBatch`` per interval, named
+        after the kind (``KIND_NAMES``)."""
+        routes = dict(routes or {})
+        if output is not None:
+            routes.setdefault(IMU_X, output)
+        for name in names or [device.name for device in self.devices]:
+            self.connect(name)
+        try:
+            while stop_event is None or not stop_event.is_set():
+                time.sleep(interval)
+                samples = self.buffer.drain()
+                if not len(samples):
+                    continue
+                for kind, channel in routes.items():
+                    selected = samples[samples['kind'] == kind]
+                    if not len(selected):
+                        continue
+                    if isinstance(channel, SharedRingBuffer):
+                        channel.write(selected['timestamp'], selected['value'])
+                    else:
+                        channel.put(SampleBatch.from_arrays(selected['timestamp'], selected['value'],
+                                                            (KIND_NAMES[kind],)))
+        finally:
+            self.stop()
+            for channel in routes.values():
+                if isinstance(channel, SharedRingBuffer):
+                    channel.mark_closed()
+
+
+class FakeBleDevice:
+    """Scripted stand-in for a BLE peripheral.
+
+    ``client`` has the same signature as ``BleakClient`` and is meant to be
+    used as ``BleManager(client_factory=fake.client)``. Once notifications
+    are started, the client calls the handler with ``payloads(i)`` for
+    i = 0, 1, ... every ``interval`` seconds. ``connect_failures`` connection
+    attempts fail before one succeeds, and after ``disconnect_after``
+    notifications the connection drops, which exercises the reconnect path.
+    """
+
+    def __init__(self, payloads, interval=0.01, connect_failures=0, disconnect_after=None):
+        self.payloads = payloads
+        self.interval = interval
+        self.connect_failures = connect_failures
+        self.disconnect_after = disconnect_after
+        self.connections = 0
+        self.sent = 0
+
+    def client(self, address, disconnected_callback=None):
+        return FakeBleClient(self, address, disconnected_callback)
+
+
+class FakeBleClient:
+    def __init__(self, device, address, disconnected_callback=None):
+        self.device = device
+        self.address = address
+        self.disconnected_callback = disconnected_callback
+        self.is_connected = False
+        self._task = None
+
+    async def __aenter__(self):
+        await self.connect()
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.disconnect()
+
+    async def connect(self):
+        if self.device.connect_failures > 0:
+            self.device.connect_failures -= 1
+            raise OSError(f"Device {self.address} not found")
+        self.device.connections += 1
+        self.is_connected = True
+
+    async def disconnect(self):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.is_connected = False
+
+    async def start_notify(self, uuid, handler):
+        self._task = asyncio.ensure_future(self._notify(uuid, handler))
+
+    async def stop_notify(self, uuid):
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _notify(self, uuid, handler):
+        count = 0
+        while self.is_connected:
+            await asyncio.sleep(self.device.interval)
+            handler(uuid, bytearray(self.device.payloads(self.device.sent)))
+            self.device.sent += 1
+            count += 1
+            if self.device.disconnect_after is not None and count >= self.device.disconnect_after:
+                # 模拟连接断开
+                self.is_connected = False
+                if self.disconnected_callback is not None:
+                    self.disconnected_callback(self)
@@ -1,60 +1,18 @@
-# import multiprocessing
-# from scipy.signal import butter, lfilter, lfilter_zi
-#
-#
-# def butter_lowpass(cutoff, fs, order=5):
-#     nyq = 0.5 * fs
-#     normal_cutoff = cutoff / nyq
-#     b, a = butter(order, normal_cutoff, btype='low', analog=False)
-#     return b, a
-#
-#
-# def iir_filter(data, b, a, zi):
-#     # 应用IIR滤波器，并返回当前滤波结果和更新后的滤波器状态
-#     y, zi = lfilter(b, a, [data], zi=zi)
-#     return y[0], zi
-#
-#
-# def signal_filter(raw_data_queue, processed_data_queue, plot_data_queue):
-#     # 定义滤波器参数
-#     cutoff = 0.5
-#     fs = 50.0
-#     b, a = butter_lowpass(cutoff, fs)
-#
-#     # 初始化滤波器状态
-#     zi = lfilter_zi(b, a) * 0
-#
-#     while True:
-#         if not raw_data_queue.empty():
-#             data_point = raw_data_queue.get()
-#             value = data_point['data']  # 获取原始数据值
-#
-#             # 对单个数据点进行IIR滤波
-#             filtered_value, zi = iir_filter(value, b, a, zi)
-#
-#             # 将滤波后的数据与时间戳一起保存
-#             processed_data = {
-#                 'timestamp': data_point['timestamp'],  # 使用原始数据的时间戳
-#                 'filtered_data': filtered_value
-#             }
-#
-#             # 将处理后的数据放入两个队列中
-#             processed_data_queue.put(processed_data)
-#             plot_data_queue.put(processed_data)
-#
-#
-#
-# def start_signal_filter(raw_data_queue, processed_data_queue, plot_data_queue):
-#     multiprocessing.Process(
-#         target=signal_filter,
-#         args=(raw_data_queue, processed_data_queue, plot_data_queue),
-#         daemon=True
-#     ).start()
-
-
-# close signal filter progress
-import multiprocessing
-from scipy.signal import butter, lfilter, lfilter_zi
+import time
+
+import numpy as np
+from scipy.signal import butter, iirnotch, lfilter, sosfilt, sosfilt_zi, tf2sos
+
+from backend.util.pipeline import get_batch
+from backend.util.sample_batch import to_batch
+
+# 实时滤波链配置：高通去除基线漂移，低通保留呼吸频段，notch 默认关闭
+FILTER_CONFIG = {
+    'fs': 50.0,
+    'highpass': {'cutoff': 0.05, 'order': 2},
+    'lowpass': {'cutoff': 0.5, 'order': 5},
+    'notch': None,  # 例如 {'freq': 10.0, 'quality': 30.0}
+}
 
 
 def butter_lowpass(cutoff, fs, order=5):
@@ -70,38 +28,91 @@ def iir_filter(data, b, a, zi):
     return y[0], zi
 
 
-def signal_filter(raw_data_queue, processed_data_queue, plot_data_queue):
-    # 定义滤波器参数
-    cutoff = 0.5
-    fs = 50.0
-    b, a = butter_lowpass(cutoff, fs)
-
-    # 初始化滤波器状态
-    zi = lfilter_zi(b, a) * 0
+def design_filter_chain(fs, highpass=None, lowpass=None, notch=None):
+    """Design the configured stages once and return them as one SOS array."""
+    sections = []
+    if highpass:
+        sections.append(butter(highpass.get('order', 2), highpass['cutoff'], btype='high', output='sos', fs=fs))
+    if lowpass:
+        sections.append(butter(lowpass.get('order', 5), lowpass['cutoff'], btype='low', output='sos', fs=fs))
+    if notch:
+        b, a = iirnotch(notch['freq'], notch.get('quality', 30.0), fs=fs)
+        sections.append(tf2sos(b, a))
+    if not sections:
+        # 空滤波链：单位增益直通
+        return np.array([[1.0, 0.0, 0.0, 1.0, 0.0, 0.0]])
+    return np.vstack(sections)
+
+
+class StreamingFilter:
+    """Causal SOS filter applied block by block.
+
+    The section state is carried between calls, so feeding a signal in
+    arbitrary blocks gives the same result as ``sosfilt`` over the whole
+    signal. With ``steady_start`` the state is initialised from the first
+    sample (the offline equivalent is ``zi=sosfilt_zi(sos) * x[0]``), which
+    avoids the start-up step response of the high-pass on a DC offset.
+    A 2-D block of shape ``(N, C)`` filters every channel independently.
+    """
+
+    def __init__(self, sos, steady_start=True):
+        self.sos = np.asarray(sos, dtype=np.float64)
+        self.steady_start = steady_start
+        self.zi = None
+
+    @classmethod
+    def from_config(cls, config=None, steady_start=True):
+        config = dict(FILTER_CONFIG if config is None else config)
+        fs = config.pop('fs')
+        return cls(design_filter_chain(fs, **config), steady_start=steady_start)
+
+    def reset(self):
+        self.zi = None
+
+    def process(self, block):
+        block = np.asarray(block, dtype=np.float64)
+        if len(block) == 0:
+            return block
+        if self.zi is None:
+            zi = sosfilt_zi(self.sos)
+            if block.ndim == 2:
+                zi = zi[:, :, None]  # 每个通道一份状态
+            self.zi = zi * (block[0] if self.steady_start else 0.0)
+        filtered, self.zi = sosfilt(self.sos, block, axis=0, zi=self.zi)
+        return filtered
+
+
+def signal_filter(raw_data_queue, processed_data_queue, plot_data_queue, *extra_queues, config=None, tracer=None):
+    # extra_queues: 其他需要同一份滤波结果的下游队列（例如和谐度分析）
+    stream_filter = StreamingFilter.from_config(config)
 
     while True:
-        if not raw_data_queue.empty():
-            data_point = raw_data_queue.get()
-            filtered_value = data_point['data']  # 获取原始数据值
-
-            # 对单个数据点进行IIR滤波
-            # filtered_value, zi = iir_filter(value, b, a, zi)
-
-            # 将滤波后的数据与时间戳一起保存
-            processed_data = {
-                'timestamp': data_point['timestamp'],  # 使用原始数据的时间戳
-                'filtered_data': filtered_value
-            }
-
-            # 将处理后的数据放入两个队列中
+        # 阻塞等待数据，然后取出队列中已有的全部数据作为一个块滤波
+        data_points, stopped = get_batch(raw_data_queue)
+        received = time.monotonic()
+        batch = to_batch(data_points)
+        if len(batch):
+            # 所有通道一起滤波，结果沿用原始数据的时间戳，整块放入两个队列
+            processed_data = batch.with_values(stream_filter.process(batch.values))
             processed_data_queue.put(processed_data)
             plot_data_queue.put(processed_data)
-
-
-
-def start_signal_filter(raw_data_queue, processed_data_queue, plot_data_queue):
-    multiprocessing.Process(
-        target=signal_filter,
-        args=(raw_data_queue, processed_data_queue, plot_data_queue),
-        daemon=True
-    ).start()
\ No newline at end of file
+            for extra_queue in extra_queues:
+                extra_queue.put(processed_data)
+            if tracer is not None:
+                tracer.mark(len(batch), received)
+        if stopped:
+            return
+
+
+def ring_signal_filter(raw_ring, filtered_ring, config=None, tracer=None):
+    # 共享内存版本：按批读取原始数据，写入一个供绘图和分析共同读取的滤波结果环
+    stream_filter = StreamingFilter.from_config(config)
+    reader = raw_ring.reader()
+    while not reader.exhausted:
+        timestamps, values = reader.read(timeout=0.5)
+        if len(values):
+            received = time.monotonic()
+            filtered_ring.write(timestamps, stream_filter.process(values))
+            if tracer is not None:
+                tracer.mark(len(values), received, start=reader.cursor - len(values))
+    filtered_ring.mark_closed()
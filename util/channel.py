@@ -0,0 +1,117 @@
+import multiprocessing
+import queue
+from multiprocessing.sharedctypes import RawValue
+
+BLOCK = 'block'  # 队列满时生产者阻塞（反压）
+DROP_OLDEST = 'drop_oldest'  # 丢弃最旧的数据，为新数据腾出位置
+DROP_NEWEST = 'drop_newest'  # 丢弃新到的数据
+LATEST = 'latest'  # 只保留最新的一条
+POLICIES = (BLOCK, DROP_OLDEST, DROP_NEWEST, LATEST)
+EVICT_TIMEOUT = 0.05  # 刚放入的数据要等后台线程写入管道后才能取出
+STOP_TIMEOUT = 1.0  # 停止标记先等待消费者腾出位置，超时后再挤掉旧数据
+
+
+class StopSignal:
+    # 停止标记：经过 pickle 后身份会改变，所以用类型而不是 is 判断
+    pass
+
+
+STOP = StopSignal()
+
+
+def is_stop(item):
+    return isinstance(item, StopSignal)
+
+
+class Channel:
+    """Bounded inter-process queue with an overflow policy and counters.
+
+    It has the same ``put``/``get``/``get_nowait``/``empty``/``qsize``
+    interface as ``multiprocessing.Queue``, so stages do not need to know
+    which policy a channel uses. The stop marker is never dropped; if the
+    consumer does not make room for it within ``STOP_TIMEOUT``, the oldest
+    items are evicted instead, on a ``BLOCK`` channel too. The
+    counters assume one producer and one consumer process per channel.
+    """
+
+    def __init__(self, maxsize=0, policy=BLOCK):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown channel policy: {policy}")
+        if policy == LATEST:
+            maxsize = 1
+        if policy != BLOCK and maxsize <= 0:
+            raise ValueError(f"Policy {policy} needs a positive maxsize")
+        self.maxsize = maxsize
+        self.policy = policy
+        self._queue = multiprocessing.Queue(maxsize)
+        # 每个计数器只由一个进程写：生产者写 puts/dropped/evicted，消费者写 gets
+        self._puts = RawValue('q', 0)
+        self._gets = RawValue('q', 0)
+        self._evicted = RawValue('q', 0)
+        self._dropped = RawValue('q', 0)
+
+    def put(self, item, block=True, timeout=None):
+        """Put an item according to the policy; return False if it was
+        dropped."""
+        if is_stop(item):
+            self._put_stop(item)
+            return True
+        if self.policy == BLOCK:
+            self._queue.put(item, block, timeout)
+        elif not self._put_nowait(item, evict=self.policy != DROP_NEWEST):
+            self._dropped.value += 1
+            return False
+        self._puts.value += 1
+        return True
+
+    def _put_stop(self, item):
+        # 消费者已退出或卡住时不能无限等待（BLOCK 通道也一样），挤掉最旧的数据为停止标记腾出位置
+        try:
+            self._queue.put(item, timeout=STOP_TIMEOUT)
+        except queue.Full:
+            if not self._put_nowait(item, evict=True):
+                print(f"Error putting stop marker: channel still full after {STOP_TIMEOUT} s, consumer is gone")
+
+    def _put_nowait(self, item, evict):
+        for _ in range(self.maxsize + 1):
+            try:
+                self._queue.put_nowait(item)
+                return True
+            except queue.Full:
+                if not evict:
+                    return False
+            try:
+                evicted = self._queue.get(timeout=EVICT_TIMEOUT)
+            except queue.Empty:
+                continue
+            if is_stop(evicted):
+                # 停止标记不能丢，放回去并放弃当前数据
+                self._queue.put(evicted)
+                return is_stop(item)
+            self._evicted.value += 1
+            self._dropped.value += 1
+        return False
+
+    def get(self, block=True, timeout=None):
+        item = self._queue.get(block, timeout)
+        if not is_stop(item):
+            self._gets.value += 1
+        return item
+
+    def get_nowait(self):
+        return self.get(False)
+
+    def qsize(self):
+        return max(0, self._puts.value - self._gets.value - self._evicted.value)
+
+    def empty(self):
+        return self._queue.empty()
+
+    def stats(self):
+        return {
+            'policy': self.policy,
+            'capacity': self.maxsize,
+            'occupancy': self.qsize(),
+            'put': self._puts.value,
+            'dropped': self._dropped.value,
+        }
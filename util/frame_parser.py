@@ -0,0 +1,279 @@
+import os
+
+import numpy as np
+
+HEADER = 0xFF
+MIN_FRAME_LENGTH = 7  # 帧头 + 类型 + 长度 + 校验 + 命令 + 至少两个数据字节
+MAX_FRAME_LENGTH = 0xFF + 2  # 长度字段最大 255，帧长为长度 + 2
+DECODE_CHUNK = 1 << 22  # decode_frames 每次处理的字节数，限制大文件解码时的临时内存
+VECTOR_THRESHOLD = 1024  # feed_arrays 在缓冲区达到这个字节数时改用向量化解码
+
+
+class FrameParser:
+    """Incremental parser for HK protocol frames.
+
+    Frame layout: FF | device type | length | checksum | command | data...
+    A frame is ``length + 2`` bytes long and the checksum is the low byte of
+    ``length + sum(frame[4:])``.
+    """
+
+    def __init__(self):
+        self.buffer = bytearray()
+        self.frames = 0  # 成功解析的帧数
+        self.bad_checksum = 0  # 校验失败的帧数
+        self.dropped = 0  # 长度字段非法而丢弃的帧数
+        self.resyncs = 0  # 重新寻找帧头的次数
+        self.dropped_bytes = 0  # 重新同步时跳过的字节数
+
+    def feed(self, data):
+        """Append raw bytes and return every complete frame as a list of
+        ``(device_type, command, value)`` tuples."""
+        buf = self.buffer
+        buf += data
+        samples = []
+        pos = 0
+        size = len(buf)
+
+        with memoryview(buf) as view:
+            while size - pos >= MIN_FRAME_LENGTH:
+                if buf[pos] != HEADER:
+                    # 丢失同步：跳到下一个帧头，之间的字节作废
+                    header = buf.find(HEADER, pos)
+                    self.resyncs += 1
+                    if header < 0:
+                        self.dropped_bytes += size - pos
+                        pos = size
+                        break
+                    self.dropped_bytes += header - pos
+                    pos = header
+                    continue
+
+                length = buf[pos + 2]
+                if length < MIN_FRAME_LENGTH - 2:
+                    # 长度字段不可能成立，说明这不是真正的帧头
+                    self.dropped += 1
+                    pos += 1
+                    continue
+
+                end = pos + length + 2
+                if end > size:
+                    # 帧尚未接收完整，等待下一批数据
+                    break
+
+                if (length + sum(view[pos + 4:end])) & 0xFF != buf[pos + 3]:
+                    # 只跳过当前帧头，帧内可能包含下一个完好的帧
+                    self.bad_checksum += 1
+                    pos += 1
+                    continue
+
+                value = int.from_bytes(view[pos + 5:end], 'big')
+                samples.append((buf[pos + 1], buf[pos + 4], value))
+                self.frames += 1
+                pos = end
+
+        if pos:
+            del buf[:pos]
+        return samples
+
+    def feed_arrays(self, data):
+        """Like ``feed`` but returns ``(device_types, commands, values)``
+        arrays. Buffers of at least ``VECTOR_THRESHOLD`` bytes are decoded
+        with ``decode_buffer``; smaller ones, where numpy's per-call cost
+        dominates, go through ``feed``. Both give identical results."""
+        if len(self.buffer) + len(data) < VECTOR_THRESHOLD:
+            samples = self.feed(data)
+            return (np.fromiter((device_type for device_type, _, _ in samples), dtype=np.uint8, count=len(samples)),
+                    np.fromiter((command for _, command, _ in samples), dtype=np.uint8, count=len(samples)),
+                    np.fromiter((_to_float(value) for _, _, value in samples), dtype=np.float64, count=len(samples)))
+        buf = self.buffer
+        buf += data
+        decoded = decode_buffer(np.frombuffer(buf, dtype=np.uint8))
+        self.frames += len(decoded.offsets)
+        self.bad_checksum += len(decoded.bad_checksum)
+        self.dropped += len(decoded.bad_length)
+        self.resyncs += decoded.resyncs
+        self.dropped_bytes += decoded.dropped_bytes
+        if decoded.pending:
+            del buf[:decoded.pending]
+        return decoded.device_types, decoded.commands, decoded.values
+
+    def stats(self):
+        return {
+            'frames': self.frames,
+            'bad_checksum': self.bad_checksum,
+            'dropped': self.dropped,
+            'resyncs': self.resyncs,
+            'dropped_bytes': self.dropped_bytes,
+            'pending_bytes': len(self.buffer),
+        }
+
+    def reset(self):
+        self.buffer.clear()
+
+
+class DecodedFrames:
+    """Frames decoded from a byte capture by ``decode_frames``.
+
+    ``offsets``, ``device_types``, ``commands`` and ``values`` (float64)
+    describe the valid frames. ``bad_checksum`` and ``bad_length`` are the
+    offsets of rejected frame headers, ``pending`` is where the undecoded
+    tail (an incomplete frame) starts, and ``dropped_bytes``/``resyncs``
+    count the bytes skipped while searching for a header, as in
+    ``FrameParser.stats``.
+    """
+
+    def __init__(self, offsets, device_types, commands, values, bad_checksum, bad_length, pending,
+                 dropped_bytes=0, resyncs=0):
+        self.offsets = offsets
+        self.device_types = device_types
+        self.commands = commands
+        self.values = values
+        self.bad_checksum = bad_checksum
+        self.bad_length = bad_length
+        self.pending = pending
+        self.dropped_bytes = dropped_bytes
+        self.resyncs = resyncs
+
+    def __len__(self):
+        return len(self.offsets)
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except OverflowError:
+        return float('inf')
+
+
+def _frame_values(buf, starts, lengths):
+    # 数据字段为大端整数，按字段长度分组后整组计算
+    values = np.empty(len(starts), dtype=np.float64)
+    sizes = lengths - 3
+    uniform = len(sizes) and (sizes == sizes[0]).all()
+    for size in ([sizes[0]] if uniform else np.unique(sizes)):
+        selected = slice(None) if uniform else np.flatnonzero(sizes == size)
+        columns = buf[starts[selected, None] + 5 + np.arange(size)]
+        if size <= 8:
+            shifts = np.arange(8 * (size - 1), -1, -8, dtype=np.uint64)
+            values[selected] = (columns.astype(np.uint64) << shifts).sum(axis=1, dtype=np.uint64)
+        else:
+            # 超过 8 字节的字段（协议中不常见）逐帧换算，超出 float64 范围的记为 inf
+            values[selected] = [_to_float(int.from_bytes(row.tobytes(), 'big')) for row in columns]
+    return values
+
+
+def decode_buffer(buf):
+    """Decode one ``uint8`` array exactly as ``FrameParser.feed`` would.
+
+    Every header candidate is classified at once: frame length, whether the
+    frame is complete and its checksum (from a prefix sum of the bytes).
+    ``FrameParser`` accepts a valid frame and resumes at its end, and skips
+    a rejected header by one byte, so the accepted frames are the chain of
+    valid frames, each being the first valid (or incomplete) candidate at
+    or after the end of the previous one. Consecutive frames form runs that
+    are accepted as a whole; the Python loop only runs once per break in
+    the stream.
+    """
+    size = len(buf)
+    heads = np.flatnonzero(buf[:max(size - MIN_FRAME_LENGTH + 1, 0)] == HEADER)
+    lengths = buf[heads + 2].astype(np.int64)
+    ends = heads + lengths + 2
+    valid_length = lengths >= MIN_FRAME_LENGTH - 2
+    complete = ends <= size
+    # 前缀和按 uint32 回绕也不影响低 8 位的校验和
+    prefix = np.zeros(size + 1, dtype=np.uint32)
+    np.cumsum(buf, dtype=np.uint32, out=prefix[1:])
+    sums = prefix[np.minimum(ends, size)] - prefix[np.minimum(heads + 4, size)]
+    good = valid_length & complete & ((lengths + sums) & 0xFF == buf[heads + 3])
+    incomplete = valid_length & ~complete
+
+    # 链上的节点：校验通过的帧和不完整的帧（解析在后者处停止）
+    nodes = np.flatnonzero(good | incomplete)
+    starts = heads[nodes]
+    node_ends = ends[nodes]
+    # 紧接着上一帧结束位置的节点与上一帧连成一段；最后一个节点总是段尾
+    breaks = np.flatnonzero(~good[nodes] | np.append(node_ends[:-1] != starts[1:], True))
+    accepted = np.zeros(len(nodes), dtype=bool)
+    pending = None
+    current = 0
+    while current < len(nodes):
+        last = breaks[np.searchsorted(breaks, current)]
+        if not good[nodes[last]]:
+            accepted[current:last] = True
+            pending = int(starts[last])
+            break
+        accepted[current:last + 1] = True
+        current = int(np.searchsorted(starts, node_ends[last]))
+
+    frames = nodes[accepted]
+    frame_starts = heads[frames]
+    frame_ends = ends[frames]
+    end = int(frame_ends[-1]) if len(frames) else 0
+    if pending is None:
+        # 最后一帧之后只剩被拒绝的帧头和无效字节
+        late = heads[heads >= end]
+        if size - end < MIN_FRAME_LENGTH:
+            pending = end
+        elif len(late) and late[-1] == size - MIN_FRAME_LENGTH:
+            pending = size - MIN_FRAME_LENGTH + 1
+        else:
+            tail = np.flatnonzero(buf[size - MIN_FRAME_LENGTH + 1:] == HEADER)
+            tail = tail[tail + size - MIN_FRAME_LENGTH + 1 >= end]
+            pending = int(tail[0]) + size - MIN_FRAME_LENGTH + 1 if len(tail) else size
+
+    # 被拒绝的帧头：不在已接受的帧内部且在 pending 之前
+    candidates = np.flatnonzero(~good & ~incomplete)
+    others = heads[candidates]
+    inside = np.searchsorted(frame_starts, others, side='right') - 1
+    covered = (inside >= 0) & (others < frame_ends[np.maximum(inside, 0)] if len(frames) else False)
+    reached = ~covered & (others < pending)
+    rejected_heads = others[reached]
+    bad_checksum = rejected_heads[valid_length[candidates[reached]]]
+    bad_length = rejected_heads[~valid_length[candidates[reached]]]
+
+    # 解析位置落在非帧头字节上（且剩余字节足够）时会重新寻找帧头
+    landings = np.concatenate(([0], frame_ends, rejected_heads + 1))
+    landings = landings[landings <= size - MIN_FRAME_LENGTH]
+    resyncs = int(np.count_nonzero(buf[landings] != HEADER))
+    frame_bytes = int((frame_ends - frame_starts).sum())
+    dropped_bytes = pending - frame_bytes - len(bad_checksum) - len(bad_length)
+
+    return DecodedFrames(frame_starts, buf[frame_starts + 1], buf[frame_starts + 4],
+                         _frame_values(buf, frame_starts, lengths[frames]), bad_checksum, bad_length, pending,
+                         dropped_bytes, resyncs)
+
+
+def decode_frames(data, chunk_size=DECODE_CHUNK):
+    """Decode every HK frame in a complete byte capture.
+
+    ``data`` is ``bytes``/``bytearray``, a ``uint8`` array (e.g. an
+    ``np.memmap``) or the path of a capture file, which is memory-mapped.
+    The capture is decoded ``chunk_size`` bytes at a time, so temporary
+    memory does not grow with its size; it is raised to ``MAX_FRAME_LENGTH``
+    so every window can complete the frame it starts with. Returns a
+    ``DecodedFrames`` with absolute offsets; ``pending`` marks a truncated
+    frame at the end.
+    """
+    chunk_size = max(chunk_size, MAX_FRAME_LENGTH)
+    if isinstance(data, str):
+        data = np.memmap(data, dtype=np.uint8, mode='r') if os.path.getsize(data) else np.empty(0, np.uint8)
+    buf = np.frombuffer(data, dtype=np.uint8) if not isinstance(data, np.ndarray) else data
+    parts = []
+    position = 0
+    while True:
+        window = np.asarray(buf[position:position + chunk_size])
+        decoded = decode_buffer(window)
+        for name in ('offsets', 'bad_checksum', 'bad_length'):
+            setattr(decoded, name, getattr(decoded, name) + position)
+        parts.append(decoded)
+        last = position + len(window) >= len(buf)
+        position += decoded.pending
+        if last or not decoded.pending:
+            break
+
+    def joined(name):
+        return np.concatenate([getattr(part, name) for part in parts])
+
+    return DecodedFrames(joined('offsets'), joined('device_types'), joined('commands'), joined('values'),
+                         joined('bad_checksum'), joined('bad_length'), position,
+                         sum(part.dropped_bytes for part in parts), sum(part.resyncs for part in parts))
@@ -0,0 +1,163 @@
+import math
+
+import numpy as np
+
+from backend.util.pipeline import drain_latest, read_filtered_block
+from backend.util.rolling_stats import RollingStats
+from backend.util.shm_ring import SharedRingBuffer
+
+STATS_WINDOW = 500  # 归一化使用的滚动窗口（样本数）
+HOLD = 5  # 进入一个极端后，至少要在该极端停留这么多次才能计为一次到达
+REFERENCE_INTERVAL = 10.0  # 参考呼吸率每隔多少秒（信号时间）更新一次
+# 呼吸率相对参考值的变化百分比 -> 和谐度：不超过 5% 为 100，超过 90% 为 0
+LADDER_THRESHOLDS = np.array([5, 10, 20, 30, 40, 50, 60, 70, 80, 90])
+LADDER_LEVELS = np.array([100, 90, 80, 70, 60, 50, 40, 30, 20, 10, 0])
+TOO_FAST = 'Breathing too fast!'
+TOO_SLOW = 'Breathing too slow!'
+
+
+def harmony_level(percentage_difference):
+    """Map the percentage difference between the current and the reference
+    rate to a harmony level (scalar or array)."""
+    return LADDER_LEVELS[np.searchsorted(LADDER_THRESHOLDS, percentage_difference)]
+
+
+class HarmonyResult:
+    """What the GUI renders after one block.
+
+    ``strength`` (0-100) and ``deviation`` (0-1, distance from the rolling
+    mean in standard deviations) describe the newest sample and are None
+    until the rolling window is full. ``cycles`` is the running count of
+    max/min cycles and ``cycle_indices`` the sample positions of the cycles
+    completed in this block. ``level`` is the harmony level of the latest
+    cycle (None before the first one) and ``reminder`` the text to show.
+    """
+
+    def __init__(self, sample_index, strength, deviation, cycles, cycle_indices, level, reminder, rate,
+                 reference_rate):
+        self.sample_index = sample_index
+        self.strength = strength
+        self.deviation = deviation
+        self.cycles = cycles
+        self.cycle_indices = cycle_indices
+        self.level = level
+        self.reminder = reminder
+        self.rate = rate
+        self.reference_rate = reference_rate
+
+
+class HarmonyAnalyzer:
+    """Breath-cycle detection and harmony scoring on the filtered signal.
+
+    Each sample is normalized against the mean and standard deviation of
+    the last ``window`` samples to a strength of 0-100 (clipped at one
+    standard deviation). A cycle is counted when the signal saturates at
+    one extreme (0 or 100) after having saturated at the other at least
+    ``hold`` times. At every cycle the current breathing rate is compared
+    with a reference rate, refreshed every ``reference_interval`` seconds
+    of signal, and the percentage difference is mapped to a level with
+    ``harmony_level``; at 50 or below a too fast/too slow reminder is set.
+
+    The rolling statistics come from ``RollingStats.update_block``, a whole
+    block at a time; only the saturated samples go through the state
+    machine.
+    """
+
+    def __init__(self, sampling_rate=50, window=STATS_WINDOW, hold=HOLD, reference_interval=REFERENCE_INTERVAL):
+        self.window = window
+        self.hold = hold
+        self.reference_samples = int(reference_interval * sampling_rate)
+        self.stats = RollingStats(window)
+        self.sample_index = 0
+        # 与原界面逻辑相同的初始状态：两个计数器从 hold 开始，第一次到达极端即可成对
+        self.consecutive_max = hold
+        self.consecutive_min = hold
+        self.waiting_for_opposite = False
+        self.cycles = 0
+        self.level = None
+        self.reminder = ''
+        self.reference_rate = None
+        self._reference_index = 0
+
+    def normalize(self, values):
+        """Return ``(strength, deviation)`` arrays for a block; NaN where
+        fewer than ``window`` samples have been seen or the std is zero."""
+        values = np.asarray(values, dtype=np.float64)
+        mean, std, counts = self.stats.update_block(values)
+        ready = (counts >= self.window) & (std > 0)
+        distance = np.where(ready, (values - mean) / np.where(std > 0, std, 1.0), np.nan)
+        strength = np.clip(distance * 50 + 50, 0, 100)
+        deviation = np.minimum(np.abs(distance), 1.0)
+        return strength, deviation
+
+    def _update_reference(self, rate, end):
+        if rate is None:
+            return
+        if self.reference_rate is None or end - self._reference_index >= self.reference_samples:
+            self.reference_rate = rate
+            self._reference_index = end
+
+    def _score(self, rate):
+        if self.reference_rate is None or rate is None:
+            return
+        percentage_difference = abs(rate - self.reference_rate) / self.reference_rate * 100
+        self.level = int(harmony_level(percentage_difference))
+        if self.level <= 50:
+            self.reminder = TOO_FAST if rate > self.reference_rate else TOO_SLOW
+        else:
+            self.reminder = ''
+
+    def process(self, values, rate=None):
+        """Process one block; ``rate`` is the current breathing rate in
+        breaths/min (None while unknown). Returns a ``HarmonyResult``."""
+        strength, deviation = self.normalize(values)
+        start = self.sample_index
+        self.sample_index += len(strength)
+
+        cycle_indices = []
+        # 只有达到 0 或 100 的样本会改变状态
+        for i in np.flatnonzero((strength == 100) | (strength == 0)).tolist():
+            at_max = strength[i] == 100
+            opposite = self.consecutive_min if at_max else self.consecutive_max
+            if self.waiting_for_opposite and opposite >= self.hold:
+                self.cycles += 1
+                cycle_indices.append(start + i)
+                self._score(rate)
+                self.waiting_for_opposite = False
+                if at_max:
+                    self.consecutive_min = 0
+                else:
+                    self.consecutive_max = 0
+            else:
+                if at_max:
+                    self.consecutive_max += 1
+                else:
+                    self.consecutive_min += 1
+                self.waiting_for_opposite = True
+        self._update_reference(rate, self.sample_index)
+
+        last = len(strength) - 1
+        ready = last >= 0 and not np.isnan(strength[last])
+        return HarmonyResult(self.sample_index, float(strength[last]) if ready else None,
+                             float(deviation[last]) if ready else None, self.cycles, cycle_indices, self.level,
+                             self.reminder, rate, self.reference_rate)
+
+
+def harmony_analysis(processed_data_queue, rsp_data_queue, harmony_queue, sampling_rate=50, channel=0):
+    # 流水线阶段：与呼吸分析并行读取滤波结果，每个数据块发布一个 HarmonyResult
+    # 当前呼吸率取自呼吸分析阶段发布的最新 RspResult，与界面显示的呼吸率一致
+    source = processed_data_queue
+    if isinstance(processed_data_queue, SharedRingBuffer):
+        source = processed_data_queue.reader()
+    analyzer = HarmonyAnalyzer(sampling_rate)
+    rate = None
+
+    stopped = False
+    while not stopped:
+        values, stopped = read_filtered_block(source, channel=channel)
+        if not len(values):
+            continue
+        latest = drain_latest(rsp_data_queue)
+        if latest is not None and math.isfinite(latest.rate):
+            rate = latest.rate
+        harmony_queue.put(analyzer.process(values, rate))
@@ -0,0 +1,79 @@
+import math
+import time
+
+from backend.util.pipeline import drain_latest, get_batch
+from backend.util.sample_batch import to_batch
+from backend.util.shm_ring import RingReader, SharedRingBuffer
+
+REPORT_INTERVAL = 5.0  # 无界面模式下每隔多少秒打印一行状态
+
+
+def _wait_latest(channel):
+    # 等待上游结束（收到停止标记），返回最后一个结果
+    latest = None
+    stopped = channel is None
+    while not stopped:
+        items, stopped = get_batch(channel)
+        if items:
+            latest = items[-1]
+    return latest
+
+
+def report_results(filtered, rsp_data_queue, harmony_queue=None, started=None, interval=REPORT_INTERVAL,
+                   tracer=None):
+    """Main stage of the headless service, in place of the plotter.
+
+    Consumes the same channels as ``start_signal_plotter`` without
+    importing Qt: prints the time from ``started`` (``time.monotonic()``
+    when the service was launched) to the first filtered sample, then one
+    status line every ``interval`` seconds. Once the filtered stream is
+    closed it waits for the analysis stages to finish, prints a final line
+    and returns. The analysis results are only unpickled after the
+    first sample, so their imports do not delay it.
+    """
+    source = filtered.reader() if isinstance(filtered, SharedRingBuffer) else filtered
+    started = time.monotonic() if started is None else started
+    samples = 0
+    first_sample = None
+    next_report = time.monotonic() + interval
+    rate = None
+    quality = None
+    harmony = None
+
+    stopped = False
+    while not stopped:
+        if isinstance(source, RingReader):
+            _, values = source.read(timeout=0.5)
+            count, stopped = len(values), source.exhausted
+        else:
+            items, stopped = get_batch(source)
+            count = len(to_batch(items))
+        received = time.monotonic()
+        if count and first_sample is None:
+            first_sample = received
+            print(f"First filtered sample after {(first_sample - started) * 1000:.0f} ms")
+        samples += count
+        if tracer is not None and count:
+            start = source.cursor - count if isinstance(source, RingReader) else None
+            tracer.mark(count, received, start=start)
+
+        if first_sample is None or (received < next_report and not stopped):
+            continue
+        next_report = received + interval
+        drain = _wait_latest if stopped else drain_latest
+        latest = drain(rsp_data_queue)
+        if latest is not None:
+            rate, quality = latest.rate, latest.quality
+        harmony = drain(harmony_queue) or harmony
+        # 窗口中还不足两个波谷时呼吸率为 NaN
+        if rate is not None and math.isfinite(rate):
+            line = f"{samples} samples, rate {rate:.1f} /min"
+        else:
+            line = f"{samples} samples, rate -"
+        if quality is not None and not math.isnan(quality):
+            line += f" (quality {quality:.2f})"
+        if harmony is not None:
+            line += f", cycles {harmony.cycles}, harmony {'-' if harmony.level is None else harmony.level}"
+            if harmony.reminder:
+                line += f" ({harmony.reminder})"
+        print(line)
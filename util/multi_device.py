@@ -0,0 +1,155 @@
+import os
+import selectors
+import time
+
+import numpy as np
+
+from backend.serial_device import SerialDevice
+from backend.util.sample_batch import SampleBatch
+from backend.util.shm_ring import SharedRingBuffer
+
+RESPIRATION = 0xCC  # 呼吸：HKH-11C，与单设备流水线的原始数据环对应
+STREAM_CHANNELS = ('device_type', 'value')  # 统一数据流的列：帧头中的设备类型和数值
+POLL_INTERVAL = 0.001  # 无法 select 串口时（Windows）的初始轮询间隔
+MAX_POLL_INTERVAL = 0.02
+
+
+class MultiDeviceReader:
+    """Reads any number of HK serial devices from a single thread.
+
+    On POSIX the ports are registered with a ``selectors`` selector, so the
+    reader sleeps until one of them has data; on Windows, where serial
+    handles cannot be selected, it polls ``in_waiting`` with a backoff that
+    resets as soon as data arrives. Every port keeps its own frame parser.
+
+    Samples from all ports form one stream on a common clock:
+    ``time.monotonic()`` when the bytes were read, in seconds since
+    ``collect_data`` started. Each sample is tagged with the device type
+    byte of its frame header, so a port carrying several sensors is split
+    correctly. ``collect_data`` publishes the whole stream as
+    ``SampleBatch`` blocks with ``STREAM_CHANNELS`` columns, and can route
+    single device types to their own ring or queue.
+    """
+
+    def __init__(self, ports, baudrate=115200):
+        self.devices = [SerialDevice(port, baudrate, timeout=0) for port in ports]
+        self.start_time = None
+        self.samples = 0
+        self._selector = None
+        self._poll_interval = POLL_INTERVAL
+
+    def open(self):
+        for device in self.devices:
+            device.open_serial_port()
+            if device.ser is None:
+                continue
+            device.parser.reset()
+            # 与 SerialDevice.collect_data 相同的启动命令，呼吸幅度档位保持一致
+            device.send_stop_measurement()
+            device.adjust_breath_amplitude(5)
+            device.send_start_measurement()
+        open_devices = [device for device in self.devices if device.ser is not None]
+        if os.name != 'nt':
+            self._selector = selectors.DefaultSelector()
+            for device in open_devices:
+                self._selector.register(device.ser.fileno(), selectors.EVENT_READ, device)
+        self.start_time = time.monotonic()
+        return open_devices
+
+    def close(self):
+        for device in self.devices:
+            if device.ser is None:
+                continue
+            try:
+                device.send_stop_measurement()
+                device.ser.close()
+            except Exception as e:
+                print(f"Error closing {device.port}: {e}")
+        if self._selector is not None:
+            self._selector.close()
+            self._selector = None
+
+    def _ready_devices(self, timeout):
+        if self._selector is not None:
+            return [key.data for key, _ in self._selector.select(timeout)]
+        # 轮询：没有数据时逐步加长等待间隔，直到 timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            ready = [device for device in self.devices if device.ser is not None and device.ser.in_waiting]
+            if ready:
+                self._poll_interval = POLL_INTERVAL
+                return ready
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return []
+            time.sleep(min(self._poll_interval, remaining))
+            self._poll_interval = min(self._poll_interval * 2, MAX_POLL_INTERVAL)
+
+    def read(self, timeout=0.5):
+        """Wait up to ``timeout`` seconds for data on any port and return
+        ``(timestamps, device_types, values)`` for every complete frame."""
+        timestamps, device_types, values = [], [], []
+        for device in self._ready_devices(timeout):
+            chunk = device.ser.read(device.ser.in_waiting or 1)
+            received = time.monotonic() - self.start_time
+            types, _, samples = device.parser.feed_arrays(chunk)
+            device_types.append(types)
+            values.append(samples)
+            timestamps.append(np.full(len(samples), received))
+        if not values:
+            return np.empty(0), np.empty(0, dtype=np.uint8), np.empty(0)
+        values = np.concatenate(values)
+        self.samples += len(values)
+        return np.concatenate(timestamps), np.concatenate(device_types).astype(np.uint8), values
+
+    def collect_data(self, output=None, stream=None, stop_event=None, routes=None, tracer=None):
+        """Read until ``stop_event`` is set.
+
+        ``stream`` is a queue that receives every sample of every device,
+        one ``SampleBatch`` per read with the ``STREAM_CHANNELS`` columns,
+        in read order on the common clock. ``output`` receives the
+        respiration samples only, so the reader can replace
+        ``SerialDevice`` in the single-sensor pipeline with either
+        transport: a ``SharedRingBuffer`` or a queue of ``SampleBatch``
+        blocks, one per read. ``routes`` maps further device types to their
+        own ring or queue in the same way. ``tracer`` follows the
+        respiration samples.
+        """
+        if isinstance(stream, SharedRingBuffer):
+            # 共享内存环只有一个数值列，放不下设备类型
+            raise ValueError("The multi-device stream needs a queue, rings are single-channel")
+        routes = dict(routes or {})
+        if output is not None:
+            routes.setdefault(RESPIRATION, output)
+
+        if not self.open():
+            print("No serial port could be opened")
+        try:
+            while stop_event is None or not stop_event.is_set():
+                timestamps, device_types, values = self.read()
+                if not len(values):
+                    continue
+                received = self.start_time + timestamps[0]  # 本轮最早读到字节的时刻
+                if stream is not None:
+                    stream.put(SampleBatch.from_arrays(timestamps, np.column_stack((device_types, values)),
+                                                       STREAM_CHANNELS))
+                for device_type, channel in routes.items():
+                    selected = device_types == device_type
+                    if not selected.any():
+                        continue
+                    if isinstance(channel, SharedRingBuffer):
+                        channel.write(timestamps[selected], values[selected])
+                    else:
+                        channel.put(SampleBatch.from_arrays(timestamps[selected], values[selected]))
+                if tracer is not None:
+                    tracer.mark(int(np.count_nonzero(device_types == RESPIRATION)), received)
+        except Exception as e:
+            print(f"Error reading serial data: {e}")
+        finally:
+            self.close()
+            for channel in routes.values():
+                if isinstance(channel, SharedRingBuffer):
+                    channel.mark_closed()
+
+    def get_parser_stats(self):
+        return {device.port: device.get_parser_stats() for device in self.devices}
@@ -0,0 +1,232 @@
+import importlib
+import multiprocessing
+import queue
+import signal
+import time
+
+import numpy as np
+
+from backend.util.channel import BLOCK, STOP, Channel, is_stop
+from backend.util.sample_batch import to_batch
+from backend.util.shm_ring import RingReader, SharedRingBuffer
+
+
+def get_batch(channel, timeout=0.5, max_items=4096):
+    """Block up to ``timeout`` seconds for one item, then take whatever else
+    is already queued. Returns ``(items, stopped)``; ``stopped`` is True once
+    the stop marker has been received (items before it are still returned)."""
+    try:
+        item = channel.get(timeout=timeout)
+    except queue.Empty:
+        return [], False
+    items = []
+    while True:
+        if is_stop(item):
+            return items, True
+        items.append(item)
+        if len(items) >= max_items:
+            return items, False
+        try:
+            item = channel.get_nowait()
+        except queue.Empty:
+            return items, False
+
+
+def drain_latest(channel):
+    # 只保留队列中最新的一个结果，忽略停止标记；不阻塞
+    latest = None
+    while channel is not None:
+        try:
+            item = channel.get_nowait()
+        except queue.Empty:
+            break
+        if not is_stop(item):
+            latest = item
+    return latest
+
+
+def read_filtered_block(source, timeout=0.5, channel=0):
+    # 取出当前可用的全部滤波数据；source 为共享内存环的 RingReader 或 Queue
+    # 返回 (values, stopped)，stopped 表示上游已经结束；队列中的多通道数据只取 channel 通道
+    if isinstance(source, RingReader):
+        _, values = source.read(timeout=timeout)
+        return values, source.exhausted
+    data_points, stopped = get_batch(source, timeout=timeout)
+    return np.ascontiguousarray(to_batch(data_points).column(channel)), stopped
+
+
+def close_channel(channel):
+    # 通知下游不会再有数据
+    if isinstance(channel, SharedRingBuffer):
+        channel.mark_closed()
+    else:
+        channel.put(STOP)
+
+
+def resolve_target(target):
+    """Return the callable for a stage target given either directly or as
+    a ``'package.module:function'`` string, which is imported here."""
+    if not isinstance(target, str):
+        return target
+    module_name, _, attribute = target.partition(':')
+    resolved = importlib.import_module(module_name)
+    for name in attribute.split('.'):
+        resolved = getattr(resolved, name)
+    return resolved
+
+
+def _run_stage(name, target, args, kwargs, outputs, started=None):
+    # 子进程不处理 Ctrl-C，由主进程统一发送停止信号
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    try:
+        target = _resolve_timed(name, target, started)
+        target(*args, **kwargs)
+    except Exception as e:
+        print(f"Error in stage {name}: {e}")
+    finally:
+        for channel in outputs:
+            close_channel(channel)
+
+
+def _resolve_timed(name, target, started):
+    # started 不为 None 时打印该阶段的导入耗时和距流水线启动的时间
+    begin = time.monotonic()
+    target = resolve_target(target)
+    if started is not None:
+        ready = time.monotonic()
+        print(f"Stage {name} ready {(ready - started) * 1000:.0f} ms after pipeline start "
+              f"(imports {(ready - begin) * 1000:.0f} ms)")
+    return target
+
+
+class Stage:
+    def __init__(self, name, target, inputs=(), outputs=(), main=False, daemon=True, kwargs=None):
+        self.name = name
+        self.target = target
+        self.inputs = tuple(inputs)
+        self.outputs = tuple(outputs)
+        self.main = main  # 在主进程中运行（例如 Qt 界面）
+        self.daemon = daemon  # 需要创建子进程的阶段（例如进程池）不能是守护进程
+        self.kwargs = kwargs or {}
+        self.process = None
+
+
+class Pipeline:
+    """Stages connected by named channels.
+
+    Each stage is called as ``target(*inputs, *outputs, **kwargs)`` in its own
+    process (or in the main process for ``main=True``, started last). A
+    target may be a ``'module:function'`` string; it is then imported only
+    in the process that runs the stage, so heavy dependencies (Qt,
+    neurokit2, ...) stay out of the main process and out of stages that do
+    not use them. Modules in ``preload`` are imported in the main process
+    right before the stages are forked, so stages sharing a heavy
+    dependency inherit it instead of each importing it (skipped when
+    processes are spawned). With ``report_startup`` every stage prints how
+    long it took to become ready. Stage processes are daemonic unless added
+    with ``daemon=False``, which a stage starting its own worker processes
+    needs. Stages block on their inputs with a timeout instead of polling;
+    when a stage returns its outputs are closed, so a stop propagates down
+    the graph.
+    Sources should watch ``pipeline.stop_event``.
+    """
+
+    def __init__(self, preload=(), report_startup=False):
+        self.channels = {}
+        self.stages = []
+        self.stop_event = multiprocessing.Event()
+        self.tracer = None  # 可选的延迟追踪器（backend.util.tracing.Tracer）
+        self.preload = tuple(preload)
+        self.report_startup = report_startup
+        self.started = None  # start() 被调用的时刻（time.monotonic()）
+        self._stopped = False
+
+    def queue(self, name, maxsize=0, policy=BLOCK):
+        self.channels[name] = Channel(maxsize, policy)
+        return self.channels[name]
+
+    def ring(self, name, capacity=1 << 16):
+        self.channels[name] = SharedRingBuffer(capacity)
+        return self.channels[name]
+
+    def add_stage(self, name, target, inputs=(), outputs=(), main=False, daemon=True, **kwargs):
+        stage = Stage(name, target,
+                      inputs=[self.channels[channel] for channel in inputs],
+                      outputs=[self.channels[channel] for channel in outputs],
+                      main=main, daemon=daemon, kwargs=kwargs)
+        self.stages.append(stage)
+        return stage
+
+    def start(self):
+        self.started = time.monotonic()
+        started = self.started if self.report_startup else None
+        if self.preload and multiprocessing.get_start_method() == 'fork':
+            for module_name in self.preload:
+                importlib.import_module(module_name)
+            if started is not None:
+                print(f"Preloaded {', '.join(self.preload)} in {(time.monotonic() - started) * 1000:.0f} ms")
+        for stage in self.stages:
+            if stage.main:
+                continue
+            stage.process = multiprocessing.Process(
+                target=_run_stage,
+                args=(stage.name, stage.target, stage.inputs + stage.outputs, stage.kwargs, stage.outputs, started),
+                name=stage.name,
+                daemon=stage.daemon
+            )
+            stage.process.start()
+
+    def run(self):
+        # 启动所有子进程，然后在主进程中运行 main 阶段，直到它返回或收到停止信号
+        self.install_signal_handlers()
+        self.start()
+        try:
+            main_stages = [stage for stage in self.stages if stage.main]
+            for stage in main_stages:
+                target = _resolve_timed(stage.name, stage.target, self.started if self.report_startup else None)
+                target(*(stage.inputs + stage.outputs), **stage.kwargs)
+            if not main_stages:
+                self.wait()
+        except KeyboardInterrupt:
+            print("Pipeline stopped by user")
+        finally:
+            self.stop()
+
+    def wait(self):
+        while not self.stop_event.is_set() and any(stage.process and stage.process.is_alive()
+                                                   for stage in self.stages):
+            self.stop_event.wait(0.5)
+
+    def stop(self, timeout=2.0):
+        if self._stopped:
+            return
+        self._stopped = True
+        self.stop_event.set()
+        # 源阶段看到 stop_event 后退出；再给每个队列补一个停止标记，保证下游不会一直阻塞
+        for stage in self.stages:
+            if not stage.inputs:
+                for channel in stage.outputs:
+                    close_channel(channel)
+        deadline = time.monotonic() + timeout
+        for stage in self.stages:
+            if stage.process is not None:
+                stage.process.join(max(0.0, deadline - time.monotonic()))
+                if stage.process.is_alive():
+                    stage.process.terminate()
+        for channel in self.channels.values():
+            if isinstance(channel, SharedRingBuffer):
+                channel.close()
+
+    def channel_stats(self):
+        stats = {}
+        for name, channel in self.channels.items():
+            if isinstance(channel, Channel):
+                stats[name] = channel.stats()
+            else:
+                stats[name] = {'policy': 'ring', 'capacity': channel.capacity, 'put': channel.write_index}
+        return stats
+
+    def install_signal_handlers(self):
+        def handle_terminate(signum, frame):
+            raise KeyboardInterrupt
+        signal.signal(signal.SIGTERM, handle_terminate)
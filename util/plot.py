@@ -1,5 +1,6 @@
+import math
 import sys
-from collections import deque
+import time
 
 import numpy as np
 from PyQt5.QtWidgets import (
@@ -8,46 +9,41 @@ from PyQt5.QtWidgets import (
 from PyQt5.QtCore import QTimer, Qt
 import pyqtgraph as pg
 from pyqtgraph import PlotWidget
-import asyncio
-from bleak import BleakClient
-import threading
+
+from backend.util.ble import HEART_RATE, IMU_X, BleManager
+from backend.util.pipeline import is_stop
+from backend.util.rolling_stats import RunningStats
+from backend.util.sample_batch import to_batch
+from backend.util.shm_ring import SharedRingBuffer
+from backend.util.trace import TraceBuffer, downsample_minmax
 
 
 class SignalPlotter(QWidget):
-    def __init__(self, raw_data_queue, rsp_data_queue, max_points=500):
+    def __init__(self, raw_data_queue, rsp_data_queue, harmony_queue=None, max_points=500, tracer=None, ble=None):
         super().__init__()
+        # 蓝牙设备在 BleManager 的后台线程中接收，GUI 定时器每个周期批量取出
+        self.ble = ble if ble is not None else BleManager()
+        self.tracer = tracer  # 可选的 StageTracer，记录从取到数据到完成重绘的延迟
         self.std_respiration_clean = None
         self.avg_respiration_clean = None
         self.std_respiration_rate = None
         self.avg_respiration_rate = None
-        self.respiration_rates = []
-        self.respiration_clean = []
+        # 会话期间的呼吸率/清洗后数值统计，O(1) 更新，内存不随会话时长增长
+        self.respiration_rate_stats = RunningStats()
+        self.respiration_clean_stats = RunningStats()
         self.queue = raw_data_queue
-        self.data = []
+        # 传入共享内存环时使用独立的读游标，不与分析进程争抢数据
+        self.reader = raw_data_queue.reader() if isinstance(raw_data_queue, SharedRingBuffer) else None
         self.max_points = max_points
-        self.consecutive_max = 5  # 用于跟踪连续100的计数器
-        self.consecutive_min = 5  # 用于跟踪连续0的计数器
-        self.waiting_for_opposite = False  # 用于跟踪是否在等待相反的值
+        self.trace = TraceBuffer(max_points)  # 预分配的环形缓冲区，保存最近 max_points 个点
         self.rsp_analysis_outcome = rsp_data_queue
-
-        # Initialize a deque to store the last 500 filtered data points
-        self.recent_filtered_values = deque(maxlen=500)
+        self.harmony_queue = harmony_queue  # harmony_analysis 阶段发布的 HarmonyResult
 
         # Other variables for tracking
-        self.avg_filtered_value = None
-        self.std_filtered_value = None
         self.recording_duration = 0
         self.sampling_interval = 50 / 1000  # 50 ms timer interval
-        self.respiration_rate_previous = None
-        self.harmony_updates = 0
-        self.harmony_reminders = 0
         self.reach_max_and_min = 0
 
-        # Timer for delayed update of respiration_rate_previous
-        self.update_rate_timer = QTimer()
-        self.update_rate_timer.setSingleShot(True)
-        self.update_rate_timer.timeout.connect(self.update_previous_respiration_rate)
-
         # Timer for reminders every 10 seconds
         self.reminder_timer = QTimer()
         self.reminder_timer.timeout.connect(self.check_reminder)
@@ -61,15 +57,6 @@ class SignalPlotter(QWidget):
         self.timer.timeout.connect(self.update_plot)
         self.timer.start(50)  # Update every 50 ms
 
-        # Initialize the loop and thread
-        self.loop = asyncio.new_event_loop()
-        self.thread = threading.Thread(target=self.start_asyncio_loop, args=(self.loop,), daemon=True)
-        self.thread.start()
-
-    def start_asyncio_loop(self, loop):
-        asyncio.set_event_loop(loop)
-        loop.run_forever()
-
     def init_ui(self):
         layout = QVBoxLayout()
 
@@ -209,168 +196,106 @@ class SignalPlotter(QWidget):
         else:
             self.massage_air_valve_switch.setText("Massage Air Valve: OFF")
 
-    async def connect_device(self, address, uuid, notification_handler):
-        async with BleakClient(address) as client:
-            await client.start_notify(uuid, notification_handler)
-            await asyncio.sleep(600)
-            await client.stop_notify(uuid)
-
     def connect_heart_rate_band(self, state):
         if state == Qt.Checked:
-            heart_rate_address = "D0:A4:69:B6:8F:A2"
-            heart_rate_uuid = "00002a37-0000-1000-8000-00805f9b34fb"
-            asyncio.run_coroutine_threadsafe(
-                self.connect_device(heart_rate_address, heart_rate_uuid, self.heart_rate_notification_handler),
-                self.loop
-            )
+            self.ble.connect('heart_rate')
+        else:
+            self.ble.disconnect('heart_rate')
 
     def connect_respiration_band(self, state):
         if state == Qt.Checked:
-            respiration_address = "f0:f5:bd:b5:6a:f6"
-            respiration_uuid = "FF01"
-            asyncio.run_coroutine_threadsafe(
-                self.connect_device(respiration_address, respiration_uuid, self.respiration_notification_handler),
-                self.loop
-            )
-
-    def heart_rate_notification_handler(self, sender, data):
-        heart_rate = data[1]
-        self.heart_rate_label.setText(f"Heart Rate: {heart_rate} BPM")
-        print(f"Heart Rate: {heart_rate} BPM")
-
-    def respiration_notification_handler(self, sender, data):
-        if len(data) > 1:
-            length = data[0]
-            if len(data) >= length + 1:
-                imu_data = data[1:length + 1]
-                x_acc = int.from_bytes(imu_data, byteorder='little', signed=False)
-                print(f"IMU X-Axis Data: {x_acc}")
-            else:
-                print(f"Received incomplete data: {data}")
+            self.ble.connect('respiration')
         else:
-            print(f"Received invalid data: {data}")
+            self.ble.disconnect('respiration')
 
-    def update_plot(self):
+    def update_ble_labels(self):
+        # 只显示本周期内每种数据的最新值，不逐包更新界面
+        samples = self.ble.buffer.drain()
+        if not len(samples):
+            return
+        heart_rate = samples['value'][samples['kind'] == HEART_RATE]
+        if len(heart_rate):
+            self.heart_rate_label.setText(f"Heart Rate: {heart_rate[-1]:.0f} BPM")
+        imu = samples['value'][samples['kind'] == IMU_X]
+        if len(imu):
+            self.imu_label.setText(f"IMU Data: {imu[-1]:.0f}")
+
+    def read_filtered_values(self):
+        # 一次取出本周期内到达的全部数据
+        if self.reader is not None:
+            _, values = self.reader.read()
+            return values
+        data_points = []
         while not self.queue.empty():
             data_point = self.queue.get()
+            if not is_stop(data_point):
+                data_points.append(data_point)
+        # 多通道数据只绘制第一个通道
+        return np.ascontiguousarray(to_batch(data_points).column(0))
 
-            if 'filtered_data' in data_point:
-                self.data.append(data_point['filtered_data'])
-                if len(self.data) > self.max_points:
-                    self.data.pop(0)
-                self.curve.setData(self.data)
-
-                filtered_value = data_point['filtered_data']
-                self.recent_filtered_values.append(filtered_value)
-
-                if len(self.recent_filtered_values) == self.recent_filtered_values.maxlen:
-                    self.avg_filtered_value = np.mean(self.recent_filtered_values)
-                    self.std_filtered_value = np.std(self.recent_filtered_values)
-
-                if not self.rsp_analysis_outcome.empty():
-                    rsp_signals, _ = self.rsp_analysis_outcome.get()
-                    if self.recording_duration < 0.2:
-                        self.respiration_rates.append(rsp_signals["RSP_Rate"].iloc[-1])
-                        self.respiration_clean.append(rsp_signals["RSP_Clean"].iloc[-1])
-                        self.avg_respiration_rate = np.mean(self.respiration_rates)
-                        self.std_respiration_rate = np.std(self.respiration_rates)
-                        self.recording_duration += self.sampling_interval
-
-                    elif self.recording_duration >= 0.2:
-                        self.avg_respiration_rate = np.mean(self.respiration_rates)
-                        self.std_respiration_rate = np.std(self.respiration_rates)
-                        self.avg_respiration_clean = np.mean(self.respiration_clean)
-                        self.std_respiration_clean = np.std(self.respiration_clean)
-                        respiration_rate = rsp_signals["RSP_Rate"].iloc[-1]
-                        self.respiration_rate_previous = respiration_rate
-                        self.rate_label.setText(f"Respiration Rate: {respiration_rate:.1f} breaths/min")
-                        self.update_rate_timer.start(10000)
-
-                if self.avg_filtered_value is not None and self.std_filtered_value is not None and self.std_filtered_value != 0:
-                    normalized_value = (filtered_value - self.avg_filtered_value) / self.std_filtered_value * 50 + 50
-                    normalized_value = max(0, min(100, normalized_value))
-                    self.respiration_strength_bar.setValue(int(normalized_value))
-
-                    self.update_bar_color_based_on_value(filtered_value)
-
-                    # 如果 normalized_value 为 100
-                    if normalized_value == 100:
-                        if self.waiting_for_opposite and self.consecutive_min >= 5:
-                            self.reach_max_and_min += 1
-                            print(f'Count when reach max and min: {self.reach_max_and_min}')
-                            self.update_harmony_bar()
-                            self.waiting_for_opposite = False  # 重置等待状态
-                            self.consecutive_min = 0  # 重置 min 计数器
-                        else:
-                            self.consecutive_max += 1
-                            self.waiting_for_opposite = True  # 设置等待状态
-                    # 如果 normalized_value 为 0
-                    elif normalized_value == 0:
-                        if self.waiting_for_opposite and self.consecutive_max >= 5:
-                            self.reach_max_and_min += 1
-                            print(f'Count when reach max and min: {self.reach_max_and_min}')
-                            self.update_harmony_bar()
-                            self.waiting_for_opposite = False  # 重置等待状态
-                            self.consecutive_max = 0  # 重置 max 计数器
-                        else:
-                            self.consecutive_min += 1
-                            self.waiting_for_opposite = True  # 设置等待状态
-
-    def update_previous_respiration_rate(self):
-        if self.respiration_rate_previous is not None:
-            self.respiration_rate_previous = float(self.rate_label.text().split()[-2])
-
-    def update_bar_color_based_on_value(self, filtered_value):
-        if self.avg_filtered_value is None or self.std_filtered_value is None:
-            return
-
-        distance_from_avg = abs(filtered_value - self.avg_filtered_value)
-        if distance_from_avg > self.std_filtered_value:
-            distance_from_avg = self.std_filtered_value
-
-        r = int((distance_from_avg / self.std_filtered_value) * 255)
-        g = 0
-        b = 255 - r
-        self.respiration_strength_bar.setStyleSheet(f"QProgressBar::chunk {{ background-color: rgb({r},{g},{b}); }}")
+    def redraw_trace(self):
+        # 每个定时周期只重绘一次；点数多于像素时按像素列做保留峰值的降采样
+        x, y = downsample_minmax(self.trace.view(), self.plot_widget.width())
+        self.curve.setData(x, y)
 
-    def update_harmony_bar(self):
-        if self.respiration_rate_previous is None:
+    def update_plot(self):
+        self.update_ble_labels()
+        self.update_respiration_rate()
+        self.update_harmony()
+        values = self.read_filtered_values()
+        if not len(values):
             return
-
-        current_rate = float(self.rate_label.text().split()[-2])
-        difference = abs(current_rate - self.respiration_rate_previous)
-        percentage_difference = (difference / self.respiration_rate_previous) * 100
-
-        if percentage_difference <= 5:
-            level = 100
-        elif percentage_difference <= 10:
-            level = 90
-        elif percentage_difference <= 20:
-            level = 80
-        elif percentage_difference <= 30:
-            level = 70
-        elif percentage_difference <= 40:
-            level = 60
-        elif percentage_difference <= 50:
-            level = 50
-        elif percentage_difference <= 60:
-            level = 40
-        elif percentage_difference <= 70:
-            level = 30
-        elif percentage_difference <= 80:
-            level = 20
-        elif percentage_difference <= 90:
-            level = 10
-        else:
-            level = 0
-
-        self.harmony_bar.setValue(level)
-        self.update_bar_color(self.harmony_bar, level)
-
-        if level <= 50:
-            self.reminder_label.setText("Breathing too fast!" if current_rate > self.respiration_rate_previous else "Breathing too slow!")
-        else:
-            self.reminder_label.setText("")
+        received = time.monotonic()
+        self.trace.extend(values)
+        self.redraw_trace()
+        if self.tracer is not None:
+            start = self.reader.cursor - len(values) if self.reader is not None else None
+            self.tracer.mark(len(values), received, start=start)
+
+    def update_respiration_rate(self):
+        # 取出本周期内到达的全部呼吸分析结果，只显示最新的呼吸率
+        while not self.rsp_analysis_outcome.empty():
+            outcome = self.rsp_analysis_outcome.get()
+            if is_stop(outcome):
+                continue
+            if self.recording_duration < 0.2:
+                # 呼吸率在窗口中还不足两个波谷时为 NaN，不计入统计
+                if math.isfinite(outcome.rate):
+                    self.respiration_rate_stats.update(outcome.rate)
+                if math.isfinite(outcome.clean):
+                    self.respiration_clean_stats.update(outcome.clean)
+                self.avg_respiration_rate = self.respiration_rate_stats.mean
+                self.std_respiration_rate = self.respiration_rate_stats.std
+                self.recording_duration += self.sampling_interval
+            else:
+                self.avg_respiration_rate = self.respiration_rate_stats.mean
+                self.std_respiration_rate = self.respiration_rate_stats.std
+                self.avg_respiration_clean = self.respiration_clean_stats.mean
+                self.std_respiration_clean = self.respiration_clean_stats.std
+                if math.isfinite(outcome.rate):
+                    self.rate_label.setText(f"Respiration Rate: {outcome.rate:.1f} breaths/min")
+                else:
+                    self.rate_label.setText("Respiration Rate: - breaths/min")
+
+    def update_harmony(self):
+        # 呼吸强度、周期和和谐度由 harmony_analysis 阶段计算，这里只显示最新结果
+        result = None
+        while self.harmony_queue is not None and not self.harmony_queue.empty():
+            item = self.harmony_queue.get()
+            if not is_stop(item):
+                result = item
+        if result is None:
+            return
+        if result.strength is not None:
+            self.respiration_strength_bar.setValue(int(result.strength))
+            r = int(result.deviation * 255)
+            self.respiration_strength_bar.setStyleSheet(
+                f"QProgressBar::chunk {{ background-color: rgb({r},0,{255 - r}); }}")
+        self.reach_max_and_min = result.cycles
+        if result.level is not None:
+            self.harmony_bar.setValue(result.level)
+            self.update_bar_color(self.harmony_bar, result.level)
+        self.reminder_label.setText(result.reminder)
 
     def check_reminder(self):
         if self.harmony_bar.value() <= 50:
@@ -385,11 +310,15 @@ class SignalPlotter(QWidget):
     def start_plotting(self):
         self.show()
 
+    def closeEvent(self, event):
+        self.ble.stop()
+        super().closeEvent(event)
+
 
-def start_signal_plotter(raw_data_queue, rsp_data_queue):
+def start_signal_plotter(raw_data_queue, rsp_data_queue, harmony_queue=None, tracer=None):
     try:
         app = QApplication(sys.argv)
-        plotter = SignalPlotter(raw_data_queue, rsp_data_queue)
+        plotter = SignalPlotter(raw_data_queue, rsp_data_queue, harmony_queue, tracer=tracer)
 
         # Start the GUI event loop
         plotter.start_plotting()
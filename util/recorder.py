@@ -0,0 +1,210 @@
+import json
+import os
+import struct
+import time
+import zlib
+
+import numpy as np
+
+MAGIC = b'SYNCREC1'
+CHUNK_MAGIC = b'CHNK'
+# 块头：魔数、行数、首末时间戳、负载字节数、CRC32、压缩标志
+CHUNK_HEADER = struct.Struct('<4sIddIIB3x')
+DEFAULT_COLUMNS = (('timestamp', '<f8'), ('value', '<f8'))
+COMPRESSIONS = (None, 'zlib')
+
+
+class SessionRecorder:
+    """Append-only writer for one recorded stream.
+
+    File layout: ``MAGIC``, a 4-byte length and a JSON header describing the
+    columns, then self-describing chunks. Each chunk is a ``CHUNK_HEADER``
+    followed by its columns stored one after another (optionally zlib
+    compressed as a whole). Rows are buffered in memory and written one
+    chunk at a time, so a crash loses at most the chunk being filled; a
+    half-written chunk at the end of the file is ignored by the reader.
+    The first column must be the timestamp and be non-decreasing.
+    """
+
+    def __init__(self, path, columns=DEFAULT_COLUMNS, chunk_rows=4096, compression=None, fsync=True):
+        if compression not in COMPRESSIONS:
+            raise ValueError(f"Unknown compression: {compression}")
+        self.path = path
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in columns]
+        self.chunk_rows = chunk_rows
+        self.compression = compression
+        self.fsync = fsync
+        self._buffers = [np.empty(chunk_rows, dtype=dtype) for _, dtype in self.columns]
+        self._rows = 0
+        self.chunks_written = 0
+        self.rows_written = 0
+
+        header = json.dumps({
+            'columns': [[name, dtype.str] for name, dtype in self.columns],
+            'compression': compression,
+            'created': time.time(),
+        }).encode('utf-8')
+        self.file = open(path, 'wb')
+        self.file.write(MAGIC + struct.pack('<I', len(header)) + header)
+        self.file.flush()
+
+    def append(self, *columns):
+        """Append rows given as one array per column (in column order)."""
+        if len(columns) != len(self.columns):
+            raise ValueError(f"Expected {len(self.columns)} columns, got {len(columns)}")
+        columns = [np.asarray(column) for column in columns]
+        total = len(columns[0])
+        offset = 0
+        while offset < total:
+            count = min(total - offset, self.chunk_rows - self._rows)
+            for buffer, column in zip(self._buffers, columns):
+                buffer[self._rows:self._rows + count] = column[offset:offset + count]
+            self._rows += count
+            offset += count
+            if self._rows == self.chunk_rows:
+                self.flush()
+
+    def flush(self):
+        if self._rows == 0:
+            return
+        payload = b''.join(buffer[:self._rows].tobytes() for buffer in self._buffers)
+        compressed = self.compression == 'zlib'
+        if compressed:
+            payload = zlib.compress(payload, 1)
+        timestamps = self._buffers[0]
+        header = CHUNK_HEADER.pack(CHUNK_MAGIC, self._rows, float(timestamps[0]), float(timestamps[self._rows - 1]),
+                                   len(payload), zlib.crc32(payload), compressed)
+        self.file.write(header + payload)
+        self.file.flush()
+        if self.fsync:
+            os.fsync(self.file.fileno())
+        self.chunks_written += 1
+        self.rows_written += self._rows
+        self._rows = 0
+
+    def close(self):
+        if self.file.closed:
+            return
+        self.flush()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class SessionReader:
+    """Random-access reader for files written by ``SessionRecorder``.
+
+    Opening the file only walks the chunk headers to build a time index
+    (``chunk_start``/``chunk_end``); ``read`` memory-maps the file and
+    touches only the chunks overlapping the requested time range.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.data = np.memmap(path, dtype=np.uint8, mode='r')
+        if bytes(self.data[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not a session recording")
+        header_length = struct.unpack('<I', bytes(self.data[8:12]))[0]
+        header = json.loads(bytes(self.data[12:12 + header_length]).decode('utf-8'))
+        self.columns = [(name, np.dtype(dtype)) for name, dtype in header['columns']]
+        self.compression = header['compression']
+        self.created = header.get('created')
+        self._build_index(12 + header_length)
+
+    def _build_index(self, offset):
+        offsets, rows, starts, ends, sizes, flags = [], [], [], [], [], []
+        size = len(self.data)
+        while offset + CHUNK_HEADER.size <= size:
+            magic, count, start, end, payload_size, crc, compressed = CHUNK_HEADER.unpack(
+                bytes(self.data[offset:offset + CHUNK_HEADER.size]))
+            payload_offset = offset + CHUNK_HEADER.size
+            if magic != CHUNK_MAGIC or payload_offset + payload_size > size:
+                break  # 写到一半的最后一个块
+            if payload_offset + payload_size == size and \
+                    zlib.crc32(self.data[payload_offset:payload_offset + payload_size]) != crc:
+                break
+            offsets.append(payload_offset)
+            rows.append(count)
+            starts.append(start)
+            ends.append(end)
+            sizes.append(payload_size)
+            flags.append(compressed)
+            offset = payload_offset + payload_size
+
+        self.chunk_offset = np.asarray(offsets, dtype=np.int64)
+        self.chunk_rows = np.asarray(rows, dtype=np.int64)
+        self.chunk_start = np.asarray(starts, dtype=np.float64)
+        self.chunk_end = np.asarray(ends, dtype=np.float64)
+        self.chunk_size = np.asarray(sizes, dtype=np.int64)
+        self.chunk_compressed = np.asarray(flags, dtype=bool)
+
+    def __len__(self):
+        return int(self.chunk_rows.sum())
+
+    @property
+    def time_range(self):
+        if not len(self.chunk_offset):
+            return None
+        return float(self.chunk_start[0]), float(self.chunk_end[-1])
+
+    def _chunk_columns(self, i):
+        rows = int(self.chunk_rows[i])
+        offset = int(self.chunk_offset[i])
+        if self.chunk_compressed[i]:
+            buffer = zlib.decompress(self.data[offset:offset + int(self.chunk_size[i])])
+            offset = 0
+        else:
+            buffer = self.data
+        columns = []
+        for _, dtype in self.columns:
+            columns.append(np.frombuffer(buffer, dtype=dtype, count=rows, offset=offset))
+            offset += rows * dtype.itemsize
+        return columns
+
+    def read(self, start=None, end=None):
+        """Return ``{column: array}`` for rows with ``start <= t < end``."""
+        start = -np.inf if start is None else start
+        end = np.inf if end is None else end
+        first = int(np.searchsorted(self.chunk_end, start, side='left'))
+        last = int(np.searchsorted(self.chunk_start, end, side='left'))
+
+        parts = [[] for _ in self.columns]
+        for i in range(first, last):
+            columns = self._chunk_columns(i)
+            timestamps = columns[0]
+            lo = np.searchsorted(timestamps, start, side='left')
+            hi = np.searchsorted(timestamps, end, side='left')
+            for part, column in zip(parts, columns):
+                part.append(column[lo:hi])
+        return {
+            name: np.concatenate(part) if part else np.empty(0, dtype=dtype)
+            for (name, dtype), part in zip(self.columns, parts)
+        }
+
+    def close(self):
+        del self.data
+
+
+def record_session(raw_ring, filtered_ring, directory, chunk_rows=4096, compression=None):
+    # 记录阶段：用独立读游标同时读取原始和滤波后的数据环，分别写入两个文件
+    os.makedirs(directory, exist_ok=True)
+    streams = [
+        (raw_ring.reader(), SessionRecorder(os.path.join(directory, 'raw.sync'), chunk_rows=chunk_rows,
+                                            compression=compression)),
+        (filtered_ring.reader(), SessionRecorder(os.path.join(directory, 'filtered.sync'), chunk_rows=chunk_rows,
+                                                 compression=compression)),
+    ]
+    try:
+        while not all(reader.exhausted for reader, _ in streams):
+            for i, (reader, recorder) in enumerate(streams):
+                # 只在第一个流上等待，第二个流有多少读多少
+                timestamps, values = reader.read(timeout=0.5 if i == 0 else 0.0)
+                if len(values):
+                    recorder.append(timestamps, values)
+    finally:
+        for _, recorder in streams:
+            recorder.close()
@@ -0,0 +1,133 @@
+import os
+import queue
+import time
+from multiprocessing import Queue
+
+import numpy as np
+
+from backend.util.channel import is_stop
+from backend.util.frame_parser import decode_frames
+from backend.util.recorder import MAGIC, SessionReader
+from backend.util.sample_batch import SampleBatch
+from backend.util.shm_ring import SharedRingBuffer
+from backend.util.text_cache import TextRecording
+
+
+def load_recording(path, column=0, sampling_rate=None):
+    """Load ``(timestamps, values)`` from a recorded session.
+
+    Supported formats: ``SessionRecorder`` files, raw HK serial byte dumps
+    (``.bin``/``.raw``) and the comma-separated text recordings used by
+    ``util/test/analysis.py`` (through the columnar cache of
+    ``backend.util.text_cache``). Formats without timestamps are timed with
+    ``sampling_rate``, which is then required (``ValueError`` otherwise);
+    ``column`` selects the text column by index or name.
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(len(MAGIC))
+    if magic == MAGIC:
+        reader = SessionReader(path)
+        data = reader.read()
+        reader.close()
+        return data['timestamp'], data['value'].astype(np.float64)
+
+    if sampling_rate is None:
+        raise ValueError(f"{path} has no timestamps, the sampling rate must be given")
+    if os.path.splitext(path)[1].lower() in ('.bin', '.raw'):
+        values = decode_frames(path).values
+    else:
+        values = TextRecording(path).column(column)
+    return np.arange(len(values)) / sampling_rate, values
+
+
+class ReplaySource:
+    """Drop-in replacement for ``SerialDevice`` that plays back a recording.
+
+    ``collect_data`` has the same signature and output as
+    ``SerialDevice.collect_data``: batches are written to a
+    ``SharedRingBuffer`` or put on a queue as ``SampleBatch`` blocks, with
+    timestamps in seconds since the start of the recording.
+    ``speed`` is the playback rate (1.0 = real time, 10.0 = ten times
+    faster); ``None`` replays as fast as the consumers accept data.
+    ``sampling_rate`` times recordings without timestamps and must match
+    the rate the pipeline is configured for (``REPLAY_SAMPLING_RATE`` in
+    main.py).
+    """
+
+    def __init__(self, path, speed=1.0, column=0, sampling_rate=None, batch_interval=0.02, loop=False,
+                 data_queue=None, ring=None):
+        self.path = path
+        self.speed = speed
+        self.column = column
+        self.sampling_rate = sampling_rate
+        self.batch_interval = batch_interval  # 每批数据覆盖的录制时长（秒）
+        self.loop = loop
+        self.data_queue = data_queue if data_queue is not None else Queue()
+        self.ring = ring
+        self.samples_sent = 0
+        self.elapsed = 0.0
+
+    def emit(self, timestamps, values):
+        if self.ring is not None:
+            self.ring.write(timestamps, values)
+        else:
+            self.data_queue.put(SampleBatch.from_arrays(timestamps, values))
+        self.samples_sent += len(values)
+
+    def collect_data(self, output=None, stop_event=None, tracer=None):
+        if isinstance(output, SharedRingBuffer):
+            self.ring = output
+        elif output is not None:
+            self.data_queue = output
+
+        try:
+            timestamps, values = load_recording(self.path, self.column, self.sampling_rate)
+        except ValueError as e:
+            print(f"Error loading {self.path}: {e}")
+            return
+        if not len(values):
+            print(f"Nothing to replay in {self.path}")
+            return
+        timestamps = timestamps - timestamps[0]
+        # 按录制时间每 batch_interval 秒切成一批，bounds 为各批的结束位置
+        edges = np.arange(1, int(timestamps[-1] / self.batch_interval) + 2) * self.batch_interval
+        bounds = np.searchsorted(timestamps, edges, side='right')
+        # 循环播放时两遍之间相隔一个采样间隔
+        spacing = float(np.median(np.diff(timestamps))) if len(timestamps) > 1 else self.batch_interval
+
+        start_time = time.monotonic()
+        offset = 0.0  # 循环播放时累加的时间偏移
+        try:
+            while stop_event is None or not stop_event.is_set():
+                begin = 0
+                for end in bounds:
+                    if stop_event is not None and stop_event.is_set():
+                        break
+                    if end <= begin:
+                        continue
+                    if self.speed:
+                        # 按录制时间安排发送时刻
+                        delay = start_time + (offset + timestamps[end - 1]) / self.speed - time.monotonic()
+                        if delay > 0:
+                            time.sleep(delay)
+                    received = time.monotonic()
+                    self.emit(timestamps[begin:end] + offset, values[begin:end])
+                    if tracer is not None:
+                        tracer.mark(end - begin, received)
+                    begin = end
+                if not self.loop:
+                    break
+                offset += timestamps[-1] + spacing
+        finally:
+            self.elapsed = time.monotonic() - start_time
+            rate = self.samples_sent / self.elapsed if self.elapsed > 0 else float('inf')
+            print(f"Replayed {self.samples_sent} samples in {self.elapsed:.2f} s ({rate:.0f} samples/s)")
+            if self.ring is not None:
+                self.ring.mark_closed()
+
+    def get_data_from_queue(self, timeout=None):
+        try:
+            data = self.data_queue.get(timeout=timeout) if timeout is not None else self.data_queue.get_nowait()
+        except queue.Empty:
+            return None
+        return None if is_stop(data) else data
@@ -0,0 +1,195 @@
+import math
+
+import numpy as np
+
+
+class RollingStats:
+    """Mean and standard deviation of the last ``window`` values.
+
+    Each ``update`` is O(1): the value leaving the window is removed with
+    the inverse Welford step. The sums are rebuilt from the window every
+    ``10 * window`` updates to stop rounding error from accumulating.
+    ``update_block`` does the same for a whole block with numpy and returns
+    the statistics after every value. ``std`` is the population standard
+    deviation, like ``np.std``.
+    """
+
+    def __init__(self, window):
+        self.window = window
+        self.values = np.zeros(window, dtype=np.float64)
+        self.count = 0
+        self.pos = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._updates = 0
+
+    @property
+    def full(self):
+        return self.count == self.window
+
+    @property
+    def variance(self):
+        return max(self._m2 / self.count, 0.0) if self.count else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def update(self, value):
+        value = float(value)
+        if self.count < self.window:
+            self.count += 1
+            delta = value - self.mean
+            self.mean += delta / self.count
+            self._m2 += delta * (value - self.mean)
+        else:
+            # 用新值替换窗口中最旧的值
+            old = self.values[self.pos]
+            new_mean = self.mean + (value - old) / self.window
+            self._m2 += (value - old) * (value - new_mean + old - self.mean)
+            self.mean = new_mean
+        self.values[self.pos] = value
+        self.pos = (self.pos + 1) % self.window
+
+        self._updates += 1
+        if self._updates >= 10 * self.window:
+            self._recompute()
+
+    def extend(self, values):
+        for value in np.asarray(values, dtype=np.float64).tolist():
+            self.update(value)
+
+    def update_block(self, values):
+        """Add a block of values; return ``(mean, std, count)`` arrays with
+        the statistics of the window after each value, computed at once
+        from prefix sums."""
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return values, values, np.empty(0, dtype=np.int64)
+        # 窗口中已有的值按时间顺序排在新数据之前
+        history = self.values[:self.count] if self.count < self.window else np.roll(self.values, -self.pos)
+        data = np.concatenate((history, values))
+        # 以第一个值为基准的前缀和，减小大数相减的舍入误差
+        base = data[0]
+        shifted = data - base
+        sums = np.concatenate(([0.0], np.cumsum(shifted)))
+        squares = np.concatenate(([0.0], np.cumsum(shifted * shifted)))
+        ends = np.arange(len(history) + 1, len(data) + 1)
+        starts = np.maximum(ends - self.window, 0)
+        counts = ends - starts
+        mean = (sums[ends] - sums[starts]) / counts
+        variance = np.maximum((squares[ends] - squares[starts]) / counts - mean * mean, 0.0)
+
+        tail = data[-self.window:]
+        self.count = len(tail)
+        self.values[:self.count] = tail
+        self.pos = self.count % self.window
+        self._recompute()
+        return mean + base, np.sqrt(variance), counts
+
+    def _recompute(self):
+        window = self.values[:self.count] if self.count < self.window else self.values
+        self.mean = float(np.mean(window))
+        self._m2 = float(np.sum((window - self.mean) ** 2))
+        self._updates = 0
+
+    def reset(self):
+        self.count = 0
+        self.pos = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+        self._updates = 0
+
+
+class RunningStats:
+    """Mean and standard deviation of every value seen so far (Welford),
+    in constant memory."""
+
+    def __init__(self):
+        self.count = 0
+        self.mean = 0.0
+        self._m2 = 0.0
+
+    @property
+    def variance(self):
+        return self._m2 / self.count if self.count else 0.0
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def update(self, value):
+        value = float(value)
+        self.count += 1
+        delta = value - self.mean
+        self.mean += delta / self.count
+        self._m2 += delta * (value - self.mean)
+
+
+class EwmStats:
+    """Exponentially weighted mean and standard deviation.
+
+    ``alpha`` is the weight of the newest value; ``from_span`` and
+    ``from_halflife`` convert a span (``alpha = 2 / (span + 1)``, as in
+    pandas) or a half-life in samples. The first value starts the mean with
+    zero variance. ``update_block`` applies the same recursion to a whole
+    block with ``lfilter`` and returns the statistics after every value.
+    """
+
+    def __init__(self, alpha):
+        if not 0.0 < alpha <= 1.0:
+            raise ValueError("alpha must be in (0, 1]")
+        self.alpha = alpha
+        self.count = 0
+        self.mean = 0.0
+        self.variance = 0.0
+
+    @classmethod
+    def from_span(cls, span):
+        return cls(2.0 / (span + 1.0))
+
+    @classmethod
+    def from_halflife(cls, halflife):
+        return cls(1.0 - 0.5 ** (1.0 / halflife))
+
+    @property
+    def std(self):
+        return math.sqrt(self.variance)
+
+    def update(self, value):
+        value = float(value)
+        if self.count == 0:
+            self.mean = value
+        else:
+            delta = value - self.mean
+            self.mean += self.alpha * delta
+            self.variance = (1.0 - self.alpha) * (self.variance + self.alpha * delta * delta)
+        self.count += 1
+
+    def update_block(self, values):
+        """Add a block of values; return ``(mean, std)`` arrays with the
+        statistics after each value."""
+        from scipy.signal import lfilter  # 只有按块更新时才需要 scipy
+
+        values = np.asarray(values, dtype=np.float64)
+        if not len(values):
+            return values, values
+        first = 0
+        if self.count == 0:
+            self.mean = float(values[0])
+            first = 1
+        alpha, decay = self.alpha, 1.0 - self.alpha
+        rest = values[first:]
+        # mean[t] = decay * mean[t-1] + alpha * x[t]，以上一次的均值为初值
+        mean, _ = lfilter([alpha], [1.0, -decay], rest, zi=[decay * self.mean])
+        # variance[t] = decay * (variance[t-1] + alpha * delta[t]^2)，delta 相对于前一个均值
+        previous = np.concatenate(([self.mean], mean[:-1]))
+        delta = rest - previous
+        variance, _ = lfilter([decay * alpha], [1.0, -decay], delta * delta, zi=[decay * self.variance])
+        if first:
+            mean = np.concatenate(([self.mean], mean))
+            variance = np.concatenate(([0.0], variance))
+        self.mean = float(mean[-1])
+        self.variance = float(variance[-1])
+        self.count += len(values)
+        return mean, np.sqrt(variance)
@@ -1,47 +1,81 @@
-import multiprocessing
+import time
+
 import numpy as np
 
-from backend.util.neurokit2 import rsp_process
+from backend.util.pipeline import read_filtered_block
+from backend.util.rsp_incremental import IncrementalRspAnalyzer
+from backend.util.rsp_result import RspResult
+from backend.util.shm_ring import RingReader, SharedRingBuffer
+
+WINDOW_SIZE = 1500
+STEP_SIZE = 300
 
 
-def signal_analysis(processed_data_queue, rsp_data_queue):
-    window_size = 1500
-    step_size = 300
-    data_buffer = []
+def signal_analysis(processed_data_queue, rsp_data_queue, *extra_queues, window=WINDOW_SIZE, step=STEP_SIZE,
+                    sampling_rate=50, tracer=None, channel=0, full_output=False):
+    # 在本进程中对重叠窗口运行 rsp_process；输入可以是共享内存环或队列
+    # channel: 多通道数据中用于呼吸分析的通道（序号或名称）
+    # 每个窗口发布一个 RspResult；full_output 为 True 时附带完整的 rsp_process 输出
+    # extra_queues: 其他需要同一份分析结果的下游队列（例如和谐度分析）
+    # 窗口分析依赖 pandas 和 scipy.interpolate，只在运行本阶段时导入，增量分析阶段不需要它们
+    from backend.util.rsp_result import ReportedEvents, window_result
+    from backend.util.rsp_window import rsp_process_window
 
-    while True:
-        # 如果队列中有数据，读取并添加到缓冲区
-        if not processed_data_queue.empty():
-            data_point = processed_data_queue.get()
+    source = processed_data_queue
+    if isinstance(processed_data_queue, SharedRingBuffer):
+        source = processed_data_queue.reader()
+    data_buffer = np.empty(0)
+    window_start = 0  # data_buffer[0] 的绝对样本序号
+    reported = ReportedEvents(sampling_rate)
 
-            # 确保数据点是数值类型
-            # if isinstance(data_point, (int, float)):
-            data_buffer.append(data_point['filtered_data'])
-            # print(data_point['filtered_data'])
-        # 当缓冲区中的数据量达到window_size时进行处理
-        if len(data_buffer) >= window_size:
-            # 使用NeuroKit2进行呼吸信号分析
+    stopped = False
+    while not stopped:
+        # 阻塞等待新数据，一次取出已有的全部数据点
+        values, stopped = read_filtered_block(source, channel=channel)
+        received = time.monotonic()
+        data_buffer = np.concatenate((data_buffer, values))
+
+        # 当缓冲区中的数据量达到窗口长度时进行处理
+        while len(data_buffer) >= window:
+            # 与 NeuroKit2 的 rsp_process 结果相同，但滤波器设计等与数据无关的准备工作只做一次
             try:
-                rsp_signals, info = rsp_process(rsp_signal=np.array(data_buffer[:window_size]), sampling_rate=50,
-                                                   report = None,)
+                rsp_signals, info = rsp_process_window(data_buffer[:window], sampling_rate=sampling_rate)
                 # 将分析结果放入rsp_data_queue
-                rsp_data_queue.put((rsp_signals, info))
+                result = reported.trim(window_result(rsp_signals, info, window_start, full_output))
+                for output in (rsp_data_queue,) + extra_queues:
+                    output.put(result)
 
             except Exception as e:
                 print(f"Error during rsp_process: {e}")
 
-            # 滑动窗口，保留最后step_size的数据
-            data_buffer = data_buffer[step_size:]
+            # 滑动窗口，丢掉最旧的 step 个数据
+            data_buffer = data_buffer[step:]
+            window_start += step
+
+        if tracer is not None and len(values):
+            start = source.cursor - len(values) if isinstance(source, RingReader) else None
+            tracer.mark(len(values), received, start=start)
 
-        # 如果队列为空且缓冲区数据不足，则继续等待
-        else:
-            continue
 
+def incremental_signal_analysis(processed_data_queue, rsp_data_queue, *extra_queues, sampling_rate=50, tracer=None,
+                                channel=0):
+    # 增量分析：每个样本只处理一次，每确认一个波峰或波谷就发布一次结果
+    # extra_queues: 其他需要同一份分析结果的下游队列（例如和谐度分析）
+    source = processed_data_queue
+    if isinstance(processed_data_queue, SharedRingBuffer):
+        source = processed_data_queue.reader()
+    analyzer = IncrementalRspAnalyzer(sampling_rate)
 
-def start_rsp_analysis(processed_data_queue, rsp_data_queue):
-    process = multiprocessing.Process(
-        target=signal_analysis,
-        args=(processed_data_queue, rsp_data_queue),
-        daemon=True
-    )
-    process.start()
+    stopped = False
+    while not stopped:
+        values, stopped = read_filtered_block(source, channel=channel)
+        received = time.monotonic()
+        if analyzer.process(values) and analyzer.rate is not None:
+            amplitude = np.nan if analyzer.amplitude is None else analyzer.amplitude
+            result = RspResult(analyzer.sample_index, analyzer.rate, amplitude, analyzer.phase, analyzer.clean,
+                               analyzer.quality, analyzer.peaks, analyzer.troughs)
+            for output in (rsp_data_queue,) + extra_queues:
+                output.put(result)
+        if tracer is not None and len(values):
+            start = source.cursor - len(values) if isinstance(source, RingReader) else None
+            tracer.mark(len(values), received, start=start)
@@ -0,0 +1,158 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from backend.util.pipeline import read_filtered_block
+from backend.util.rsp_analysis import STEP_SIZE, WINDOW_SIZE
+from backend.util.rsp_result import ReportedEvents, window_result
+from backend.util.rsp_window import rsp_process_window
+from backend.util.shm_ring import RingReader, SharedRingBuffer
+
+RESULT_POLL_INTERVAL = 0.02  # 有窗口在分析时，等待新数据的最长时间（秒），以便及时发出结果
+
+
+def analyze_window(values, sampling_rate, start, full_output=False):
+    # 在进程池的工作进程中运行；每个工作进程各自缓存滤波器设计
+    # 在工作进程中压缩结果，只有 RspResult 需要传回主进程
+    rsp_signals, info = rsp_process_window(values, sampling_rate=sampling_rate)
+    return window_result(rsp_signals, info, start, full_output)
+
+
+class WindowScheduler:
+    """Cuts overlapping analysis windows from a sample stream and runs them
+    on an executor, delivering the results in window order.
+
+    Window ``k`` covers samples ``[k * step, k * step + window)``. Ready
+    windows are submitted as long as fewer than ``max_pending`` are in
+    flight (default: two per worker). When more windows are ready than
+    there is room for, the analysis has fallen behind: the oldest ready
+    windows are skipped and counted in ``skipped``, so the newest data is
+    always analyzed next and the backlog cannot grow. Results come back in
+    submission order, i.e. by window index, however the workers finish;
+    failed windows are counted in ``failed`` and reported like in
+    ``signal_analysis``.
+    """
+
+    def __init__(self, executor, workers, window=WINDOW_SIZE, step=STEP_SIZE, sampling_rate=50, max_pending=None,
+                 full_output=False):
+        if step <= 0 or window <= 0:
+            raise ValueError("window and step must be positive")
+        self.executor = executor
+        self.window = window
+        self.step = step
+        self.sampling_rate = sampling_rate
+        self.max_pending = max_pending or 2 * workers
+        self.full_output = full_output
+        self.buffer = np.empty(0)
+        self.buffer_start = 0  # buffer[0] 的绝对样本序号
+        self.next_index = 0  # 下一个要提交的窗口序号
+        self.pending = deque()  # 按窗口序号排列的 (序号, future)
+        self.submitted = 0
+        self.delivered = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def feed(self, values):
+        """Add samples, submit what is ready and return the results that
+        can be delivered in order, as ``(index, RspResult)``."""
+        if len(values):
+            self.buffer = np.concatenate((self.buffer, values))
+            self._submit()
+        return self.collect()
+
+    def _ready(self):
+        end = self.buffer_start + len(self.buffer)
+        return max(0, (end - self.window) // self.step - self.next_index + 1)
+
+    def _submit(self):
+        ready = self._ready()
+        room = self.max_pending - len(self.pending)
+        if ready > room > 0:
+            # 分析跟不上：丢弃最旧的窗口，只保留最新的 room 个
+            self.skipped += ready - room
+            self.next_index += ready - room
+            ready = room
+        for _ in range(min(ready, max(room, 0))):
+            start = self.next_index * self.step - self.buffer_start
+            values = self.buffer[start:start + self.window].copy()
+            future = self.executor.submit(analyze_window, values, self.sampling_rate, self.next_index * self.step,
+                                          self.full_output)
+            self.pending.append((self.next_index, future))
+            self.next_index += 1
+            self.submitted += 1
+        # 只保留下一个窗口需要的数据
+        keep = min(self.next_index * self.step, self.buffer_start + len(self.buffer))
+        if keep > self.buffer_start:
+            self.buffer = self.buffer[keep - self.buffer_start:]
+            self.buffer_start = keep
+
+    def collect(self, wait=False):
+        """Return the finished results at the head of the window order;
+        with ``wait`` block until every submitted window is done."""
+        results = []
+        while self.pending and (wait or self.pending[0][1].done()):
+            index, future = self.pending.popleft()
+            try:
+                results.append((index, future.result()))
+                self.delivered += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Error during rsp_process: {e}")
+        if results:
+            self._submit()  # 腾出的位置立即用于已经就绪的窗口
+        return results
+
+    def finish(self):
+        # 数据结束：等待所有已提交的窗口；不完整的最后一个窗口不分析
+        results = []
+        while self.pending:
+            results.extend(self.collect(wait=True))
+        return results
+
+
+def pooled_signal_analysis(processed_data_queue, rsp_data_queue, *extra_queues, workers=None, window=WINDOW_SIZE,
+                           step=STEP_SIZE, sampling_rate=50, max_pending=None, tracer=None, channel=0,
+                           full_output=False):
+    """Pipeline stage: windowed ``rsp_process`` analysis on a process pool.
+
+    Publishes an ``RspResult`` per window like ``signal_analysis``, in
+    window order; the workers build the records, so only those are pickled
+    back (plus the full ``rsp_process`` output with ``full_output``, where
+    ``info['window_index']`` and ``info['window_start']`` identify the
+    window); ``extra_queues`` receive the same records. ``workers``
+    defaults to the number of CPUs. The stage must be added with
+    ``daemon=False`` so it can start the pool.
+    """
+    source = processed_data_queue
+    if isinstance(processed_data_queue, SharedRingBuffer):
+        source = processed_data_queue.reader()
+    workers = workers or os.cpu_count() or 1
+
+    with ProcessPoolExecutor(workers) as executor:
+        scheduler = WindowScheduler(executor, workers, window, step, sampling_rate, max_pending, full_output)
+        reported = ReportedEvents(sampling_rate)
+
+        def publish(results):
+            for index, result in results:
+                if result.info is not None:
+                    result.info['window_index'] = index
+                    result.info['window_start'] = index * step
+                result = reported.trim(result)
+                for output in (rsp_data_queue,) + extra_queues:
+                    output.put(result)
+
+        stopped = False
+        while not stopped:
+            timeout = RESULT_POLL_INTERVAL if scheduler.pending else 0.5
+            values, stopped = read_filtered_block(source, timeout=timeout, channel=channel)
+            received = time.monotonic()
+            publish(scheduler.feed(values))
+            if tracer is not None and len(values):
+                start = source.cursor - len(values) if isinstance(source, RingReader) else None
+                tracer.mark(len(values), received, start=start)
+        publish(scheduler.finish())
+
+    print(f"Windowed analysis: {scheduler.delivered} windows, {scheduler.skipped} skipped, {scheduler.failed} failed")
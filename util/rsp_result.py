@@ -0,0 +1,93 @@
+import numpy as np
+
+INSPIRATION = 1  # 与 rsp_phase 一致：波谷之后为吸气
+EXPIRATION = 0  # 波峰之后为呼气
+EVENT_TOLERANCE = 0.2  # 重叠窗口中位置相差不超过此时间（秒）的极值视为同一个
+
+
+def breath_regularity(intervals):
+    """Quality of the breathing estimate from consecutive breath intervals:
+    ``1 - std / mean``, clipped to 0-1 (1 for perfectly regular breathing).
+    NaN with fewer than two intervals."""
+    intervals = np.asarray(intervals, dtype=np.float64)
+    if len(intervals) < 2:
+        return float('nan')
+    mean = intervals.mean()
+    if mean <= 0:
+        return float('nan')
+    return float(np.clip(1.0 - intervals.std() / mean, 0.0, 1.0))
+
+
+class RspResult:
+    """What the respiration analysis stages publish per update.
+
+    A fixed set of numbers about the newest sample instead of the whole
+    ``rsp_process`` output: ``sample_index`` is the stream position the
+    result refers to (number of samples analyzed), ``rate`` in
+    breaths/min, ``amplitude``, ``phase`` (``INSPIRATION``/``EXPIRATION``),
+    ``clean`` the latest cleaned value and ``quality`` the
+    ``breath_regularity`` of the recent breaths; unknown values are NaN.
+    ``peaks`` and ``troughs`` hold the absolute positions of the extrema
+    first reported in this update. ``signals``/``info`` carry the full
+    ``rsp_process`` output only when the stage was asked for it
+    (``full_output=True``) and are None otherwise.
+    """
+
+    __slots__ = ('sample_index', 'rate', 'amplitude', 'phase', 'clean', 'quality', 'peaks', 'troughs', 'signals',
+                 'info')
+
+    def __init__(self, sample_index, rate, amplitude, phase, clean, quality, peaks=None, troughs=None, signals=None,
+                 info=None):
+        self.sample_index = sample_index
+        self.rate = rate
+        self.amplitude = amplitude
+        self.phase = phase
+        self.clean = clean
+        self.quality = quality
+        self.peaks = np.empty(0, dtype=np.int64) if peaks is None else np.asarray(peaks, dtype=np.int64)
+        self.troughs = np.empty(0, dtype=np.int64) if troughs is None else np.asarray(troughs, dtype=np.int64)
+        self.signals = signals
+        self.info = info
+
+    def __repr__(self):
+        return (f"RspResult(sample_index={self.sample_index}, rate={self.rate:.2f}, quality={self.quality:.2f}, "
+                f"peaks={len(self.peaks)}, troughs={len(self.troughs)})")
+
+
+def window_result(signals, info, start, full_output=False):
+    """Summarize the ``rsp_process`` output of the window beginning at
+    stream position ``start``; peaks and troughs are made absolute."""
+    peaks = np.asarray(info['RSP_Peaks'], dtype=np.int64) + start
+    troughs = np.asarray(info['RSP_Troughs'], dtype=np.int64) + start
+    phase = float('nan')
+    if len(peaks) or len(troughs):
+        # RSP_Phase 在最后一个极值之后为 NaN，当前相位由最后一个极值决定
+        last_peak = peaks[-1] if len(peaks) else -1
+        last_trough = troughs[-1] if len(troughs) else -1
+        phase = EXPIRATION if last_peak > last_trough else INSPIRATION
+    return RspResult(start + len(signals), float(signals['RSP_Rate'].iat[-1]),
+                     float(signals['RSP_Amplitude'].iat[-1]), phase, float(signals['RSP_Clean'].iat[-1]),
+                     breath_regularity(np.diff(troughs)), peaks, troughs,
+                     signals if full_output else None, info if full_output else None)
+
+
+class ReportedEvents:
+    """Drops the peaks and troughs already published by an earlier,
+    overlapping window, so each extremum is reported once. Near the window
+    edges the same extremum can move by a sample or two between windows,
+    so anything within ``EVENT_TOLERANCE`` of the last reported one is
+    considered already reported."""
+
+    def __init__(self, sampling_rate=50):
+        self.tolerance = int(EVENT_TOLERANCE * sampling_rate)
+        self.last_peak = -1
+        self.last_trough = -1
+
+    def trim(self, result):
+        result.peaks = result.peaks[result.peaks > self.last_peak + self.tolerance]
+        result.troughs = result.troughs[result.troughs > self.last_trough + self.tolerance]
+        if len(result.peaks):
+            self.last_peak = int(result.peaks[-1])
+        if len(result.troughs):
+            self.last_trough = int(result.troughs[-1])
+        return result
@@ -0,0 +1,269 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from scipy.interpolate import PchipInterpolator
+from scipy.signal import butter, hilbert, iirfilter, sosfilt, sosfilt_zi
+
+SETUP_CACHE_SIZE = 32  # 最多缓存多少组 (采样率, 方法, 窗口长度) 的准备结果
+METHODS = ('khodadad', 'khodadad2018')
+RVT_BOUNDARIES = (2.0, 1 / 30)  # 呼吸频率的上下限（Hz），与 rsp_rvt 的默认值一致
+RVT_ITERATIONS = 10
+
+
+class ZeroPhaseFilter:
+    """``sosfiltfilt`` with the coefficients and the initial state computed
+    once. Calling it gives the same result as
+    ``scipy.signal.sosfiltfilt(sos, x)`` (odd padding of ``3 * ntaps``)."""
+
+    def __init__(self, sos):
+        self.sos = sos
+        ntaps = 2 * len(sos) + 1
+        ntaps -= min((sos[:, 2] == 0).sum(), (sos[:, 5] == 0).sum())
+        self.edge = 3 * ntaps
+        self.zi = sosfilt_zi(sos)
+
+    def __call__(self, x):
+        edge = self.edge
+        if len(x) <= edge:
+            raise ValueError(f"The length of the input vector x must be greater than padlen, which is {edge}.")
+        ext = np.concatenate((2 * x[:1] - x[edge:0:-1], x, 2 * x[-1:] - x[-2:-(edge + 2):-1]))
+        y, _ = sosfilt(self.sos, ext, zi=self.zi * ext[0])
+        y, _ = sosfilt(self.sos, y[::-1], zi=self.zi * y[-1])
+        return y[::-1][edge:-edge]
+
+
+class WindowSetup:
+    """Everything ``rsp_process`` recomputes on every call although it only
+    depends on the sampling rate, the method and the window length: the
+    cleaning band-pass and the two RVT low-passes (design and initial
+    state) and the sample grid the breath features are interpolated on."""
+
+    def __init__(self, sampling_rate, method, window):
+        self.sampling_rate = sampling_rate
+        self.method = method
+        self.window = window
+        self.cleaner = ZeroPhaseFilter(butter(2, [0.05, 3], btype='bandpass', output='sos', fs=sampling_rate))
+        self.rvt_pad = int(np.ceil(10 * sampling_rate))
+        self.rvt_phase_filter = ZeroPhaseFilter(
+            iirfilter(N=10, Wn=0.75, btype='lowpass', analog=False, output='sos', fs=sampling_rate))
+        self.rvt_rate_filter = ZeroPhaseFilter(
+            iirfilter(N=10, Wn=0.2, btype='lowpass', analog=False, output='sos', fs=sampling_rate))
+        self.grid = np.arange(window)
+
+
+@lru_cache(maxsize=SETUP_CACHE_SIZE)
+def window_setup(sampling_rate, method='khodadad2018', window=1500):
+    """Return the cached ``WindowSetup`` for these parameters; the least
+    recently used entry is dropped beyond ``SETUP_CACHE_SIZE``."""
+    method = method.lower()
+    if method not in METHODS:
+        raise ValueError(f"Unsupported rsp method {method!r}, expected one of {METHODS}")
+    return WindowSetup(sampling_rate, method, window)
+
+
+def rsp_process_window(rsp_signal, sampling_rate=1000, method='khodadad2018'):
+    """Drop-in replacement for neurokit2's ``rsp_process`` (khodadad2018
+    cleaning and peaks, harrison2021 RVT) for repeated windows.
+
+    The window-invariant setup comes from ``window_setup``, so every call
+    only does the work that depends on the data. Returns the same
+    ``(signals, info)`` columns and values as ``rsp_process``, raises where
+    it raises and does not emit its warnings.
+    """
+    rsp_signal = np.asarray(rsp_signal)
+    setup = window_setup(sampling_rate, method, len(rsp_signal))
+    clean = _clean(setup, rsp_signal)
+    peaks, troughs = _find_peaks(clean)
+    phase, completion = _phase(peaks, troughs, len(clean))
+    amplitude = _amplitude(setup, clean, peaks, troughs)
+    rate = _rate(setup, troughs)
+    peak_trough, rise_decay = _symmetry(setup, clean, peaks, troughs)
+    rvt = _rvt(setup, clean)
+
+    peak_signal = np.zeros(len(clean), dtype=np.int64)
+    peak_signal[peaks] = 1
+    trough_signal = np.zeros(len(clean), dtype=np.int64)
+    trough_signal[troughs] = 1
+    signals = pd.DataFrame({
+        'RSP_Raw': rsp_signal,
+        'RSP_Clean': clean,
+        'RSP_Amplitude': amplitude,
+        'RSP_Rate': rate,
+        'RSP_RVT': rvt,
+        'RSP_Phase': phase,
+        'RSP_Phase_Completion': completion,
+        'RSP_Symmetry_PeakTrough': peak_trough,
+        'RSP_Symmetry_RiseDecay': rise_decay,
+        'RSP_Peaks': peak_signal,
+        'RSP_Troughs': trough_signal,
+    })
+    return signals, {'RSP_Peaks': peaks, 'RSP_Troughs': troughs, 'sampling_rate': sampling_rate}
+
+
+def _fill(values, valid):
+    # 用前一个有效值填充无效位置；开头的无效位置保持原值
+    index = np.where(valid, np.arange(len(values)), 0)
+    np.maximum.accumulate(index, out=index)
+    return values[index]
+
+
+def _clean(setup, rsp_signal):
+    missing = np.isnan(rsp_signal)
+    if not missing.any():
+        return setup.cleaner(rsp_signal)
+    # 与 rsp_clean 相同：缺失值向前填充，开头仍缺失的部分用第一个有效值代替并在结果中置为 NaN
+    filled = _fill(rsp_signal, ~missing)
+    leading = np.isnan(filled)
+    filled[leading] = filled[np.argmin(leading)]
+    clean = setup.cleaner(filled)
+    clean[leading] = np.nan
+    return clean
+
+
+def _find_peaks(clean, amplitude_min=0.3):
+    # khodadad2018：过零点之间的极值，去掉幅度过小的，再保证波峰波谷交替
+    greater = clean > 0
+    smaller = clean < 0
+    rises = np.flatnonzero(smaller[:-1] & greater[1:])
+    falls = np.flatnonzero(greater[:-1] & smaller[1:])
+    rise_first = rises[0] < falls[0]
+    crossings = np.sort(np.concatenate((rises, falls)), kind='mergesort').tolist()
+    extrema = []
+    for i in range(len(crossings) - 1):
+        segment = clean[crossings[i]:crossings[i + 1]]
+        # 从上升过零点开始的半波取最大值，从下降过零点开始的取最小值
+        extrema.append(crossings[i] + int(np.argmax(segment) if (i % 2 == 0) == rise_first else np.argmin(segment)))
+    extrema = np.asarray(extrema)
+
+    vertical_diff = np.abs(np.diff(clean[extrema]))
+    extrema = extrema[np.flatnonzero(vertical_diff > np.median(vertical_diff) * amplitude_min)]
+    amplitudes = clean[extrema]
+    signs = np.sign(np.diff(amplitudes))
+    remove = np.flatnonzero(signs[:-1] + signs[1:] != 0) + 1
+    extrema = np.delete(extrema, remove)
+    amplitudes = np.delete(amplitudes, remove)
+
+    if amplitudes[0] > amplitudes[1]:
+        extrema = np.delete(extrema, 0)
+    if amplitudes[-1] < amplitudes[-2]:
+        extrema = np.delete(extrema, -1)
+    return extrema[1::2], extrema[0:-1:2]
+
+
+def _interpolate(setup, x, y):
+    # signal_interpolate(method='monotone_cubic')：两端之外保持端点的值
+    if len(x) == 1:
+        return np.ones(setup.window) * y[0]
+    interpolated = PchipInterpolator(x, y, extrapolate=True)(setup.grid)
+    first, last = int(x[0]), int(x[-1])
+    interpolated[:first] = interpolated[first]
+    interpolated[last + 1:] = interpolated[last]
+    return interpolated
+
+
+def _phase(peaks, troughs, length):
+    inspiration = np.full(length, np.nan)
+    inspiration[peaks] = 0.0
+    inspiration[troughs] = 1.0
+    marked = ~np.isnan(inspiration)
+    last = np.flatnonzero(marked)[-1]
+    inspiration[:last] = _fill(inspiration, marked)[:last]
+
+    if len(set(inspiration[~np.isnan(inspiration)].tolist())) != 2:
+        # 只有一种极值：signal_phase 退回到基于 Hilbert 变换的相位
+        prophase = np.mod(np.angle(hilbert(inspiration)), 2.0 * np.pi)
+        order = np.argsort(prophase)
+        return inspiration, np.rad2deg((2.0 * np.pi * np.arange(length) / length)[np.argsort(order)]) / 360
+
+    # 每段相同数值（NaN 各自成段）内的进度 0..1，与逐段 np.linspace(0, 1, n) 相同
+    starts = np.flatnonzero(np.concatenate(([True], inspiration[1:] != inspiration[:-1])))
+    lengths = np.diff(np.append(starts, length))
+    run_start = np.repeat(starts, lengths)
+    run_length = np.repeat(lengths, lengths)
+    step = 1.0 / np.maximum(run_length - 1, 1)
+    completion = (np.arange(length) - run_start) * step
+    ends = starts + lengths - 1
+    completion[ends[lengths > 1]] = 1.0
+    completion = np.rad2deg(np.deg2rad(completion * 360)) / 360
+    return inspiration, completion
+
+
+def _amplitude(setup, clean, peaks, troughs):
+    if peaks.size != troughs.size or peaks[0] <= troughs[0]:
+        raise TypeError("Peaks and troughs are not aligned")
+    amplitude = clean[peaks] - clean[troughs]
+    if len(peaks) == 1:
+        return np.full(clean.shape, amplitude[0])
+    return _interpolate(setup, peaks, amplitude)
+
+
+def _rate(setup, troughs):
+    if troughs.size <= 3:
+        return np.full(setup.window, np.nan)  # 呼吸次数太少
+    period = np.ediff1d(troughs, to_begin=0) / setup.sampling_rate
+    period[0] = np.mean(period[1:])
+    return 60 / _interpolate(setup, troughs, period)
+
+
+def _closest(segment, value):
+    if not len(segment):
+        return np.nan
+    return np.argmin(np.abs(segment - value))
+
+
+def _symmetry(setup, clean, peaks, troughs):
+    if len(peaks) <= 4 or len(troughs) <= 4 or np.any(peaks - troughs < 0):
+        nan = np.full(len(clean), np.nan)
+        return nan, nan.copy()
+    trough_to_peak = peaks - troughs
+    peak_to_trough = troughs[1:] - peaks[:-1]
+    rise_decay = trough_to_peak[:-1] / (trough_to_peak[:-1] + peak_to_trough)
+
+    # 上升沿和下降沿上幅度一半的位置
+    halfway = (clean[peaks] - clean[troughs]) / 2 + clean[troughs]
+    rising = np.array([_closest(clean[troughs[i]:peaks[i]], halfway[i]) + troughs[i] for i in range(len(peaks))],
+                      dtype=np.float64)
+    halfway = (clean[peaks[:-1]] - clean[troughs[1:]]) / 2 + clean[troughs[1:]]
+    falling = np.array([_closest(clean[peaks[i]:troughs[i + 1]], halfway[i]) + peaks[i]
+                        for i in range(len(peaks) - 1)], dtype=np.float64)
+    rise_to_fall = falling[1:] - rising[1:-1]
+    fall_to_rise = rising[1:-1] - falling[:-1]
+    peak_trough = fall_to_rise / (rise_to_fall + fall_to_rise)
+    return _interpolate(setup, peaks[1:-1], peak_trough), _interpolate(setup, peaks[:-1], rise_decay)
+
+
+def _rvt(setup, clean):
+    # rsp_rvt(method='harrison2021')
+    pad = setup.rvt_pad
+
+    def smooth(lowpass, x):
+        return lowpass(np.pad(x, pad, 'symmetric'))[pad:len(x) + pad]
+
+    filtered = smooth(setup.rvt_phase_filter, clean)
+    magnitude = abs(hilbert(filtered))
+    for _ in range(RVT_ITERATIONS):
+        phase = np.unwrap(np.angle(hilbert(filtered)))
+        phase_diff = np.diff(np.sign(np.gradient(phase)))
+        increases = np.append(np.flatnonzero(phase_diff > 0), len(phase) - 1)
+        for n_max in np.flatnonzero(phase_diff < 0).tolist():
+            # 相位回退的地方用线性插值替换，使相位单调
+            following = increases[increases > n_max]
+            if not len(following):
+                continue
+            n_min = following[0]
+            phase_max, phase_min = phase[n_max], phase[n_min]
+            if phase_max < phase_min:
+                continue
+            above = np.flatnonzero(phase > phase_min)
+            n_start = above[0] if len(above) else n_max
+            below = np.flatnonzero(phase < phase_max)
+            n_end = below[-1] if len(below) else n_min
+            phase[n_start:n_end] = np.linspace(phase_min, phase_max, num=n_end - n_start)
+        filtered = smooth(setup.rvt_phase_filter, np.cos(phase))
+
+    volume = 2 * smooth(setup.rvt_rate_filter, magnitude)
+    volume[volume < 0] = 0
+    frequency = smooth(setup.rvt_rate_filter, setup.sampling_rate * np.gradient(phase) / (2 * np.pi))
+    frequency = np.clip(frequency, RVT_BOUNDARIES[1], RVT_BOUNDARIES[0])
+    return np.multiply(volume, frequency)
@@ -0,0 +1,115 @@
+import numpy as np
+from numpy.lib import recfunctions
+
+DEFAULT_CHANNELS = ('value',)  # 单通道流的列名，与 SessionRecorder 的默认列一致
+
+
+def batch_dtype(channels):
+    return np.dtype([('timestamp', '<f8')] + [(name, '<f8') for name in channels])
+
+
+class SampleBatch:
+    """A block of consecutive samples: one timestamp and N channel values
+    per row, stored as a numpy structured array.
+
+    The channel schema is the field names after ``timestamp``. A batch
+    pickles as a single array, so a stage puts one batch per block on a
+    queue instead of one dict per sample, and ``values`` gives the channels
+    as an ``(N, C)`` float64 view for vectorized processing.
+
+    Multi-channel batches travel on queues only: ``SharedRingBuffer`` holds
+    one value column, so a ring carries a single channel. The multi-device
+    reader's stream is the multi-channel producer in the tree
+    (``device_type`` and ``value`` columns); the other producers emit
+    single-channel batches.
+    """
+
+    def __init__(self, data):
+        self.data = data
+
+    @classmethod
+    def empty(cls, channels=DEFAULT_CHANNELS):
+        return cls(np.empty(0, dtype=batch_dtype(channels)))
+
+    @classmethod
+    def from_arrays(cls, timestamps, values, channels=DEFAULT_CHANNELS):
+        # values: 单通道时为 (N,)，多通道时为 (N, C)
+        values = np.asarray(values, dtype=np.float64).reshape(len(timestamps), -1)
+        if values.shape[1] != len(channels):
+            raise ValueError(f"Expected {len(channels)} channels, got {values.shape[1]}")
+        data = np.empty(len(values), dtype=batch_dtype(channels))
+        data['timestamp'] = timestamps
+        recfunctions.structured_to_unstructured(data[list(channels)], copy=False)[:] = values
+        return cls(data)
+
+    @classmethod
+    def concatenate(cls, batches):
+        batches = list(batches)
+        if len(batches) == 1:
+            return batches[0]
+        return cls(np.concatenate([batch.data for batch in batches]))
+
+    @property
+    def channels(self):
+        return self.data.dtype.names[1:]
+
+    @property
+    def timestamps(self):
+        return self.data['timestamp']
+
+    @property
+    def values(self):
+        # 所有通道都是 float64 且连续存放，返回的是视图而不是副本
+        return recfunctions.structured_to_unstructured(self.data[list(self.channels)], copy=False)
+
+    def column(self, channel):
+        """Return one channel, by name or index, as a view."""
+        if not isinstance(channel, str):
+            channel = self.channels[channel]
+        return self.data[channel]
+
+    def select(self, channels):
+        names = [channel if isinstance(channel, str) else self.channels[channel] for channel in channels]
+        return SampleBatch.from_arrays(self.timestamps, self.values[:, [self.channels.index(n) for n in names]],
+                                       names)
+
+    def with_values(self, values, channels=None):
+        # 保留时间戳，替换通道数据（例如滤波结果）
+        return SampleBatch.from_arrays(self.timestamps, values, self.channels if channels is None else channels)
+
+    def __len__(self):
+        return len(self.data)
+
+    def __repr__(self):
+        return f"SampleBatch({len(self)} samples, channels={self.channels})"
+
+
+def _from_dicts(items, channels):
+    # 兼容旧的逐样本消息：{'timestamp', 'data'} 或 {'timestamp', 'filtered_data'}
+    timestamps = np.fromiter((item['timestamp'] for item in items), dtype=np.float64, count=len(items))
+    values = np.asarray([item['data'] if 'data' in item else item['filtered_data'] for item in items],
+                        dtype=np.float64).reshape(len(items), -1)
+    if values.shape[1] != len(channels):
+        channels = tuple(f'channel_{i}' for i in range(values.shape[1]))
+    return SampleBatch.from_arrays(timestamps, values, channels)
+
+
+def to_batch(items, channels=DEFAULT_CHANNELS):
+    """Merge queue items, in order, into one ``SampleBatch``. Items are
+    batches or legacy per-sample dicts; ``channels`` names the columns of
+    the dicts and of the empty batch returned for no items."""
+    parts = []
+    run = []
+    for item in items:
+        if isinstance(item, SampleBatch):
+            if run:
+                parts.append(_from_dicts(run, channels))
+                run = []
+            parts.append(item)
+        else:
+            run.append(item)
+    if run:
+        parts.append(_from_dicts(run, channels))
+    if not parts:
+        return SampleBatch.empty(channels)
+    return SampleBatch.concatenate(parts)
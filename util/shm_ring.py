@@ -0,0 +1,153 @@
+import os
+import time
+from multiprocessing import shared_memory
+
+import numpy as np
+
+HEADER_SLOTS = 2  # [写指针, 关闭标志]
+POLL_INTERVAL = 0.001
+MAX_POLL_INTERVAL = 0.02  # 空闲时轮询间隔逐步放大到这个值，限制唤醒延迟
+
+
+def _take(column, start, end):
+    # 从环形存储中按绝对序号 [start, end) 取出一段数据（必要时拼接回绕部分）
+    capacity = len(column)
+    begin = start % capacity
+    stop = begin + (end - start)
+    if stop <= capacity:
+        return column[begin:stop].copy()
+    return np.concatenate((column[begin:], column[:stop - capacity]))
+
+
+class SharedRingBuffer:
+    """Single-writer ring of (timestamp, value) samples in shared memory.
+
+    The writer publishes a monotonically increasing write index after each
+    batch; every reader keeps its own cursor (see ``reader``), so several
+    processes can consume the same stream without locks or pickling.
+    """
+
+    def __init__(self, capacity=1 << 16, name=None):
+        self.capacity = capacity
+        # 单次发布的最大样本数，读者把距写指针不足 capacity - guard 的数据视为安全
+        self.guard = max(1, capacity // 8)
+        nbytes = 8 * (HEADER_SLOTS + 2 * capacity)
+        # 只有创建者进程负责释放共享内存（fork 出的子进程也会继承这个对象）
+        self._owner_pid = os.getpid() if name is None else None
+        if name is None:
+            self.shm = shared_memory.SharedMemory(create=True, size=nbytes)
+        else:
+            self.shm = shared_memory.SharedMemory(name=name)
+        self._map()
+        if name is None:
+            self._header[:] = 0
+
+    def _map(self):
+        buf = self.shm.buf
+        self._header = np.ndarray((HEADER_SLOTS,), dtype=np.int64, buffer=buf)
+        self.timestamps = np.ndarray((self.capacity,), dtype=np.float64, buffer=buf,
+                                     offset=8 * HEADER_SLOTS)
+        self.values = np.ndarray((self.capacity,), dtype=np.float64, buffer=buf,
+                                 offset=8 * (HEADER_SLOTS + self.capacity))
+
+    def __getstate__(self):
+        # 跨进程传递时只传共享内存名，子进程重新映射
+        return {'name': self.shm.name, 'capacity': self.capacity}
+
+    def __setstate__(self, state):
+        self.__init__(state['capacity'], name=state['name'])
+
+    @property
+    def name(self):
+        return self.shm.name
+
+    @property
+    def write_index(self):
+        return int(self._header[0])
+
+    @property
+    def closed(self):
+        return bool(self._header[1])
+
+    def write(self, timestamps, values):
+        timestamps = np.asarray(timestamps, dtype=np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        count = len(values)
+        if count == 0:
+            return
+        head = self.write_index
+        if count > self.capacity:
+            # 超过容量的部分读者无论如何都读不到，只写最后 capacity 个
+            skip = count - self.capacity
+            timestamps, values = timestamps[skip:], values[skip:]
+            head += skip
+            count = self.capacity
+        for offset in range(0, count, self.guard):
+            stop = min(offset + self.guard, count)
+            pos = (head + offset) % self.capacity
+            size = stop - offset
+            first = min(size, self.capacity - pos)
+            self.timestamps[pos:pos + first] = timestamps[offset:offset + first]
+            self.values[pos:pos + first] = values[offset:offset + first]
+            if first < size:
+                self.timestamps[:size - first] = timestamps[offset + first:stop]
+                self.values[:size - first] = values[offset + first:stop]
+            # 数据写完后再发布写指针
+            self._header[0] = head + stop
+
+    def mark_closed(self):
+        self._header[1] = 1
+
+    def reader(self, from_start=True):
+        return RingReader(self, from_start)
+
+    def close(self):
+        del self._header, self.timestamps, self.values
+        self.shm.close()
+        if self._owner_pid == os.getpid():
+            self.shm.unlink()
+
+
+class RingReader:
+    def __init__(self, ring, from_start=True):
+        self.ring = ring
+        head = ring.write_index
+        self.cursor = max(0, head - ring.capacity + ring.guard) if from_start else head
+        self.overruns = 0  # 因读取过慢被覆盖而丢失的样本数
+
+    def available(self):
+        return self.ring.write_index - self.cursor
+
+    @property
+    def exhausted(self):
+        return self.ring.closed and self.available() == 0
+
+    def read(self, max_items=None, timeout=0.0):
+        """Return ``(timestamps, values)`` arrays for everything published
+        since the last read, waiting up to ``timeout`` seconds for data."""
+        ring = self.ring
+        head = ring.write_index
+        if head == self.cursor and timeout:
+            deadline = time.monotonic() + timeout
+            interval = POLL_INTERVAL
+            while head == self.cursor and not ring.closed and time.monotonic() < deadline:
+                time.sleep(interval)
+                interval = min(interval * 2, MAX_POLL_INTERVAL)
+                head = ring.write_index
+
+        start = max(self.cursor, self._oldest(head))
+        self.overruns += start - self.cursor
+        end = head if max_items is None else min(head, start + max_items)
+        timestamps = _take(ring.timestamps, start, end)
+        values = _take(ring.values, start, end)
+
+        # 复制期间写者可能已经覆盖了最旧的一部分，丢弃这部分
+        lost = min(max(0, self._oldest(ring.write_index) - start), end - start)
+        if lost:
+            self.overruns += lost
+            timestamps, values = timestamps[lost:], values[lost:]
+        self.cursor = end
+        return timestamps, values
+
+    def _oldest(self, head):
+        return head - self.ring.capacity + self.ring.guard
@@ -2,14 +2,20 @@ import signal
 
 import numpy as np
 import neurokit2 as nk
+import pandas as pd
 import matplotlib.pyplot as plt
 from scipy import signal
 
+from backend.util.rsp_window import rsp_process_window
+from backend.util.text_cache import TEXT_COLUMNS, load_text
+
+COLUMNS = list(TEXT_COLUMNS)
+
 
 def process_signals(path):
     # Load data from the file
     try:
-        data = np.loadtxt(path, delimiter=',')
+        data = load_text(path)  # 首次解析后缓存为二进制列存文件，之后直接内存映射
     except Exception as e:
         print(f"Error loading file: {e}")
         return
@@ -23,15 +29,15 @@ def process_signals(path):
     rot_2 = data[:, 5]
     rot_3 = data[:, 6]
 
-    # Process each signal using NeuroKit's rsp_process
+    # Process each signal using NeuroKit's rsp_process (filter setup shared by all channels)
     try:
-        filtered_pzf, info_pzf = nk.rsp_process(pzf, sampling_rate=100)
-        filtered_acc_1, info_acc_1 = nk.rsp_process(acc_1, sampling_rate=100)
-        filtered_acc_2, info_acc_2 = nk.rsp_process(acc_2, sampling_rate=100)
-        filtered_acc_3, info_acc_3 = nk.rsp_process(acc_3, sampling_rate=100)
-        filtered_rot_1, info_rot_1 = nk.rsp_process(rot_1, sampling_rate=100)
-        filtered_rot_2, info_rot_2 = nk.rsp_process(rot_2, sampling_rate=100)
-        filtered_rot_3, info_rot_3 = nk.rsp_process(rot_3, sampling_rate=100)
+        filtered_pzf, info_pzf = rsp_process_window(pzf, sampling_rate=100)
+        filtered_acc_1, info_acc_1 = rsp_process_window(acc_1, sampling_rate=100)
+        filtered_acc_2, info_acc_2 = rsp_process_window(acc_2, sampling_rate=100)
+        filtered_acc_3, info_acc_3 = rsp_process_window(acc_3, sampling_rate=100)
+        filtered_rot_1, info_rot_1 = rsp_process_window(rot_1, sampling_rate=100)
+        filtered_rot_2, info_rot_2 = rsp_process_window(rot_2, sampling_rate=100)
+        filtered_rot_3, info_rot_3 = rsp_process_window(rot_3, sampling_rate=100)
     except Exception as e:
         print(f"Error processing signals: {e}")
         return
@@ -85,7 +91,106 @@ def process_signals(path):
     # Show all plots
     plt.show()
 
+def read_chunks(path, rows=100000):
+    # 按块读取逗号分隔的记录文件，每块为 (rows, 列数) 的数组，内存占用与文件长度无关
+    for chunk in pd.read_csv(path, header=None, chunksize=rows, dtype=np.float64):
+        yield chunk.to_numpy()
+
+
+def stream_rsp_process(path, columns=(0,), sampling_rate=100, segment_seconds=300, overlap_seconds=60,
+                       chunk_rows=100000):
+    """Run ``rsp_process`` (as ``rsp_process_window``, which reuses the
+    setup across the equally long segments) over a long recording in
+    overlapping segments.
+
+    Each segment of ``segment_seconds`` is processed together with up to
+    ``overlap_seconds`` of signal on both sides, and only the segment itself
+    is kept, so filter start-up and the peak detection at the window edges
+    fall in the discarded overlap. Yields ``{column: (signals, info)}`` per
+    segment in order; ``signals`` is indexed by absolute sample number and
+    ``info['RSP_Peaks']``/``info['RSP_Troughs']`` hold absolute positions.
+    Memory use depends on the segment, overlap and chunk sizes only.
+
+    Away from the recording edges this matches processing the whole file:
+    peaks, troughs and rate agree, except for breaths close to the
+    amplitude threshold, which ``rsp_process`` derives from the median of
+    what it is given (here the segment plus its overlap).
+    """
+    segment = int(segment_seconds * sampling_rate)
+    overlap = int(overlap_seconds * sampling_rate)
+    buffer = np.empty((0, len(columns)))
+    buffer_start = 0  # buffer[0] 的绝对样本序号
+    emitted = 0  # 下一个要输出的绝对样本序号
+
+    def process(end):
+        # 处理 [emitted - overlap, end + overlap) 并只保留 [emitted, end)
+        window_start = max(emitted - overlap, buffer_start)
+        window = buffer[window_start - buffer_start:end + overlap - buffer_start]
+        results = {}
+        for i, column in enumerate(columns):
+            try:
+                signals, info = rsp_process_window(window[:, i], sampling_rate=sampling_rate)
+            except Exception as e:
+                # 该分段分析失败（例如没有呼吸）：输出 NaN，保证各分段的列一致
+                print(f"Error processing column {column} at sample {emitted}: {e}")
+                signals = pd.DataFrame(np.nan, index=np.arange(len(window)),
+                                       columns=['RSP_Clean', 'RSP_Amplitude', 'RSP_Rate', 'RSP_Phase'])
+                info = {'RSP_Peaks': np.empty(0, dtype=np.int64), 'RSP_Troughs': np.empty(0, dtype=np.int64)}
+            signals = signals.iloc[emitted - window_start:end - window_start]
+            signals.index = np.arange(emitted, emitted + len(signals))
+            info = dict(info)
+            for key in ('RSP_Peaks', 'RSP_Troughs'):
+                positions = np.asarray(info[key]) + window_start
+                info[key] = positions[(positions >= emitted) & (positions < end)]
+            results[column] = (signals, info)
+        return results
+
+    for chunk in read_chunks(path, chunk_rows):
+        buffer = np.concatenate((buffer, chunk[:, list(columns)]))
+        while buffer_start + len(buffer) >= emitted + segment + overlap:
+            yield process(emitted + segment)
+            emitted += segment
+            # 只保留下一个分段左侧需要的重叠部分
+            keep = max(emitted - overlap, buffer_start)
+            buffer = buffer[keep - buffer_start:]
+            buffer_start = keep
+
+    end = buffer_start + len(buffer)
+    if end > emitted:
+        yield process(end)
+
+
+def process_signals_streaming(path, output_path=None, sampling_rate=100, segment_seconds=300, overlap_seconds=60):
+    # 长时间记录的流式处理：分段结果追加写入 output_path（CSV），只在内存中保留汇总统计
+    columns = list(range(len(COLUMNS)))
+    breaths = {column: 0 for column in columns}
+    rate_sums = {column: 0.0 for column in columns}
+    rate_counts = {column: 0 for column in columns}
+    header = True
+    for results in stream_rsp_process(path, columns, sampling_rate, segment_seconds, overlap_seconds):
+        for column, (signals, info) in results.items():
+            breaths[column] += len(info['RSP_Troughs'])
+            rates = signals['RSP_Rate'].to_numpy()
+            rates = rates[np.isfinite(rates)]
+            rate_sums[column] += rates.sum()
+            rate_counts[column] += len(rates)
+        if output_path is not None and results:
+            frame = pd.concat({COLUMNS[column]: signals[['RSP_Clean', 'RSP_Amplitude', 'RSP_Rate', 'RSP_Phase']]
+                               for column, (signals, _) in results.items()}, axis=1)
+            frame.columns = [f'{name}_{field}' for name, field in frame.columns]
+            frame.to_csv(output_path, mode='w' if header else 'a', header=header, index_label='sample')
+            header = False
+
+    summary = {}
+    for column in columns:
+        mean_rate = rate_sums[column] / rate_counts[column] if rate_counts[column] else float('nan')
+        summary[COLUMNS[column]] = {'breaths': breaths[column], 'mean_rate': mean_rate}
+        print(f"{COLUMNS[column]}: {breaths[column]} breaths, mean rate {mean_rate:.1f} breaths/min")
+    return summary
+
+
 # Usage example
 # process_signals("path/to/your/file.txt")
+# process_signals_streaming("path/to/overnight.txt", "path/to/overnight_rsp.csv")
 if __name__ == '__main__':
     process_signals("../../data/zsj.txt")
\ No newline at end of file
@@ -0,0 +1,362 @@
+"""Headless benchmarks for the acquisition/analysis pipeline.
+
+Every stage is fed synthetic data in ticks of ``--tick`` seconds (the plot
+timer interval) as fast as it can process them, alone and chained:
+
+* ``parse``    - ``FrameParser.feed_arrays`` on HK frames, one device type per channel
+* ``filter``   - ``StreamingFilter`` per channel
+* ``analysis`` - ``IncrementalRspAnalyzer`` per channel
+* ``windowed`` - ``rsp_process`` over ``WINDOW_SIZE`` samples every ``STEP_SIZE``
+* ``cached``   - the same windows through ``rsp_process_window``, which reuses
+  the filter design and other per-window-length setup
+* ``harmony``  - ``HarmonyAnalyzer`` (strength, breath cycles, harmony) per channel
+* ``trace``    - the plot update without Qt: trace buffer and min/max
+  downsampling
+* ``plot``     - ``SignalPlotter.update_plot`` on an offscreen Qt platform
+  (skipped when PyQt5 is not installed)
+* ``chain``    - parse -> filter -> analysis -> harmony -> trace in one loop
+
+Latency is the time from a tick being handed to the stage until its output
+is ready; every sample in the tick shares it, so the percentiles are per
+sample. Peak memory is the ``tracemalloc`` peak of a second, untimed run.
+
+    python -m backend.util.test.benchmark --rates 50 100 1000 --channels 1 4 16 --output bench.json
+    python -m backend.util.test.benchmark --compare old.json new.json
+"""
+import argparse
+import json
+import os
+import platform
+import queue
+import subprocess
+import sys
+import time
+import tracemalloc
+import warnings
+
+import numpy as np
+import scipy
+
+from backend.util.butter_filter import FILTER_CONFIG, StreamingFilter, design_filter_chain
+from backend.util.frame_parser import FrameParser
+from backend.util.rsp_incremental import IncrementalRspAnalyzer
+from backend.util.sample_batch import SampleBatch
+from backend.util.trace import TraceBuffer, downsample_minmax
+
+STAGES = ('parse', 'filter', 'analysis', 'windowed', 'cached', 'harmony', 'trace', 'plot', 'chain')
+RATES = (50, 100, 1000)
+CHANNELS = (1, 2, 4, 8, 16)
+COMMAND = 0xA2
+PLOT_WIDTH = 800  # 无界面时假定的绘图区宽度（像素）
+
+
+def synthetic_signal(rate, duration, channels, seed=0):
+    # 10-25 次/分钟的呼吸波形加漂移和噪声，数值范围与串口原始数据相近
+    rng = np.random.default_rng(seed)
+    t = np.arange(int(rate * duration)) / rate
+    breaths = rng.uniform(10, 25, channels) / 60.0
+    phase = rng.uniform(0, 2 * np.pi, channels)
+    signal = 400 * np.sin(2 * np.pi * np.outer(t, breaths) + phase) + 20 * t[:, None]
+    signal += rng.normal(0, 10, signal.shape)
+    return np.clip(signal + 5000, 0, 0xFFFFFF).astype(np.int64)
+
+
+def encode_frames(samples):
+    # 每个采样点按通道顺序编码为 HK 帧，通道号写在设备类型字节里
+    n, channels = samples.shape
+    frames = np.empty((n, channels, 8), dtype=np.uint8)
+    frames[..., 0] = 0xFF
+    frames[..., 1] = np.arange(channels)
+    frames[..., 2] = 6
+    frames[..., 4] = COMMAND
+    for i, shift in enumerate((16, 8, 0)):
+        frames[..., 5 + i] = (samples >> shift) & 0xFF
+    frames[..., 3] = (6 + COMMAND + frames[..., 5:].sum(axis=-1, dtype=np.int64)) & 0xFF
+    return frames.reshape(n, -1)
+
+
+def split_ticks(rate, duration, tick):
+    per_tick = max(1, int(round(rate * tick)))
+    total = int(rate * duration)
+    return [(start, min(start + per_tick, total)) for start in range(0, total, per_tick)]
+
+
+class ParseStage:
+    def __init__(self, rate, channels):
+        self.parser = FrameParser()
+        self.channels = channels
+
+    def __call__(self, data):
+        types, _, values = self.parser.feed_arrays(data)
+        return [values[types == channel] for channel in range(self.channels)]
+
+
+class FilterStage:
+    def __init__(self, rate, channels):
+        config = {key: value for key, value in FILTER_CONFIG.items() if key != 'fs'}
+        sos = design_filter_chain(rate, **config)
+        self.filters = [StreamingFilter(sos) for _ in range(channels)]
+
+    def __call__(self, blocks):
+        return [stream_filter.process(block) for stream_filter, block in zip(self.filters, blocks)]
+
+
+class AnalysisStage:
+    def __init__(self, rate, channels):
+        self.analyzers = [IncrementalRspAnalyzer(rate) for _ in range(channels)]
+
+    def __call__(self, blocks):
+        for analyzer, block in zip(self.analyzers, blocks):
+            analyzer.process(block)
+        return blocks
+
+
+class WindowedStage:
+    def __init__(self, rate, channels):
+        from backend.util.rsp_analysis import STEP_SIZE, WINDOW_SIZE
+        self.rsp_process = self.load()
+        self.rate = rate
+        # WINDOW_SIZE/STEP_SIZE 以 50 Hz 的样本数给出，其他采样率下保持相同的时长
+        self.window = int(WINDOW_SIZE * rate / FILTER_CONFIG['fs'])
+        self.step = int(STEP_SIZE * rate / FILTER_CONFIG['fs'])
+        self.buffers = [np.empty(0) for _ in range(channels)]
+        self.errors = 0
+        self.windows = 0
+        self.window_seconds = 0.0  # 所有窗口分析的累计耗时
+
+    @staticmethod
+    def load():
+        try:
+            from backend.util.neurokit2 import rsp_process
+        except ImportError:
+            from neurokit2 import rsp_process
+        return rsp_process
+
+    def __call__(self, blocks):
+        for i, block in enumerate(blocks):
+            buffer = np.concatenate((self.buffers[i], block))
+            while len(buffer) >= self.window:
+                start = time.perf_counter()
+                try:
+                    self.rsp_process(buffer[:self.window], sampling_rate=self.rate)
+                except Exception:
+                    self.errors += 1  # 与 signal_analysis 一样跳过分析失败的窗口
+                self.window_seconds += time.perf_counter() - start
+                self.windows += 1
+                buffer = buffer[self.step:]
+            self.buffers[i] = buffer
+        return blocks
+
+
+class CachedWindowedStage(WindowedStage):
+    @staticmethod
+    def load():
+        from backend.util.rsp_window import rsp_process_window
+        return rsp_process_window
+
+
+class HarmonyStage:
+    def __init__(self, rate, channels):
+        from backend.util.harmony import HarmonyAnalyzer
+        self.analyzers = [HarmonyAnalyzer(rate) for _ in range(channels)]
+
+    def __call__(self, blocks):
+        for analyzer, block in zip(self.analyzers, blocks):
+            analyzer.process(block, rate=15.0)
+        return blocks
+
+
+class TraceStage:
+    # 与 SignalPlotter.update_plot 相同的计算，只是不调用 Qt
+    def __init__(self, rate, channels, max_points=500):
+        self.traces = [TraceBuffer(max_points) for _ in range(channels)]
+
+    def __call__(self, blocks):
+        for trace, block in zip(self.traces, blocks):
+            trace.extend(block)
+            downsample_minmax(trace.view(), PLOT_WIDTH)
+        return blocks
+
+
+class PlotStage:
+    def __init__(self, rate, channels):
+        os.environ.setdefault('QT_QPA_PLATFORM', 'offscreen')
+        from PyQt5.QtWidgets import QApplication
+        from backend.util.plot import SignalPlotter
+        self.app = QApplication.instance() or QApplication(sys.argv)
+        self.inputs = [queue.Queue() for _ in range(channels)]
+        self.plotters = []
+        for data_queue in self.inputs:
+            plotter = SignalPlotter(data_queue, queue.Queue())
+            plotter.timer.stop()  # 由基准循环直接调用 update_plot
+            plotter.reminder_timer.stop()
+            self.plotters.append(plotter)
+
+    def __call__(self, blocks):
+        for data_queue, plotter, block in zip(self.inputs, self.plotters, blocks):
+            data_queue.put(SampleBatch.from_arrays(np.zeros(len(block)), block))
+            plotter.update_plot()
+        return blocks
+
+
+class ChainStage:
+    def __init__(self, rate, channels):
+        self.stages = [ParseStage(rate, channels), FilterStage(rate, channels), AnalysisStage(rate, channels),
+                       HarmonyStage(rate, channels), TraceStage(rate, channels)]
+
+    def __call__(self, data):
+        for stage in self.stages:
+            data = stage(data)
+        return data
+
+
+STAGE_CLASSES = {
+    'parse': ParseStage,
+    'filter': FilterStage,
+    'analysis': AnalysisStage,
+    'windowed': WindowedStage,
+    'cached': CachedWindowedStage,
+    'harmony': HarmonyStage,
+    'trace': TraceStage,
+    'plot': PlotStage,
+    'chain': ChainStage,
+}
+
+
+def stage_inputs(stage, samples, ticks):
+    # 解析类阶段输入原始字节，其余阶段输入各通道的数值块
+    if stage in ('parse', 'chain'):
+        frames = encode_frames(samples)
+        return [frames[start:end].tobytes() for start, end in ticks]
+    values = samples.astype(np.float64)
+    return [[values[start:end, channel] for channel in range(samples.shape[1])] for start, end in ticks]
+
+
+def run_stage(stage, rate, channels, duration=60.0, tick=0.05):
+    samples = synthetic_signal(rate, duration, channels)
+    ticks = split_ticks(rate, duration, tick)
+    inputs = stage_inputs(stage, samples, ticks)
+    result = {'stage': stage, 'rate': rate, 'channels': channels, 'duration': duration, 'tick': tick}
+    try:
+        runner = STAGE_CLASSES[stage](rate, channels)
+    except ImportError as e:
+        result['skipped'] = str(e)
+        return result
+
+    latencies = np.empty(len(ticks))
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')  # rsp_process 在信号过短时会逐窗口告警
+        start = time.perf_counter()
+        for i, data in enumerate(inputs):
+            tick_start = time.perf_counter()
+            runner(data)
+            latencies[i] = time.perf_counter() - tick_start
+        elapsed = time.perf_counter() - start
+        if getattr(runner, 'windows', 0):
+            result['ms_per_window'] = runner.window_seconds / runner.windows * 1000
+
+        # tracemalloc 会拖慢分配，内存峰值用一个新实例单独再跑一遍
+        runner = STAGE_CLASSES[stage](rate, channels)
+        tracemalloc.start()
+        for data in inputs:
+            runner(data)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+
+    total = samples.size
+    weights = np.array([end - start for start, end in ticks])
+    per_sample = np.repeat(latencies, weights)
+    result.update({
+        'samples': int(total),
+        'seconds': elapsed,
+        'samples_per_second': total / elapsed if elapsed else float('inf'),
+        'realtime_factor': duration / elapsed if elapsed else float('inf'),
+        'latency_ms': {
+            'p50': float(np.percentile(per_sample, 50) * 1000),
+            'p90': float(np.percentile(per_sample, 90) * 1000),
+            'p99': float(np.percentile(per_sample, 99) * 1000),
+            'max': float(latencies.max() * 1000),
+        },
+        'peak_memory_kb': peak / 1024,
+    })
+    return result
+
+
+def environment():
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        commit = ''
+    return {
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'scipy': scipy.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+    }
+
+
+def run_benchmarks(stages=STAGES, rates=RATES, channels=CHANNELS, duration=60.0, tick=0.05):
+    results = []
+    for stage in stages:
+        for rate in rates:
+            for count in channels:
+                result = run_stage(stage, rate, count, duration, tick)
+                results.append(result)
+                print(format_result(result))
+    return {'environment': environment(), 'results': results}
+
+
+def format_result(result):
+    label = f"{result['stage']:>8} {result['rate']:>5} Hz x{result['channels']:<2}"
+    if 'skipped' in result:
+        return f"{label}  skipped: {result['skipped']}"
+    latency = result['latency_ms']
+    line = (f"{label} {result['samples_per_second']:>12,.0f} samples/s  {result['realtime_factor']:>9,.1f}x realtime  "
+            f"p50 {latency['p50']:.3f} ms  p99 {latency['p99']:.3f} ms  peak {result['peak_memory_kb']:,.0f} KiB")
+    if 'ms_per_window' in result:
+        line += f"  {result['ms_per_window']:.2f} ms/window"
+    return line
+
+
+def compare(old_path, new_path):
+    # 按 (阶段, 采样率, 通道数) 对比两次运行的吞吐量和 p99 延迟
+    with open(old_path) as f:
+        old = {(r['stage'], r['rate'], r['channels']): r for r in json.load(f)['results'] if 'skipped' not in r}
+    with open(new_path) as f:
+        new = [r for r in json.load(f)['results'] if 'skipped' not in r]
+    for result in new:
+        key = (result['stage'], result['rate'], result['channels'])
+        if key not in old:
+            continue
+        speedup = result['samples_per_second'] / old[key]['samples_per_second']
+        p99 = result['latency_ms']['p99'] / old[key]['latency_ms']['p99'] if old[key]['latency_ms']['p99'] else 0
+        print(f"{key[0]:>8} {key[1]:>5} Hz x{key[2]:<2}  throughput x{speedup:.2f}  p99 latency x{p99:.2f}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES))
+    parser.add_argument('--rates', nargs='+', type=int, default=list(RATES))
+    parser.add_argument('--channels', nargs='+', type=int, default=list(CHANNELS))
+    parser.add_argument('--duration', type=float, default=60.0, help='seconds of synthetic signal per run')
+    parser.add_argument('--tick', type=float, default=0.05, help='seconds of signal handed over per call')
+    parser.add_argument('--output', help='write results as JSON to this file')
+    parser.add_argument('--compare', nargs=2, metavar=('OLD', 'NEW'), help='compare two result files')
+    args = parser.parse_args(argv)
+
+    if args.compare:
+        compare(*args.compare)
+        return
+    report = run_benchmarks(args.stages, args.rates, args.channels, args.duration, args.tick)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {args.output}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,109 @@
+"""Check the vectorized HK frame decoder against ``FrameParser.feed``.
+
+Random streams of HK frames (mixed device types, commands and field
+widths) are corrupted with flipped bytes, junk runs containing 0xFF,
+dropped bytes and a truncated tail, then decoded three ways:
+
+* ``decode_buffer`` on the whole stream, compared with one ``feed`` call:
+  same frames, same undecoded tail and same counters;
+* ``decode_frames`` with a small ``chunk_size`` (down to below the
+  longest possible frame), compared with ``decode_buffer``;
+* ``feed_arrays`` in random chunks, compared with ``feed`` on the same
+  chunks (this crosses ``VECTOR_THRESHOLD`` in both directions).
+
+    python -m backend.util.test.check_frame_decoder --streams 400
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from backend.util.frame_parser import FrameParser, _to_float, decode_buffer, decode_frames
+
+def encode_frame(device_type, command, data):
+    length = len(data) + 3
+    checksum = (length + command + sum(data)) & 0xFF
+    return bytes([0xFF, device_type, length, checksum, command]) + bytes(data)
+
+
+def random_stream(rng, frames=300):
+    out = bytearray()
+    for _ in range(frames):
+        size = int(rng.choice([2, 3, 3, 3, 4, 8, 10]))
+        data = rng.integers(0, 256, size).tolist()
+        out += encode_frame(int(rng.choice([0xCC, 0xC8, 0xCE, 0xFF])), int(rng.integers(0, 256)), data)
+        if rng.random() < 0.05:
+            # 夹杂 0xFF 的垃圾字节
+            out += bytes(rng.choice([0xFF, 0x00, 0x05, 0x07], int(rng.integers(1, 12))).tolist())
+    stream = np.frombuffer(bytes(out), dtype=np.uint8).copy()
+    flips = rng.integers(0, len(stream), int(rng.integers(0, 20)))
+    stream[flips] = rng.integers(0, 256, len(flips))
+    keep = rng.random(len(stream)) > rng.choice([0.0, 0.002])
+    stream = stream[keep]
+    return stream[:len(stream) - int(rng.integers(0, 10))].tobytes()
+
+
+def parser_frames(samples):
+    return ([device_type for device_type, _, _ in samples], [command for _, command, _ in samples],
+            [_to_float(value) for _, _, value in samples])
+
+
+def same_frames(expected, device_types, commands, values):
+    return (expected[0] == device_types.tolist() and expected[1] == commands.tolist()
+            and np.array_equal(np.array(expected[2], dtype=np.float64), values))
+
+
+def check_stream(stream, rng):
+    problems = []
+    parser = FrameParser()
+    expected = parser_frames(parser.feed(stream))
+    stats = parser.stats()
+
+    decoded = decode_buffer(np.frombuffer(stream, dtype=np.uint8))
+    counters = {'frames': len(decoded), 'bad_checksum': len(decoded.bad_checksum),
+                'dropped': len(decoded.bad_length), 'resyncs': decoded.resyncs,
+                'dropped_bytes': decoded.dropped_bytes, 'pending_bytes': len(stream) - decoded.pending}
+    if not same_frames(expected, decoded.device_types, decoded.commands, decoded.values):
+        problems.append('decode_buffer frames')
+    if counters != stats:
+        problems.append(f'decode_buffer counters {counters} != {stats}')
+
+    chunked = decode_frames(stream, chunk_size=int(rng.integers(64, 2000)))
+    if not (np.array_equal(chunked.offsets, decoded.offsets) and np.array_equal(chunked.values, decoded.values)
+            and chunked.pending == decoded.pending):
+        problems.append('decode_frames chunks')
+
+    scalar, vector = FrameParser(), FrameParser()
+    cuts = np.sort(rng.integers(0, len(stream), int(rng.integers(1, 30))))
+    for chunk in np.split(np.frombuffer(stream, dtype=np.uint8), cuts):
+        chunk = chunk.tobytes()
+        if not same_frames(parser_frames(scalar.feed(chunk)), *vector.feed_arrays(chunk)):
+            problems.append('feed_arrays frames')
+            break
+    if scalar.stats() != vector.stats():
+        problems.append(f'feed_arrays counters {vector.stats()} != {scalar.stats()}')
+    return problems, len(decoded)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--streams', type=int, default=400)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    failed = 0
+    frames = 0
+    for i in range(args.streams):
+        stream = random_stream(rng, frames=int(rng.integers(1, 600)))
+        problems, count = check_stream(stream, rng)
+        frames += count
+        if problems:
+            failed += 1
+            print(f"stream {i} ({len(stream)} bytes): {'; '.join(problems)}")
+    print(f"{args.streams} streams, {frames} frames: " + ("OK" if not failed else f"{failed} streams differ"))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
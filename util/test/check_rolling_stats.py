@@ -0,0 +1,93 @@
+"""Check the streaming statistics in ``rolling_stats`` against direct
+computations.
+
+* ``EwmStats``: ``update`` and ``update_block`` (random block sizes) must
+  match the weighted mean and variance computed directly from the
+  exponential weights, ``(1 - alpha)^t`` for the first value and
+  ``alpha * (1 - alpha)^(t - k)`` for value ``k``;
+* ``RollingStats``: ``update`` and ``update_block`` must match ``np.mean``
+  and ``np.std`` over the last ``window`` values.
+
+Signals are random walks with an offset, so the mean is far from zero.
+Means are compared relative to the signal's standard deviation and
+variances relative to its variance.
+
+    python -m backend.util.test.check_rolling_stats --length 3000
+"""
+import argparse
+import sys
+
+import numpy as np
+
+from backend.util.rolling_stats import EwmStats, RollingStats
+
+TOLERANCE = 1e-8  # 均值相对于信号标准差、方差相对于信号方差的允许误差
+
+
+def random_blocks(values, rng, largest=200):
+    cuts = np.cumsum(rng.integers(0, largest, len(values)))
+    return np.split(values, cuts[cuts < len(values)])
+
+
+def direct_ewm(values, alpha):
+    means, stds = [], []
+    for t in range(len(values)):
+        weights = alpha * (1.0 - alpha) ** np.arange(t, -1, -1)
+        weights[0] = (1.0 - alpha) ** t
+        mean = np.sum(weights * values[:t + 1])
+        means.append(mean)
+        stds.append(np.sqrt(np.sum(weights * (values[:t + 1] - mean) ** 2)))
+    return np.array(means), np.array(stds)
+
+
+def direct_rolling(values, window):
+    means = np.array([np.mean(values[max(0, t - window + 1):t + 1]) for t in range(len(values))])
+    stds = np.array([np.std(values[max(0, t - window + 1):t + 1]) for t in range(len(values))])
+    return means, stds
+
+
+def streamed(stats, values):
+    single = []
+    for value in values:
+        stats.update(value)
+        single.append((stats.mean, stats.std))
+    return np.array(single).T
+
+
+def blocked(stats, values, rng):
+    results = [stats.update_block(block)[:2] for block in random_blocks(values, rng)]
+    return np.concatenate([mean for mean, _ in results]), np.concatenate([std for _, std in results])
+
+
+def error(actual, expected, scale):
+    # 比较方差而不是标准差：方差接近 0 时开方会放大舍入误差
+    return max(np.max(np.abs(actual[0] - expected[0])) / scale,
+               np.max(np.abs(actual[1] ** 2 - expected[1] ** 2)) / scale ** 2)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--length', type=int, default=3000)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    values = 1000.0 + np.cumsum(rng.normal(size=args.length))
+    scale = np.std(values)
+    failed = 0
+    cases = [(f"EwmStats alpha {alpha:g}", lambda alpha=alpha: EwmStats(alpha), direct_ewm(values, alpha))
+             for alpha in (1.0, 0.5, 0.05, EwmStats.from_span(500).alpha)]
+    cases += [(f"RollingStats window {window}", lambda window=window: RollingStats(window),
+               direct_rolling(values, window)) for window in (1, 50, 500)]
+    for name, make, expected in cases:
+        single = error(streamed(make(), values), expected, scale)
+        block = error(blocked(make(), values, rng), expected, scale)
+        ok = single <= TOLERANCE and block <= TOLERANCE
+        failed += not ok
+        print(f"{name}: update {single:.1e}, update_block {block:.1e}{'' if ok else '  FAILED'}")
+    print("OK" if not failed else f"{failed} checks failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
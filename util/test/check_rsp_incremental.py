@@ -0,0 +1,142 @@
+"""Check ``IncrementalRspAnalyzer`` against ``rsp_process``.
+
+Simulated recordings (``rsp_simulate``, 50 Hz) are fed to the analyzer in
+small blocks and compared breath by breath with ``rsp_process`` on the whole
+recording:
+
+* every reported peak/trough is matched with the nearest ``rsp_process``
+  extremum; the median and 90th percentile of the absolute offset, as a
+  fraction of the breath period, must stay within the tolerance stated in
+  the analyzer docstring;
+* for 95 % of the breaths the rate (trough to trough) must agree within 2
+  breaths/min and the amplitude within 15 %;
+* peaks and troughs must alternate and no event may be reported twice;
+* the result must not depend on the block size.
+
+    python -m backend.util.test.check_rsp_incremental --rates 10 13 16 20 25 --block 7
+"""
+import argparse
+import sys
+
+import numpy as np
+
+try:
+    from backend.util.neurokit2 import rsp_process, rsp_simulate
+except ImportError:
+    from neurokit2 import rsp_process, rsp_simulate
+
+from backend.util.rsp_incremental import IncrementalRspAnalyzer
+
+SAMPLING_RATE = 50
+DURATION = 300
+MEDIAN_OFFSET = 0.025  # 与 rsp_process 的极值位置偏差，以呼吸周期的比例计：中位数上限
+P90_OFFSET = 0.06  # 90% 分位数上限
+RATE_TOLERANCE = 2.0  # 呼吸率偏差上限（次/分钟）
+AMPLITUDE_TOLERANCE = 0.15  # 幅度相对偏差上限
+SHARE = 0.95  # 至少这么多呼吸的呼吸率和幅度在上限以内
+SKIP = 3  # 开头的极值受滤波器起振影响，不参与比较
+
+
+def run_incremental(signal, block, sampling_rate=SAMPLING_RATE):
+    # 返回报告的波峰、波谷，以及报告每个波峰时的幅度（幅度只在确认波峰时更新，报告时仍属于该波峰）
+    analyzer = IncrementalRspAnalyzer(sampling_rate)
+    peaks, troughs, amplitudes = [], [], []
+    for start in range(0, len(signal), block):
+        analyzer.process(signal[start:start + block])
+        peaks.extend(analyzer.peaks)
+        troughs.extend(analyzer.troughs)
+        amplitudes.extend([analyzer.amplitude] * len(analyzer.peaks))
+    return np.array(peaks), np.array(troughs), np.array(amplitudes, dtype=np.float64)
+
+
+def nearest(ours, reference):
+    # 每个报告的极值最近的 rsp_process 极值的序号
+    k = np.searchsorted(reference, ours).clip(1, len(reference) - 1)
+    return np.where(ours - reference[k - 1] < reference[k] - ours, k - 1, k)
+
+
+def offsets(ours, reference, period):
+    ours = ours[SKIP:]
+    return (ours - reference[nearest(ours, reference)]) / period
+
+
+def rate_errors(ours, reference, sampling_rate=SAMPLING_RATE):
+    # 按起始波谷配对，比较每次呼吸的呼吸率
+    ours = ours[SKIP:]
+    errors = []
+    for first, second in zip(ours[:-1], ours[1:]):
+        k = np.argmin(np.abs(reference - first))
+        if k + 1 >= len(reference):
+            break
+        expected = 60.0 * sampling_rate / (reference[k + 1] - reference[k])
+        errors.append(60.0 * sampling_rate / (second - first) - expected)
+    return np.abs(errors)
+
+
+def amplitude_errors(peaks, amplitudes, reference_peaks, reference_amplitude):
+    expected = reference_amplitude[reference_peaks[nearest(peaks[SKIP:], reference_peaks)]]
+    return np.abs(amplitudes[SKIP:] / expected - 1)
+
+
+def alternates(peaks, troughs):
+    events = sorted([(index, True) for index in peaks] + [(index, False) for index in troughs])
+    indices = [index for index, _ in events]
+    kinds = [is_peak for _, is_peak in events]
+    return len(set(indices)) == len(indices) and all(a != b for a, b in zip(kinds[:-1], kinds[1:]))
+
+
+def check_rate(breaths_per_minute, block, seed=1):
+    signal = rsp_simulate(duration=DURATION, sampling_rate=SAMPLING_RATE, respiratory_rate=breaths_per_minute,
+                          random_state=seed)
+    signals, info = rsp_process(signal, sampling_rate=SAMPLING_RATE)
+    reference_peaks = np.asarray(info['RSP_Peaks'])
+    reference_troughs = np.asarray(info['RSP_Troughs'])
+    peaks, troughs, amplitudes = run_incremental(signal, block)
+    other_peaks, other_troughs, _ = run_incremental(signal, 50 if block != 50 else 1)
+
+    period = 60.0 * SAMPLING_RATE / breaths_per_minute
+    distance = np.abs(np.concatenate((offsets(peaks, reference_peaks, period),
+                                      offsets(troughs, reference_troughs, period))))
+    errors = rate_errors(troughs, reference_troughs)
+    amplitude = amplitude_errors(peaks, amplitudes, reference_peaks, signals['RSP_Amplitude'].to_numpy())
+    result = {
+        'median_offset': float(np.median(distance)),
+        'p90_offset': float(np.percentile(distance, 90)),
+        'rate_share': float(np.mean(errors <= RATE_TOLERANCE)),
+        'median_rate_error': float(np.median(errors)),
+        'amplitude_share': float(np.mean(amplitude <= AMPLITUDE_TOLERANCE)),
+        'median_amplitude_error': float(np.median(amplitude)),
+        'alternating': alternates(peaks, troughs),
+        'block_independent': np.array_equal(peaks, other_peaks) and np.array_equal(troughs, other_troughs),
+    }
+    result['ok'] = (result['median_offset'] <= MEDIAN_OFFSET and result['p90_offset'] <= P90_OFFSET
+                    and result['rate_share'] >= SHARE and result['amplitude_share'] >= SHARE
+                    and result['alternating'] and result['block_independent'])
+    return result
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rates', type=float, nargs='+', default=[10, 13, 16, 20, 25], help="breaths/min")
+    parser.add_argument('--block', type=int, default=7, help="samples per process() call")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[1, 2, 3])
+    args = parser.parse_args(argv)
+
+    failed = 0
+    for rate in args.rates:
+        for seed in args.seeds:
+            result = check_rate(rate, args.block, seed)
+            failed += not result['ok']
+            print(f"{rate:5.1f} /min seed {seed}: offset median {result['median_offset']:.1%} "
+                  f"p90 {result['p90_offset']:.1%} of a breath, rate within {RATE_TOLERANCE:g} /min "
+                  f"{result['rate_share']:.0%} (median {result['median_rate_error']:.2f}), amplitude within "
+                  f"{AMPLITUDE_TOLERANCE:.0%} {result['amplitude_share']:.0%} "
+                  f"(median {result['median_amplitude_error']:.1%}), alternating {result['alternating']}, "
+                  f"block independent {result['block_independent']}"
+                  f"{'' if result['ok'] else '  FAILED'}")
+    print("OK" if not failed else f"{failed} checks failed")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,174 @@
+"""Check ``WindowScheduler`` ordering and stale-window skipping.
+
+A simulated 50 Hz recording holding ``--windows`` overlapping analysis
+windows is fed to the scheduler in random blocks, and the results are
+compared with ``analyze_window`` run serially on every window:
+
+* with an executor that completes its futures in random order and room
+  for every window, all windows must be delivered, in index order, with
+  the same results as the serial run and ``sample_index`` equal to
+  ``index * step + window``;
+* with the same executor, ``max_pending`` 3 and futures released slowly,
+  windows must still come out in increasing index order; whenever windows
+  are skipped the newest ready ones must be the ones submitted, the last
+  window must be delivered, and delivered + skipped must equal the number
+  of windows;
+* the same ordering and accounting checks on a real ``ProcessPoolExecutor``.
+
+    python -m backend.util.test.check_rsp_pool --windows 186 --workers 2
+"""
+import argparse
+import sys
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+try:
+    from backend.util.neurokit2 import rsp_simulate
+except ImportError:
+    from neurokit2 import rsp_simulate
+
+from backend.util.rsp_analysis import STEP_SIZE, WINDOW_SIZE
+from backend.util.rsp_pool import WindowScheduler, analyze_window
+
+SAMPLING_RATE = 50
+
+
+class ShuffledExecutor:
+    """Runs every submitted call at once but completes its future only in
+    ``release()``, picking the waiting futures in random order. After
+    ``drain()`` futures complete as soon as they are submitted."""
+
+    def __init__(self, rng):
+        self.rng = rng
+        self.waiting = []
+        self.draining = False
+
+    def submit(self, function, *args):
+        future = Future()
+        try:
+            outcome = (function(*args), None)
+        except Exception as e:
+            outcome = (None, e)
+        self.waiting.append((future, outcome))
+        if self.draining:
+            self.release()
+        return future
+
+    def release(self, count=None):
+        count = len(self.waiting) if count is None else min(count, len(self.waiting))
+        for k in sorted(self.rng.choice(len(self.waiting), count, replace=False), reverse=True):
+            future, (result, error) = self.waiting.pop(k)
+            if error is None:
+                future.set_result(result)
+            else:
+                future.set_exception(error)
+
+    def drain(self):
+        self.draining = True
+        self.release()
+
+
+def same_result(result, expected):
+    return (np.array_equal([result.rate, result.amplitude, result.clean, result.quality],
+                           [expected.rate, expected.amplitude, expected.clean, expected.quality], equal_nan=True)
+            and result.sample_index == expected.sample_index and np.array_equal(result.peaks, expected.peaks)
+            and np.array_equal(result.troughs, expected.troughs))
+
+
+def run(scheduler, signal, rng, release=None, max_block=400):
+    """Feed ``signal`` in random blocks; return the delivered results and
+    whether skipping always kept the newest ready windows."""
+    delivered = []
+    newest_kept = True
+    fed = 0
+
+    def step(results, skipped):
+        # 跳过窗口后，已提交的必须是最新的就绪窗口
+        nonlocal newest_kept
+        delivered.extend(results)
+        if scheduler.skipped > skipped:
+            newest_kept &= scheduler.next_index == (fed - scheduler.window) // scheduler.step + 1
+
+    while fed < len(signal):
+        block = signal[fed:fed + int(rng.integers(1, max_block))]
+        fed += len(block)
+        step(scheduler.feed(block), scheduler.skipped)
+        if release is not None:
+            release()
+            step(scheduler.collect(), scheduler.skipped)
+    if release is not None:
+        # finish() 会阻塞等待，并可能再提交窗口：之后的 future 立即完成
+        scheduler.executor.drain()
+    delivered.extend(scheduler.finish())
+    return delivered, newest_kept
+
+
+def check(name, scheduler, delivered, newest_kept, reference, complete):
+    indices = [index for index, _ in delivered]
+    problems = []
+    if any(a >= b for a, b in zip(indices[:-1], indices[1:])):
+        problems.append('out of order')
+    if complete and indices != list(range(len(reference))):
+        problems.append(f'{len(indices)} of {len(reference)} windows delivered')
+    if scheduler.delivered + scheduler.skipped + scheduler.failed != len(reference):
+        problems.append(f'delivered {scheduler.delivered} + skipped {scheduler.skipped} + failed '
+                        f'{scheduler.failed} != {len(reference)}')
+    if not indices or indices[-1] != len(reference) - 1:
+        problems.append('last window not delivered')
+    if not newest_kept:
+        problems.append('skipping dropped newer windows')
+    for index, result in delivered:
+        if result.sample_index != index * scheduler.step + scheduler.window:
+            problems.append(f'window {index} sample_index {result.sample_index}')
+            break
+        if not same_result(result, reference[index]):
+            problems.append(f'window {index} differs from the serial run')
+            break
+    print(f"{name}: {scheduler.delivered} delivered, {scheduler.skipped} skipped, {scheduler.failed} failed"
+          f"{'' if not problems else '  FAILED: ' + '; '.join(problems)}")
+    return not problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--windows', type=int, default=186)
+    parser.add_argument('--window', type=int, default=WINDOW_SIZE)
+    parser.add_argument('--step', type=int, default=STEP_SIZE)
+    parser.add_argument('--workers', type=int, default=2)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    rng = np.random.default_rng(args.seed)
+    length = args.window + (args.windows - 1) * args.step
+    signal = rsp_simulate(duration=length // SAMPLING_RATE + 1, sampling_rate=SAMPLING_RATE, respiratory_rate=15,
+                          random_state=args.seed)[:length]
+    reference = [analyze_window(signal[k * args.step:k * args.step + args.window], SAMPLING_RATE, k * args.step)
+                 for k in range(args.windows)]
+
+    ok = True
+    executor = ShuffledExecutor(rng)
+    scheduler = WindowScheduler(executor, 1, args.window, args.step, SAMPLING_RATE, max_pending=args.windows + 1)
+    delivered, newest_kept = run(scheduler, signal, rng, release=lambda: executor.release(int(rng.integers(0, 3))))
+    ok &= check('shuffled completion', scheduler, delivered, newest_kept, reference, complete=True)
+
+    executor = ShuffledExecutor(rng)
+    scheduler = WindowScheduler(executor, 1, args.window, args.step, SAMPLING_RATE, max_pending=3)
+    delivered, newest_kept = run(scheduler, signal, rng, release=lambda: executor.release(int(rng.integers(0, 2))),
+                                 max_block=1500)
+    ok &= check('shuffled completion, overloaded', scheduler, delivered, newest_kept, reference, complete=False)
+    if not scheduler.skipped:
+        print("  no window was skipped, the scheduler was not overloaded")
+        ok = False
+
+    with ProcessPoolExecutor(args.workers) as pool:
+        scheduler = WindowScheduler(pool, args.workers, args.window, args.step, SAMPLING_RATE)
+        delivered, newest_kept = run(scheduler, signal, rng)
+    ok &= check(f'process pool x{args.workers}', scheduler, delivered, newest_kept, reference, complete=False)
+
+    print("OK" if ok else "FAILED")
+    return 0 if ok else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
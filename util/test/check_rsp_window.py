@@ -0,0 +1,108 @@
+"""Check that ``rsp_process_window`` reproduces ``rsp_process`` exactly.
+
+Windows are cut every ``STEP_SIZE`` samples from simulated recordings at
+several breathing rates and sampling rates (and, with ``--recording``, from
+a comma-separated text recording), plus edge cases: integer input, NaN
+gaps, a flat window and a window too short for the filter. For every
+window the two functions must return the same columns with bit-identical
+values and the same peaks and troughs, or both raise.
+
+    python -m backend.util.test.check_rsp_window
+    python -m backend.util.test.check_rsp_window --recording data.txt --column 0 --sampling-rate 100
+"""
+import argparse
+import sys
+import warnings
+
+import numpy as np
+
+try:
+    from backend.util.neurokit2 import rsp_process, rsp_simulate
+except ImportError:
+    from neurokit2 import rsp_process, rsp_simulate
+
+from backend.util.rsp_analysis import STEP_SIZE, WINDOW_SIZE
+from backend.util.rsp_window import rsp_process_window
+
+SIMULATIONS = ((50, 10), (50, 15), (50, 22), (100, 12), (100, 18))  # (采样率, 呼吸率)
+DURATION = 140  # 每段模拟信号的时长（秒）
+
+
+def windows(signal, sampling_rate):
+    # 与 signal_analysis 相同的窗口和步长（以 50 Hz 为基准换算成相同时长）
+    window = WINDOW_SIZE * sampling_rate // 50
+    step = STEP_SIZE * sampling_rate // 50
+    for start in range(0, len(signal) - window + 1, step):
+        yield signal[start:start + window]
+
+
+def edge_cases(rng):
+    base = rsp_simulate(duration=30, sampling_rate=50, respiratory_rate=15, random_state=7)
+    gaps = base.copy()
+    gaps[rng.integers(0, len(gaps), 40)] = np.nan
+    yield 'integer', np.round(base * 1000).astype(np.int64), 50
+    yield 'nan gaps', gaps, 50
+    yield 'flat', np.full(1500, 3.0), 50
+    yield 'too short', base[:20], 50
+
+
+def outcome(function, window, sampling_rate):
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        try:
+            return function(window, sampling_rate=sampling_rate), None
+        except Exception as e:
+            return None, type(e)
+
+
+def compare(window, sampling_rate):
+    """Return None when both agree, else a description of the difference."""
+    expected, expected_error = outcome(rsp_process, window, sampling_rate)
+    actual, actual_error = outcome(rsp_process_window, window, sampling_rate)
+    if expected_error or actual_error:
+        return None if expected_error == actual_error else f"raised {actual_error}, expected {expected_error}"
+    (signals, info), (reference, reference_info) = actual, expected
+    if list(signals.columns) != list(reference.columns):
+        return f"columns {list(signals.columns)}"
+    for column in reference.columns:
+        if not np.array_equal(signals[column].to_numpy(), reference[column].to_numpy(), equal_nan=True):
+            return f"column {column} differs"
+    for key in ('RSP_Peaks', 'RSP_Troughs'):
+        if not np.array_equal(info[key], reference_info[key]):
+            return f"{key} differ"
+    return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--recording', help="also check windows of this text recording")
+    parser.add_argument('--column', default=0, help="column of the recording, by index or name")
+    parser.add_argument('--sampling-rate', type=int, default=100, help="sampling rate of the recording")
+    args = parser.parse_args(argv)
+
+    cases = []
+    for seed, (sampling_rate, breaths) in enumerate(SIMULATIONS):
+        signal = rsp_simulate(duration=DURATION, sampling_rate=sampling_rate, respiratory_rate=breaths,
+                              random_state=seed)
+        cases += [(f"simulated {breaths}/min at {sampling_rate} Hz #{i}", window, sampling_rate)
+                  for i, window in enumerate(windows(signal, sampling_rate))]
+    if args.recording:
+        from backend.util.text_cache import TextRecording
+        column = int(args.column) if str(args.column).isdigit() else args.column
+        values = TextRecording(args.recording).column(column)
+        cases += [(f"{args.recording} #{i}", window, args.sampling_rate)
+                  for i, window in enumerate(windows(values, args.sampling_rate))]
+    cases += list(edge_cases(np.random.default_rng(0)))
+
+    failed = 0
+    for name, window, sampling_rate in cases:
+        problem = compare(window, sampling_rate)
+        if problem:
+            failed += 1
+            print(f"{name}: {problem}")
+    print(f"{len(cases)} windows: " + ("identical" if not failed else f"{failed} differ"))
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
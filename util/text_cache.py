@@ -0,0 +1,90 @@
+import json
+import os
+
+import numpy as np
+from numpy.lib import format as npy_format
+
+TEXT_COLUMNS = ('pzf', 'acc_1', 'acc_2', 'acc_3', 'rot_1', 'rot_2', 'rot_3')
+CACHE_DIRECTORY = '.cache'  # 缓存放在记录文件所在目录下的子目录中
+CACHE_VERSION = 1
+
+
+class TextRecording:
+    """A comma-separated text recording backed by a columnar binary cache.
+
+    The first load parses the text once and stores it as ``<name>.npy``
+    (float64, column-major, so every column is one contiguous block) plus
+    ``<name>.json`` holding the column names and the size and mtime of the
+    source file. Later loads memory-map the ``.npy`` read-only, so opening
+    is near-instant and ``column()`` returns views without copying. The
+    cache is rebuilt whenever the source file's size or mtime changes; if
+    it cannot be written (e.g. a read-only directory) the parsed data is
+    used directly.
+    """
+
+    def __init__(self, path, cache_directory=None):
+        self.path = path
+        directory, name = os.path.split(os.path.abspath(path))
+        self.cache_directory = cache_directory or os.path.join(directory, CACHE_DIRECTORY)
+        self.data_path = os.path.join(self.cache_directory, name + '.npy')
+        self.meta_path = os.path.join(self.cache_directory, name + '.json')
+        self.cached = False  # 本次是否直接使用了已有缓存
+        self.data, self.columns = self._load()
+
+    def _source_stamp(self):
+        stat = os.stat(self.path)
+        return {'version': CACHE_VERSION, 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _load(self):
+        stamp = self._source_stamp()
+        try:
+            with open(self.meta_path) as f:
+                meta = json.load(f)
+            if all(meta.get(key) == value for key, value in stamp.items()):
+                self.cached = True
+                return np.load(self.data_path, mmap_mode='r'), tuple(meta['columns'])
+        except (OSError, ValueError):
+            pass  # 没有缓存或缓存损坏，重新解析
+
+        data = parse_text(self.path)
+        columns = TEXT_COLUMNS if data.shape[1] == len(TEXT_COLUMNS) else \
+            tuple(f'column_{i}' for i in range(data.shape[1]))
+        try:
+            self._write(data, dict(stamp, columns=list(columns), rows=len(data)))
+        except OSError as e:
+            print(f"Error writing cache for {self.path}: {e}")
+            return data, columns
+        return np.load(self.data_path, mmap_mode='r'), columns
+
+    def _write(self, data, meta):
+        # 先写临时文件再改名，中断时不会留下半个缓存；元数据最后写，作为缓存有效的标志
+        os.makedirs(self.cache_directory, exist_ok=True)
+        if os.path.exists(self.meta_path):
+            os.remove(self.meta_path)
+        temporary = self.data_path + '.tmp'
+        with open(temporary, 'wb') as f:
+            npy_format.write_array(f, np.asfortranarray(data))
+        os.replace(temporary, self.data_path)
+        with open(self.meta_path + '.tmp', 'w') as f:
+            json.dump(meta, f)
+        os.replace(self.meta_path + '.tmp', self.meta_path)
+
+    def column(self, column):
+        """Return one column, by index or name, as a read-only view."""
+        if isinstance(column, str):
+            column = self.columns.index(column)
+        return self.data[:, column]
+
+    def __len__(self):
+        return len(self.data)
+
+
+def parse_text(path):
+    # pandas 的 C 解析器比 np.loadtxt 快一个数量级；只有缓存失效时才需要导入 pandas
+    import pandas as pd
+    return pd.read_csv(path, header=None, dtype=np.float64).to_numpy()
+
+
+def load_text(path, cache_directory=None):
+    """Return the ``(rows, columns)`` array of a text recording, cached."""
+    return TextRecording(path, cache_directory).data
@@ -0,0 +1,77 @@
+import numpy as np
+
+
+class TraceBuffer:
+    """Fixed-size circular buffer of the most recent samples.
+
+    Every sample is stored twice (at ``pos`` and ``pos + size``), so the
+    ordered window is always the contiguous slice ``[pos, pos + size)`` and
+    ``view`` never copies. ``channels`` gives a 2-D buffer of shape
+    ``(size, channels)`` for multi-channel traces.
+    """
+
+    def __init__(self, size, channels=None, fill=0.0):
+        self.size = size
+        shape = (2 * size,) if channels is None else (2 * size, channels)
+        self.buffer = np.full(shape, fill, dtype=np.float64)
+        self.pos = 0
+        self.count = 0  # 已写入的有效样本数（不超过 size）
+
+    def extend(self, values):
+        values = np.asarray(values, dtype=np.float64)
+        n = len(values)
+        if n == 0:
+            return
+        if n >= self.size:
+            values = values[-self.size:]
+            self.buffer[:self.size] = values
+            self.buffer[self.size:] = values
+            self.pos = 0
+            self.count = self.size
+            return
+        first = min(n, self.size - self.pos)
+        for offset in (self.pos, self.pos + self.size):
+            self.buffer[offset:offset + first] = values[:first]
+        if first < n:
+            rest = n - first
+            self.buffer[:rest] = values[first:]
+            self.buffer[self.size:self.size + rest] = values[first:]
+        self.pos = (self.pos + n) % self.size
+        self.count = min(self.size, self.count + n)
+
+    def view(self):
+        # 最旧到最新排列的有效样本（只读视图，不复制）
+        window = self.buffer[self.pos + self.size - self.count:self.pos + self.size]
+        window.flags.writeable = False
+        return window
+
+    def clear(self):
+        self.pos = 0
+        self.count = 0
+
+
+def downsample_minmax(values, buckets):
+    """Reduce ``values`` to at most ``2 * buckets`` points, keeping the
+    minimum and maximum of every bucket in time order so peaks survive.
+    Returns ``(x, y)`` where ``x`` are the original sample indices."""
+    values = np.asarray(values)
+    n = len(values)
+    if buckets <= 0 or n <= 2 * buckets:
+        return np.arange(n), values
+
+    width = -(-n // buckets)  # 向上取整，保证所有样本都落在某个桶里
+    full = n // width
+    blocks = values[:full * width].reshape(full, width)
+    starts = np.arange(full) * width
+    low = starts + np.argmin(blocks, axis=1)
+    high = starts + np.argmax(blocks, axis=1)
+    if full * width < n:
+        tail = values[full * width:]
+        low = np.append(low, full * width + np.argmin(tail))
+        high = np.append(high, full * width + np.argmax(tail))
+
+    # 每个桶内按时间先后排列最小值和最大值
+    x = np.empty(2 * len(low), dtype=np.int64)
+    x[0::2] = np.minimum(low, high)
+    x[1::2] = np.maximum(low, high)
+    return x, values[x]
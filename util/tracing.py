@@ -0,0 +1,183 @@
+import math
+import threading
+import time
+from multiprocessing.sharedctypes import RawArray
+
+import numpy as np
+
+# 直方图按对数分桶：10 µs 到 100 s，每个数量级 10 个桶
+BIN_EDGES = np.logspace(-5, 2, 71)
+SLOTS = 256  # 同时在途的被追踪样本数
+
+
+class Tracer:
+    """Sampled latency tracing across pipeline stages.
+
+    Samples are identified by their position in the stream, which is the
+    same in every stage because each stage emits one output per input
+    sample. One sample in ``every`` is traced: each stage stamps the
+    ``time.monotonic()`` at which it received and finished the sample in a
+    shared table, and folds three latencies into shared log-scale
+    histograms: the time spent in the stage, the wait between its upstream
+    stage finishing and this one receiving it, and (in stages nothing reads
+    from) the total time since the first stage received it. ``upstream``
+    maps a stage to the stage it reads from when that is not the previous
+    one, e.g. ``{'plot': 'filter'}`` when plot and analysis both read the
+    filtered stream. ``time.monotonic`` is system-wide, so stamps from
+    different processes are comparable.
+
+    Positions are exact on shared-memory rings (reader cursors account for
+    overruns). On lossy queues (``DROP_OLDEST``/``DROP_NEWEST``) dropped
+    samples shift the positions seen by later stages.
+
+    Create it in the main process, pass ``tracer.stage(name)`` to each
+    stage and call ``summary``/``format_summary`` or ``start_reporter``
+    from any process.
+    """
+
+    def __init__(self, stages, every=64, upstream=None):
+        self.stages = tuple(stages)
+        self.every = every
+        # 每个阶段的上游阶段，默认是列表中的前一个；并行读取同一通道的阶段共用一个上游
+        upstream = dict(upstream or {})
+        self.upstream = [None] + [self.stages.index(upstream.get(name, self.stages[i]))
+                                  for i, name in enumerate(self.stages[1:])]
+        leaves = [i for i in range(len(self.stages)) if i not in self.upstream]
+
+        self.segments = []
+        self._segment = {}  # (类型, 阶段序号) -> 直方图行
+        for i, name in enumerate(self.stages):
+            if self.upstream[i] is not None:
+                self._segment['wait', i] = len(self.segments)
+                self.segments.append(f'{self.stages[self.upstream[i]]}->{name}')
+            self._segment['stage', i] = len(self.segments)
+            self.segments.append(name)
+        for i in leaves:
+            self._segment['total', i] = len(self.segments)
+            self.segments.append(f'total:{self.stages[i]}')
+
+        bins = len(BIN_EDGES) + 1
+        self._stamps = RawArray('d', SLOTS * len(self.stages) * 2)  # [slot, stage, 进入/离开]
+        self._tags = RawArray('q', SLOTS * len(self.stages))  # 各格子当前保存的样本位置
+        self._counts = RawArray('q', len(self.segments) * bins)
+        self._totals = RawArray('d', len(self.segments) * 2)  # [segment, 总和/最大值]
+        for i in range(len(self._tags)):
+            self._tags[i] = -1
+        self._reporter = None
+
+    def stage(self, name):
+        return StageTracer(self, self.stages.index(name))
+
+    def _record(self, segment, latency):
+        bins = len(BIN_EDGES) + 1
+        counts = np.frombuffer(self._counts, dtype=np.int64).reshape(len(self.segments), bins)
+        counts[segment, np.searchsorted(BIN_EDGES, latency)] += 1
+        self._totals[2 * segment] += latency
+        if latency > self._totals[2 * segment + 1]:
+            self._totals[2 * segment + 1] = latency
+
+    def histogram(self, segment):
+        """Return ``(edges, counts)``; ``counts[0]`` is below ``edges[0]`` and
+        ``counts[-1]`` above ``edges[-1]``."""
+        bins = len(BIN_EDGES) + 1
+        index = self.segments.index(segment)
+        counts = np.frombuffer(self._counts, dtype=np.int64).reshape(len(self.segments), bins)
+        return BIN_EDGES, counts[index].copy()
+
+    def summary(self):
+        """Return ``{segment: {'count', 'mean', 'p50', 'p90', 'p99', 'max'}}``
+        in seconds. Percentiles are the upper edge of their histogram bin
+        (at most the maximum)."""
+        result = {}
+        for index, segment in enumerate(self.segments):
+            _, counts = self.histogram(segment)
+            total = int(counts.sum())
+            stats = {'count': total}
+            if total:
+                cumulative = np.cumsum(counts)
+                edges = np.append(BIN_EDGES, math.inf)
+                stats['mean'] = self._totals[2 * index] / total
+                for name, q in (('p50', 0.5), ('p90', 0.9), ('p99', 0.99)):
+                    stats[name] = min(float(edges[np.searchsorted(cumulative, q * total)]),
+                                      self._totals[2 * index + 1])
+                stats['max'] = self._totals[2 * index + 1]
+            result[segment] = stats
+        return result
+
+    def format_summary(self):
+        parts = []
+        for segment, stats in self.summary().items():
+            if stats['count']:
+                parts.append(f"{segment} p50 {stats['p50'] * 1000:.1f} p99 {stats['p99'] * 1000:.1f} "
+                             f"max {stats['max'] * 1000:.1f}")
+        return 'Latency (ms): ' + ('; '.join(parts) if parts else 'no traced samples yet')
+
+    def reset(self):
+        for i in range(len(self._counts)):
+            self._counts[i] = 0
+        for i in range(len(self._totals)):
+            self._totals[i] = 0.0
+
+    def start_reporter(self, interval=10.0):
+        # 在当前进程中启动后台线程，每 interval 秒打印一行延迟统计
+        def report():
+            while not self._reporter_stop.wait(interval):
+                print(self.format_summary())
+
+        self._reporter_stop = threading.Event()
+        self._reporter = threading.Thread(target=report, name='latency-reporter', daemon=True)
+        self._reporter.start()
+
+    def stop_reporter(self):
+        if self._reporter is not None:
+            self._reporter_stop.set()
+            self._reporter = None
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state['_reporter'] = None
+        state.pop('_reporter_stop', None)
+        return state
+
+
+class StageTracer:
+    """One stage's handle on a ``Tracer``; safe to pass to a child process."""
+
+    def __init__(self, tracer, index):
+        self.tracer = tracer
+        self.index = index
+        self.position = 0  # 本阶段已处理的样本数
+
+    def mark(self, count, received, finished=None, start=None):
+        """Record that ``count`` consecutive samples, beginning at stream
+        position ``start`` (default: right after the previous call), were
+        received at ``received`` and handed on at ``finished`` (default:
+        now), both ``time.monotonic()`` values."""
+        if start is None:
+            start = self.position
+        self.position = start + count
+        every = self.tracer.every
+        first = -(-start // every) * every  # 该块中第一个需要追踪的位置
+        if first >= start + count:
+            return
+        if finished is None:
+            finished = time.monotonic()
+
+        tracer = self.tracer
+        stages = len(tracer.stages)
+        upstream = tracer.upstream[self.index]
+        wait = tracer._segment.get(('wait', self.index))
+        total = tracer._segment.get(('total', self.index))
+        for position in range(first, start + count, every):
+            slot = (position // every) % SLOTS
+            cell = slot * stages + self.index
+            tracer._stamps[2 * cell] = received
+            tracer._stamps[2 * cell + 1] = finished
+            tracer._tags[cell] = position
+            tracer._record(tracer._segment['stage', self.index], finished - received)
+            if upstream is not None and tracer._tags[slot * stages + upstream] == position:
+                # 上游阶段交出该样本到本阶段收到它之间的排队时间
+                tracer._record(wait, received - tracer._stamps[2 * (slot * stages + upstream) + 1])
+            if total is not None and tracer._tags[slot * stages] == position:
+                # 从源阶段收到该样本到本阶段处理完的总延迟
+                tracer._record(total, finished - tracer._stamps[2 * slot * stages])
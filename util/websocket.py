@@ -1,36 +1,237 @@
 import asyncio
 import json
+from collections import deque
+
 import websockets
 
+from backend.util.pipeline import get_batch
+from backend.util.sample_batch import to_batch
+from backend.util.shm_ring import SharedRingBuffer
+from backend.util.wire_format import JSON, MIN_RATE, MinMaxDecimator, encode, parse_subscription
+
+DROP = 'drop'  # 发送缓冲区满时断开慢客户端
+DECIMATE = 'decimate'  # 发送缓冲区满时丢弃最旧的一批，并对该客户端降采样
+SLOW_CLIENT_POLICIES = (DROP, DECIMATE)
+MAX_STRIDE = 64  # 降采样的最大步长
+CLOSE_TOO_SLOW = 1008  # 关闭码：客户端接收太慢（policy violation）
+DRAIN_TIMEOUT = 2  # 数据源结束后等待客户端发完缓冲区的秒数
+
+
+class Subscriber:
+    """One connected client with its own bounded send buffer.
+
+    The producer never waits for a client: ``offer`` selects the client's
+    channels, applies its min/max decimation, encodes the batch in the
+    client's format and appends it. When the buffer already holds
+    ``buffer_size`` messages, a ``DROP`` client is disconnected; a
+    ``DECIMATE`` client loses its oldest message and from then on only
+    receives every ``stride``-th sample. The stride doubles each time the
+    buffer overflows and halves each time the client catches up.
+    """
+
+    def __init__(self, websocket, buffer_size=64, policy=DECIMATE, channel_count=1):
+        self.websocket = websocket
+        self.buffer_size = buffer_size
+        self.policy = policy
+        self.buffer = deque()  # (样本数, 已编码的消息)
+        self.ready = asyncio.Event()
+        self.format = JSON
+        self.channels = list(range(channel_count))
+        self.rate = None  # 客户端请求的采样率，None 表示不降采样
+        self.decimator = None
+        self.stride = 1
+        self.phase = 0  # 下一批中第一个保留的样本位置
+        self.closed = False
+        self.too_slow = False  # 因跟不上而被断开
+        self.sent = 0  # 已发送的样本数
+        self.dropped = 0  # 丢弃的样本数（含降采样）
+
+    def subscribe(self, fmt, channels, rate, sampling_rate):
+        self.format = fmt
+        self.channels = channels
+        self.rate = rate
+        # 每个桶输出最小值和最大值两个点，所以桶宽是降采样倍数的两倍
+        # 桶宽不超过 MIN_RATE 对应的宽度，未满的桶在服务器端缓存的样本数有上限
+        width = int(round(2 * sampling_rate / max(rate, MIN_RATE))) if rate else 1
+        self.decimator = MinMaxDecimator(width) if width > 2 else None
+
+    def offer(self, timestamps, values, cache):
+        # cache: 本批次已编码的消息，按 (格式, 通道) 在未做降采样的客户端之间共享
+        if self.closed:
+            return
+        key = None
+        if self.channels != list(range(values.shape[1])):
+            values = values[:, self.channels]
+        if self.decimator is not None:
+            timestamps, values = self.decimator.process(timestamps, values)
+        if self.stride > 1:
+            kept = slice(self.phase, None, self.stride)
+            self.phase = (self.phase - len(values)) % self.stride
+            self.dropped += len(values) - len(values[kept])
+            timestamps, values = timestamps[kept], values[kept]
+        elif self.decimator is None:
+            key = (self.format, tuple(self.channels))
+        if not len(values):
+            return
+
+        if len(self.buffer) >= self.buffer_size:
+            if self.policy == DROP:
+                self.too_slow = True
+                self.close()
+                return
+            count, _ = self.buffer.popleft()
+            self.dropped += count
+            self.stride = min(self.stride * 2, MAX_STRIDE)
+        if key is not None and key in cache:
+            payload = cache[key]
+        else:
+            payload = encode(self.format, timestamps, values, self.channels)
+            if key is not None:
+                cache[key] = payload
+        self.buffer.append((len(values), payload))
+        self.ready.set()
+
+    def send_control(self, message):
+        # 控制消息（订阅确认、错误）与数据消息按顺序发送
+        self.buffer.append((0, json.dumps(message)))
+        self.ready.set()
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+    def stats(self):
+        return {
+            'format': self.format,
+            'channels': self.channels,
+            'rate': self.rate,
+            'buffered': len(self.buffer),
+            'stride': self.stride,
+            'sent': self.sent,
+            'dropped': self.dropped,
+        }
+
+
 class WebSocketServer:
-    def __init__(self, host='localhost', port=8765, serial_device=None):
+    """Broadcasts one data stream to any number of WebSocket clients.
+
+    A single producer task reads the source in batches (in a worker thread,
+    so the event loop is never blocked) and hands every batch to each
+    subscriber's buffer; one sender task per client drains its own buffer,
+    so a slow client cannot stall the producer or the other clients.
+    ``source`` is a ``SharedRingBuffer`` (read through its own cursor) or a
+    queue of ``SampleBatch`` blocks (or legacy ``{'timestamp', 'data'}``/
+    ``{'timestamp', 'filtered_data'}`` dicts), whose channels become the
+    clients' channels; for backward compatibility ``serial_device`` uses the device's
+    queue. Clients choose their format, channels and rate as described in
+    ``backend.util.wire_format``; by default they get JSON arrays of
+    ``{'timestamp', 'data'}`` objects at the full rate.
+    """
+
+    def __init__(self, host='localhost', port=8765, serial_device=None, source=None, buffer_size=64,
+                 slow_client=DECIMATE, sampling_rate=50):
+        if slow_client not in SLOW_CLIENT_POLICIES:
+            raise ValueError(f"Unknown slow client policy: {slow_client}")
         self.host = host
         self.port = port
         self.device = serial_device
+        if source is None and serial_device is not None:
+            source = serial_device.ring if serial_device.ring is not None else serial_device.data_queue
+        self.reader = source.reader() if isinstance(source, SharedRingBuffer) else None
+        self.queue = None if self.reader is not None else source
+        self.buffer_size = buffer_size
+        self.slow_client = slow_client
+        self.sampling_rate = sampling_rate
+        self.channel_count = 1
+        self.subscribers = set()
+
+    def read_batch(self):
+        # 在工作线程中阻塞读取一批数据，返回 (timestamps, values, stopped)，values 为 (N, 通道数)
+        if self.reader is not None:
+            timestamps, values = self.reader.read(timeout=0.5)
+            return timestamps, values.reshape(-1, 1), self.reader.exhausted
+        data_points, stopped = get_batch(self.queue)
+        batch = to_batch(data_points)
+        if len(batch):
+            self.channel_count = len(batch.channels)
+        return batch.timestamps, batch.values, stopped
+
+    async def produce(self):
+        loop = asyncio.get_running_loop()
+        stopped = False
+        while not stopped:
+            timestamps, values, stopped = await loop.run_in_executor(None, self.read_batch)
+            if not len(values) or not self.subscribers:
+                continue
+            cache = {}
+            for subscriber in self.subscribers:
+                subscriber.offer(timestamps, values, cache)
+        for subscriber in self.subscribers:
+            subscriber.close()
+
+    async def send_loop(self, subscriber):
+        while True:
+            await subscriber.ready.wait()
+            subscriber.ready.clear()
+            while subscriber.buffer and not subscriber.too_slow:
+                count, payload = subscriber.buffer.popleft()
+                await subscriber.websocket.send(payload)
+                subscriber.sent += count
+            if subscriber.too_slow:
+                await subscriber.websocket.close(CLOSE_TOO_SLOW, 'client too slow')
+                return
+            if subscriber.closed:
+                return  # 数据源已结束，缓冲区已发完
+            if subscriber.stride > 1:
+                subscriber.stride //= 2  # 客户端已追上，逐步恢复采样率
+
+    async def receive_loop(self, subscriber):
+        # 客户端随时可以发送订阅消息，修改格式、通道和采样率
+        async for message in subscriber.websocket:
+            try:
+                fmt, channels, rate = parse_subscription(message, self.channel_count, self.sampling_rate)
+            except ValueError as e:
+                subscriber.send_control({'type': 'error', 'message': str(e)})
+                continue
+            subscriber.subscribe(fmt, channels, rate, self.sampling_rate)
+            subscriber.send_control({'type': 'subscribed', 'format': fmt, 'channels': channels, 'rate': rate,
+                                     'sampling_rate': self.sampling_rate})
 
-    async def handler(self, websocket, path):
+    async def handler(self, websocket, path=None):
         print("WebSocket connection opened")
+        subscriber = Subscriber(websocket, self.buffer_size, self.slow_client, self.channel_count)
+        self.subscribers.add(subscriber)
+        receiver = asyncio.ensure_future(self.receive_loop(subscriber))
         try:
-            while True:
-                data = self.device.get_data_from_queue()
-                if data:
-                    await websocket.send(json.dumps(data))
-                await asyncio.sleep(0.01)
+            await self.send_loop(subscriber)
         except websockets.exceptions.ConnectionClosed:
             print("WebSocket connection closed")
+        finally:
+            receiver.cancel()
+            self.subscribers.discard(subscriber)
+
+    def stats(self):
+        return [subscriber.stats() for subscriber in self.subscribers]
+
+    async def serve(self):
+        async with websockets.serve(self.handler, self.host, self.port):
+            print(f"WebSocket server started at ws://{self.host}:{self.port}")
+            await self.produce()
+            # 数据源结束后给客户端一点时间发完各自的缓冲区
+            for _ in range(DRAIN_TIMEOUT * 20):
+                if not self.subscribers:
+                    break
+                await asyncio.sleep(0.05)
 
     def start_server(self):
-        start_server = websockets.serve(self.handler, self.host, self.port)
-        loop = asyncio.get_event_loop()
-        loop.run_until_complete(start_server)
-        print(f"WebSocket server started at ws://{self.host}:{self.port}")
         try:
-            loop.run_forever()
+            asyncio.run(self.serve())
         except KeyboardInterrupt:
             print("Server stopped by user")
-        finally:
-            tasks = asyncio.all_tasks(loop)
-            for task in tasks:
-                task.cancel()
-            loop.run_until_complete(asyncio.gather(*tasks, return_exceptions=True))
-            loop.close()
+
+
+def start_websocket_server(source, host='localhost', port=8765, buffer_size=64, slow_client=DECIMATE,
+                           sampling_rate=50):
+    # 流水线阶段：把一个共享内存环或队列广播给所有 WebSocket 客户端
+    WebSocketServer(host, port, source=source, buffer_size=buffer_size, slow_client=slow_client,
+                    sampling_rate=sampling_rate).start_server()
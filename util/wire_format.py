@@ -0,0 +1,152 @@
+"""Wire formats for streaming sample batches to WebSocket clients.
+
+A client picks its format, channels and rate by sending a JSON text
+message at any time, e.g.::
+
+    {"format": "binary", "channels": [0], "rate": 10}
+
+and the server answers with the accepted subscription as a JSON text
+message (``{"type": "subscribed", ...}``), or with ``{"type": "error"}``
+when it is invalid. ``rate`` is in samples/s, at least ``MIN_RATE``.
+Clients that never send one get JSON, as before.
+
+JSON messages are an array of ``{"timestamp": t, "data": v}`` objects;
+``data`` is a list when more than one channel is subscribed.
+
+Binary messages are little-endian:
+
+====================  ===========================================
+``HEADER``            magic ``b'SYNB'``, version (u8), reserved (u8),
+                      channel count C (u16), sample count N (u32),
+                      first timestamp t0 in seconds (f64)
+channel ids           C x u16
+timestamp deltas      N x i32, microseconds since the previous sample
+                      (the first is relative to t0, so it is 0)
+values                N x C x f32, sample-major
+====================  ===========================================
+"""
+import json
+import math
+import struct
+
+import numpy as np
+
+JSON = 'json'
+BINARY = 'binary'
+FORMATS = (JSON, BINARY)
+MAGIC = b'SYNB'
+VERSION = 1
+HEADER = struct.Struct('<4sBBHId')
+MIN_RATE = 0.1  # 客户端可请求的最低采样率；更低时降采样桶过大，数据会在服务器端长时间积压
+
+
+def encode_json(timestamps, values):
+    # values: (N, C) 数组；单通道时 data 为数值，与原来的逐样本消息一致
+    if values.shape[1] == 1:
+        data = values[:, 0].tolist()
+    else:
+        data = values.tolist()
+    return json.dumps([{'timestamp': timestamp, 'data': value}
+                       for timestamp, value in zip(timestamps.tolist(), data)])
+
+
+def encode_binary(timestamps, values, channels):
+    count, width = values.shape
+    t0 = float(timestamps[0]) if count else 0.0
+    # 先对相对 t0 的偏移取整再差分，累加后不会产生漂移
+    offsets = np.rint((np.asarray(timestamps, dtype=np.float64) - t0) * 1e6).astype(np.int64)
+    deltas = np.diff(offsets, prepend=0).astype('<i4')
+    return b''.join((
+        HEADER.pack(MAGIC, VERSION, 0, width, count, t0),
+        np.asarray(channels, dtype='<u2').tobytes(),
+        deltas.tobytes(),
+        np.ascontiguousarray(values, dtype='<f4').tobytes(),
+    ))
+
+
+def decode_binary(payload):
+    """Inverse of ``encode_binary``: return ``(channels, timestamps, values)``."""
+    magic, version, _, width, count, t0 = HEADER.unpack_from(payload)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError("Not a binary sample batch")
+    offset = HEADER.size
+    channels = np.frombuffer(payload, dtype='<u2', count=width, offset=offset)
+    offset += 2 * width
+    deltas = np.frombuffer(payload, dtype='<i4', count=count, offset=offset)
+    offset += 4 * count
+    values = np.frombuffer(payload, dtype='<f4', count=count * width, offset=offset).reshape(count, width)
+    return channels, t0 + np.cumsum(deltas, dtype=np.int64) * 1e-6, values
+
+
+def encode(fmt, timestamps, values, channels):
+    if fmt == BINARY:
+        return encode_binary(timestamps, values, channels)
+    return encode_json(timestamps, values)
+
+
+class MinMaxDecimator:
+    """Reduce a stream by ``width`` while keeping its extremes.
+
+    Every ``width`` input samples become two output samples: per channel
+    the minimum and the maximum of the bucket, in the order they occurred,
+    stamped with the bucket's first and last timestamp. Samples that do
+    not fill a bucket are kept until the next call.
+    """
+
+    def __init__(self, width):
+        self.width = width
+        self._timestamps = None
+        self._values = None
+
+    def process(self, timestamps, values):
+        if self._timestamps is not None:
+            timestamps = np.concatenate((self._timestamps, timestamps))
+            values = np.concatenate((self._values, values))
+        full = len(values) // self.width * self.width
+        self._timestamps, self._values = timestamps[full:], values[full:]
+        if not full:
+            return timestamps[:0], values[:0]
+
+        buckets = values[:full].reshape(-1, self.width, values.shape[1])
+        low = np.argmin(buckets, axis=1)
+        high = np.argmax(buckets, axis=1)
+        first = np.take_along_axis(buckets, np.minimum(low, high)[:, None, :], axis=1)[:, 0]
+        second = np.take_along_axis(buckets, np.maximum(low, high)[:, None, :], axis=1)[:, 0]
+
+        out_values = np.empty((2 * len(buckets), values.shape[1]), dtype=values.dtype)
+        out_values[0::2] = first
+        out_values[1::2] = second
+        bucket_times = timestamps[:full].reshape(-1, self.width)
+        out_timestamps = np.empty(2 * len(buckets), dtype=np.float64)
+        out_timestamps[0::2] = bucket_times[:, 0]
+        out_timestamps[1::2] = bucket_times[:, -1]
+        return out_timestamps, out_values
+
+
+def parse_subscription(message, channel_count, sampling_rate):
+    """Validate a client's subscription message; return ``(format,
+    channels, rate)`` or raise ``ValueError``."""
+    request = json.loads(message)
+    if not isinstance(request, dict):
+        raise ValueError("Subscription must be a JSON object")
+    fmt = request.get('format', JSON)
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown format: {fmt}")
+    channels = request.get('channels')
+    if channels is None:
+        channels = list(range(channel_count))
+    elif (not isinstance(channels, list) or not channels
+          or any(not _is_int(c) or not 0 <= c < channel_count for c in channels)):
+        raise ValueError(f"Channels must be a non-empty list of indices below {channel_count}")
+    rate = request.get('rate')
+    if rate is not None:
+        # bool 是 int 的子类，JSON 的 true/false 不能当作数值
+        if (isinstance(rate, bool) or not isinstance(rate, (int, float)) or not math.isfinite(rate)
+                or rate < MIN_RATE):
+            raise ValueError(f"Rate must be a number of at least {MIN_RATE} samples/s")
+        rate = min(float(rate), float(sampling_rate))
+    return fmt, list(channels), rate
+
+
+def _is_int(value):
+    return isinstance(value, int) and not isinstance(value, bool)